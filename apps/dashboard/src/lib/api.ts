@@ -23,7 +23,19 @@ export interface Stats {
   todayRequests: number;
   totalCost: number;
   avgLatency: number;
+  avgTimeToFirstToken: number;
   dailyLimit: number;
+  streamingModels: StreamingModelStats[];
+}
+
+export interface StreamingModelStats {
+  model: string;
+  requests: number;
+  avgTtft: number;
+  p95Ttft: number;
+  avgStreamDuration: number;
+  avgChunkGapP50: number;
+  avgChunkGapP95: number;
 }
 
 export interface LogEntry {
@@ -4,9 +4,13 @@ CF-X Router Authentication Module
 Provides API key authentication middleware and utilities.
 """
 
+import asyncio
+import json
 import logging
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Optional
 from uuid import UUID
 
@@ -22,9 +26,283 @@ class AuthResult:
     user_id: Optional[str] = None
     api_key_id: Optional[int] = None
     key_prefix: Optional[str] = None
+    plan: Optional[str] = None
     error: Optional[str] = None
 
 
+@dataclass
+class AuthCacheConfig:
+    """Configuration for the API key verification cache."""
+    enabled: bool = True
+    max_size: int = 10000        # Max cached key hashes (LRU eviction beyond this)
+    ttl: float = 60.0            # Seconds a successful lookup is trusted
+    negative_ttl: float = 10.0   # Seconds an unknown/revoked key is remembered
+    notified_ttl: float = 3600.0  # Positive TTL while revocation notifications are live
+
+
+class AuthCache:
+    """
+    Bounded TTL/LRU cache of verification results keyed by API key hash.
+    
+    Caches both positive (active key) and negative (unknown or revoked key)
+    results so repeat callers authenticate without a database round trip.
+    Transient errors (e.g. database unavailable) are never cached.
+    
+    While `notifications_active` is set (see KeyStatusListener), positive
+    results are trusted for `notified_ttl` instead of `ttl`.
+    
+    Every invalidation bumps `generation`, so a lookup that was in flight
+    when a revocation arrived can tell its result may be stale.
+    """
+    
+    def __init__(self, config: AuthCacheConfig):
+        """
+        Initialize auth cache.
+        
+        Args:
+            config: Cache configuration
+        """
+        self.config = config
+        self._entries: OrderedDict[str, tuple[float, AuthResult]] = OrderedDict()
+        self.notifications_active = False
+        self.generation = 0
+        
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key_hash: str) -> Optional[AuthResult]:
+        """
+        Get a cached result.
+        
+        Args:
+            key_hash: Hashed API key
+            
+        Returns:
+            Cached AuthResult or None if missing/expired
+        """
+        entry = self._entries.get(key_hash)
+        if entry is None:
+            self._misses += 1
+            return None
+        
+        expires_at, result = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key_hash]
+            self._expirations += 1
+            self._misses += 1
+            return None
+        
+        self._entries.move_to_end(key_hash)
+        self._hits += 1
+        return result
+    
+    def put(self, key_hash: str, result: AuthResult) -> None:
+        """
+        Store a verification result.
+        
+        Args:
+            key_hash: Hashed API key
+            result: Result to cache (TTL depends on authenticated flag)
+        """
+        if not result.authenticated:
+            ttl = self.config.negative_ttl
+        elif self.notifications_active:
+            ttl = self.config.notified_ttl
+        else:
+            ttl = self.config.ttl
+        if ttl <= 0:
+            return
+        
+        self._entries[key_hash] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key_hash)
+        
+        while len(self._entries) > self.config.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+    
+    def invalidate(self, key_hash: str) -> bool:
+        """
+        Remove a key hash from the cache.
+        
+        Args:
+            key_hash: Hashed API key
+            
+        Returns:
+            True if an entry was removed
+        """
+        # Bumped even with nothing cached: a lookup may be in flight
+        self.generation += 1
+        if self._entries.pop(key_hash, None) is None:
+            return False
+        self._invalidations += 1
+        return True
+    
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        self.generation += 1
+        self._entries.clear()
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.config.max_size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "invalidations": self._invalidations,
+            "notifications_active": self.notifications_active,
+        }
+
+
+@dataclass
+class LastUsedWriterConfig:
+    """Configuration for the batched last_used_at writer."""
+    flush_interval: float = 5.0   # Seconds between flushes
+
+
+class LastUsedWriter:
+    """
+    Coalescing background writer for api_keys.last_used_at.
+    
+    Successful authentications only record the latest timestamp per key in
+    memory; a background task flushes all pending keys in one multi-row
+    UPDATE every `flush_interval` seconds, and once more on stop().
+    """
+    
+    def __init__(self, config: LastUsedWriterConfig, db_pool: Optional[Any] = None):
+        """
+        Initialize writer.
+        
+        Args:
+            config: Writer configuration
+            db_pool: Database connection pool (optional, records are dropped if None)
+        """
+        self.config = config
+        self.db_pool = db_pool
+        
+        self._pending: dict[Any, datetime] = {}
+        self._worker_task: Optional[asyncio.Task] = None
+        self._running = False
+        
+        # Metrics
+        self._flushes = 0
+        self._rows_written = 0
+        self._failures = 0
+    
+    def record(self, api_key_id: Any, used_at: Optional[datetime] = None) -> None:
+        """
+        Record that a key was used. O(1), never touches the database.
+        
+        Args:
+            api_key_id: API key ID
+            used_at: Usage timestamp (defaults to now)
+        """
+        if self.db_pool is None:
+            return
+        
+        used_at = used_at or datetime.now(timezone.utc)
+        previous = self._pending.get(api_key_id)
+        if previous is None or used_at > previous:
+            self._pending[api_key_id] = used_at
+    
+    async def start(self) -> None:
+        """Start the background flush task."""
+        if self._running:
+            return
+        
+        self._running = True
+        self._worker_task = asyncio.create_task(self._worker())
+        logger.info("last_used_at writer started")
+    
+    async def stop(self) -> None:
+        """Stop the background task and flush pending timestamps."""
+        if not self._running:
+            return
+        
+        self._running = False
+        
+        if self._worker_task:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+        
+        await self.flush()
+        logger.info("last_used_at writer stopped")
+    
+    async def _worker(self) -> None:
+        """Background worker that periodically flushes pending timestamps."""
+        while self._running:
+            try:
+                await asyncio.sleep(self.config.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"last_used_at writer error: {e}")
+    
+    async def flush(self) -> int:
+        """
+        Write all pending timestamps in a single UPDATE.
+        
+        Returns:
+            Number of keys flushed
+        """
+        if not self._pending or self.db_pool is None:
+            return 0
+        
+        batch, self._pending = self._pending, {}
+        ids = list(batch.keys())
+        timestamps = [batch[key_id] for key_id in ids]
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE api_keys AS k
+                    SET last_used_at = v.used_at
+                    FROM unnest($1::uuid[], $2::timestamptz[]) AS v(id, used_at)
+                    WHERE k.id = v.id
+                      AND (k.last_used_at IS NULL OR k.last_used_at < v.used_at)
+                    """,
+                    ids,
+                    timestamps,
+                )
+        except Exception as e:
+            self._failures += 1
+            logger.error(f"Failed to flush last_used_at for {len(batch)} keys: {e}")
+            # Merge back so the next flush retries, keeping newer timestamps
+            for key_id, used_at in batch.items():
+                self.record(key_id, used_at)
+            return 0
+        
+        self._flushes += 1
+        self._rows_written += len(batch)
+        return len(batch)
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get writer statistics."""
+        return {
+            "pending": len(self._pending),
+            "flushes": self._flushes,
+            "rows_written": self._rows_written,
+            "failures": self._failures,
+            "running": self._running,
+        }
+
+
 class AuthModule:
     """
     API Key Authentication Module.
@@ -32,16 +310,39 @@ class AuthModule:
     Handles extraction and verification of API keys from requests.
     """
     
-    def __init__(self, db_pool: Optional[Any] = None, hash_salt: str = "default-salt"):
+    def __init__(
+        self,
+        db_pool: Optional[Any] = None,
+        hash_salt: str = "default-salt",
+        cache_config: Optional[AuthCacheConfig] = None,
+        last_used_config: Optional[LastUsedWriterConfig] = None,
+    ):
         """
         Initialize authentication module.
         
         Args:
             db_pool: Database connection pool for key lookup (optional)
             hash_salt: Salt for API key hashing
+            cache_config: Verification cache configuration (optional)
+            last_used_config: last_used_at writer configuration (optional)
         """
         self.db_pool = db_pool
         self.hash_salt = hash_salt
+        
+        cache_config = cache_config or AuthCacheConfig()
+        self.cache: Optional[AuthCache] = AuthCache(cache_config) if cache_config.enabled else None
+        self.last_used_writer = LastUsedWriter(
+            last_used_config or LastUsedWriterConfig(),
+            db_pool,
+        )
+    
+    async def start(self) -> None:
+        """Start background tasks."""
+        await self.last_used_writer.start()
+    
+    async def stop(self) -> None:
+        """Stop background tasks and flush pending writes."""
+        await self.last_used_writer.stop()
     
     def extract_bearer_token(self, authorization: Optional[str]) -> Optional[str]:
         """
@@ -92,14 +393,24 @@ class AuthModule:
         # Hash the key
         key_hash = hash_api_key(api_key, self.hash_salt)
         
-        # Look up in database
+        # Serve repeat callers from cache
+        if self.cache is not None:
+            cached = self.cache.get(key_hash)
+            if cached is not None:
+                if cached.authenticated:
+                    self.last_used_writer.record(cached.api_key_id)
+                return cached
+        
+        # Look up in database, noting invalidations made meanwhile
+        generation = self.cache.generation if self.cache is not None else 0
         try:
             async with self.db_pool.acquire() as conn:
                 row = await conn.fetchrow(
                     """
-                    SELECT id, user_id, key_prefix, status
-                    FROM api_keys
-                    WHERE key_hash = $1
+                    SELECT k.id, k.user_id, k.key_prefix, k.status, u.plan
+                    FROM api_keys k
+                    LEFT JOIN users u ON u.id = k.user_id
+                    WHERE k.key_hash = $1
                     """,
                     key_hash
                 )
@@ -109,31 +420,76 @@ class AuthModule:
         
         if row is None:
             logger.warning("API key not found")
-            return AuthResult(authenticated=False, error="Invalid API key")
+            result = AuthResult(authenticated=False, error="Invalid API key")
+            self._cache_result(key_hash, result, generation)
+            return result
         
         # Check if key is active
         if row["status"] != "active":
             logger.warning(f"API key is {row['status']}")
-            return AuthResult(authenticated=False, error="API key is revoked")
+            result = AuthResult(authenticated=False, error="API key is revoked")
+            self._cache_result(key_hash, result, generation)
+            return result
         
-        # Update last_used_at (fire and forget)
-        try:
-            async with self.db_pool.acquire() as conn:
-                await conn.execute(
-                    "UPDATE api_keys SET last_used_at = $1 WHERE id = $2",
-                    datetime.utcnow(),
-                    row["id"]
-                )
-        except Exception as e:
-            # Don't fail auth if update fails
-            logger.error(f"Failed to update last_used_at: {e}")
+        # Update last_used_at in the background (coalesced per key)
+        self.last_used_writer.record(row["id"])
         
-        return AuthResult(
+        result = AuthResult(
             authenticated=True,
             user_id=str(row["user_id"]),
             api_key_id=row["id"],
             key_prefix=row["key_prefix"],
+            plan=row.get("plan"),
         )
+        self._cache_result(key_hash, result, generation)
+        return result
+    
+    def _cache_result(self, key_hash: str, result: AuthResult, generation: int) -> None:
+        """
+        Store a definitive verification result in the cache.
+        
+        Skipped if the cache was invalidated since the lookup started, as a
+        revocation notified mid-query may not be reflected in the result.
+        """
+        if self.cache is not None and self.cache.generation == generation:
+            self.cache.put(key_hash, result)
+    
+    def invalidate(self, key_hash: str) -> bool:
+        """
+        Drop a cached verification result (e.g. after revocation).
+        
+        Args:
+            key_hash: Hashed API key
+            
+        Returns:
+            True if an entry was removed
+        """
+        if self.cache is None:
+            return False
+        return self.cache.invalidate(key_hash)
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get authentication statistics."""
+        return {
+            "cache": self.cache.get_stats() if self.cache is not None else None,
+            "last_used_writer": self.last_used_writer.get_stats(),
+        }
+    
+    def set_notifications_active(self, active: bool) -> None:
+        """
+        Toggle long-lived caching backed by revocation notifications.
+        
+        Losing the notification channel clears the cache, since revocations
+        may have been missed while it was down.
+        
+        Args:
+            active: Whether key status notifications are being received
+        """
+        if self.cache is None:
+            return
+        if not active:
+            self.cache.clear()
+        self.cache.notifications_active = active
     
     async def authenticate(self, authorization: Optional[str]) -> AuthResult:
         """
@@ -156,3 +512,132 @@ class AuthModule:
         
         # Verify key
         return await self.verify_api_key(api_key)
+
+
+KEY_STATUS_CHANNEL = "cfx_api_key_status"
+
+
+class KeyStatusListener:
+    """
+    Keeps every worker's auth cache coherent via Postgres LISTEN/NOTIFY.
+    
+    A trigger on api_keys (see migrations/002_api_key_status_notify.sql)
+    publishes {"key_hash": ..., "status": ...} on KEY_STATUS_CHANNEL whenever
+    a key's status changes or it is deleted. Each worker evicts the hash on
+    receipt, so long cache TTLs don't delay revocation.
+    """
+    
+    def __init__(
+        self,
+        auth: AuthModule,
+        database: Any,
+        channel: str = KEY_STATUS_CHANNEL,
+        reconnect_interval: float = 1.0,
+    ):
+        """
+        Initialize listener.
+        
+        Args:
+            auth: AuthModule whose cache is kept coherent
+            database: Database instance providing listen()/unlisten()
+            channel: NOTIFY channel name
+            reconnect_interval: Seconds between reconnection attempts
+        """
+        self.auth = auth
+        self.database = database
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+        
+        self._running = False
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._notifications = 0
+    
+    async def start(self) -> None:
+        """Subscribe to the channel (retrying in the background on failure)."""
+        if self._running:
+            return
+        
+        self._running = True
+        if not await self._subscribe():
+            self._schedule_reconnect()
+    
+    async def stop(self) -> None:
+        """Unsubscribe and fall back to short cache TTLs."""
+        if not self._running:
+            return
+        
+        self._running = False
+        
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+            self._reconnect_task = None
+        
+        self.auth.set_notifications_active(False)
+        try:
+            await self.database.unlisten(self.channel)
+        except Exception as e:
+            logger.warning(f"Failed to unlisten key status channel: {e}")
+    
+    async def _subscribe(self) -> bool:
+        """Attempt to subscribe to the channel."""
+        try:
+            await self.database.listen(
+                self.channel,
+                self._on_notification,
+                on_disconnect=self._on_disconnect,
+            )
+        except Exception as e:
+            logger.error(f"Failed to listen for key status changes: {e}")
+            return False
+        
+        self.auth.set_notifications_active(True)
+        return True
+    
+    def _on_notification(self, payload: str) -> None:
+        """Evict the key referenced by a notification payload."""
+        self._notifications += 1
+        try:
+            key_hash = json.loads(payload).get("key_hash")
+        except (ValueError, AttributeError):
+            key_hash = None
+        
+        if not key_hash:
+            # Can't tell which key changed, so trust nothing
+            logger.warning(f"Malformed key status notification: {payload!r}")
+            if self.auth.cache is not None:
+                self.auth.cache.clear()
+            return
+        
+        self.auth.invalidate(key_hash)
+    
+    def _on_disconnect(self) -> None:
+        """Drop to short TTLs and reconnect after losing the channel."""
+        self.auth.set_notifications_active(False)
+        if self._running:
+            self._schedule_reconnect()
+    
+    def _schedule_reconnect(self) -> None:
+        """Start the reconnect loop if not already running."""
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+    
+    async def _reconnect_loop(self) -> None:
+        """Retry subscribing until it succeeds or the listener stops."""
+        while self._running:
+            await asyncio.sleep(self.reconnect_interval)
+            if await self._subscribe():
+                logger.info("Key status listener reconnected")
+                return
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get listener statistics."""
+        return {
+            "channel": self.channel,
+            "running": self._running,
+            "notifications": self._notifications,
+            "active": self.auth.cache.notifications_active if self.auth.cache else False,
+        }
@@ -6,6 +6,11 @@ Limits concurrent streaming requests per user to prevent resource exhaustion.
 
 import asyncio
 import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
 from dataclasses import dataclass
 from typing import Optional
 
@@ -17,6 +22,15 @@ class ConcurrencyConfig:
     """Configuration for concurrency limiter."""
     max_concurrent_streams: int = 3  # Max concurrent streaming requests per user
     cleanup_interval: float = 60.0   # Seconds between cleanup runs
+    
+    # Admission queue (0 disables waiting, streams are rejected immediately)
+    queue_max_wait: float = 0.0      # Seconds a stream may wait for a freed slot
+    queue_max_depth: int = 0         # Max waiting streams per user
+    
+    # Distributed mode (stream_leases table shared by all workers)
+    distributed: bool = False
+    lease_ttl: float = 30.0          # Seconds a lease survives without a heartbeat
+    heartbeat_interval: float = 10.0 # Seconds between lease renewals
 
 
 class ConcurrencyLimitExceeded(Exception):
@@ -38,7 +52,15 @@ class ConcurrencyLimiter:
     Only streaming requests count toward the limit.
     Non-streaming requests are exempt.
     
-    Uses in-memory tracking with asyncio locks for thread safety.
+    Lock-free: every check-and-update runs without an await in between,
+    so on the single-threaded event loop it is atomic. Each user's slot
+    count is a plain int created on first acquire and reclaimed at zero,
+    and a running total keeps aggregate stats O(1).
+    
+    With an admission queue configured, a stream that finds the user at
+    the limit waits (FIFO, bounded depth and time) instead of failing at
+    once. release hands the slot directly to the oldest waiter, so a
+    newcomer can never overtake the queue.
     """
     
     def __init__(self, config: ConcurrencyConfig):
@@ -50,7 +72,94 @@ class ConcurrencyLimiter:
         """
         self.config = config
         self._active_streams: dict[str, int] = {}
-        self._lock = asyncio.Lock()
+        
+        # Aggregated counters
+        self._total_active = 0
+        self._peak_active = 0
+        self._acquired = 0
+        self._rejected = 0
+        
+        # Admission queue: per-user FIFO of futures awaiting a handoff
+        self._waiters: dict[str, deque[asyncio.Future]] = {}
+        self._queued_now = 0
+        self._queued_total = 0
+        self._queue_timeouts = 0
+        self._queue_full = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+    
+    @property
+    def queue_enabled(self) -> bool:
+        """Whether streams may wait for a freed slot."""
+        return self.config.queue_max_wait > 0 and self.config.queue_max_depth > 0
+    
+    def _take_slot(self, user_id: str) -> bool:
+        """Take a free slot if the user is under the limit."""
+        current = self._active_streams.get(user_id, 0)
+        if current >= self.config.max_concurrent_streams:
+            return False
+        
+        self._active_streams[user_id] = current + 1
+        self._total_active += 1
+        self._acquired += 1
+        if self._total_active > self._peak_active:
+            self._peak_active = self._total_active
+        return True
+    
+    def _reject(self, user_id: str) -> None:
+        """Record a rejected acquire."""
+        self._rejected += 1
+        logger.warning(
+            f"Concurrency limit exceeded for user '{user_id}': "
+            f"{self._active_streams.get(user_id, 0)}/{self.config.max_concurrent_streams}"
+        )
+    
+    def try_acquire(self, user_id: str) -> bool:
+        """
+        Acquire a streaming slot without awaiting. O(1).
+        
+        Args:
+            user_id: User identifier
+            
+        Returns:
+            True if slot acquired, False if limit exceeded
+        """
+        if self._take_slot(user_id):
+            return True
+        
+        self._reject(user_id)
+        return False
+    
+    def release_nowait(self, user_id: str) -> None:
+        """
+        Release a streaming slot without awaiting. O(1).
+        
+        Args:
+            user_id: User identifier
+        """
+        current = self._active_streams.get(user_id, 0)
+        
+        if current <= 0:
+            logger.warning(
+                f"Attempted to release non-existent slot for user '{user_id}'"
+            )
+            return
+        
+        # Hand the slot to the oldest waiter; the count stays unchanged
+        waiters = self._waiters.get(user_id)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                self._acquired += 1
+                return
+        
+        # Reclaim the entry when the user has no active streams
+        if current == 1:
+            del self._active_streams[user_id]
+        else:
+            self._active_streams[user_id] = current - 1
+        self._total_active -= 1
     
     async def acquire(self, user_id: str, is_streaming: bool = True) -> bool:
         """
@@ -70,22 +179,58 @@ class ConcurrencyLimiter:
         if not is_streaming:
             return True
         
-        async with self._lock:
-            current = self._active_streams.get(user_id, 0)
-            
-            if current >= self.config.max_concurrent_streams:
-                logger.warning(
-                    f"Concurrency limit exceeded for user '{user_id}': "
-                    f"{current}/{self.config.max_concurrent_streams}"
-                )
-                return False
-            
-            self._active_streams[user_id] = current + 1
-            logger.debug(
-                f"Acquired stream slot for user '{user_id}': "
-                f"{current + 1}/{self.config.max_concurrent_streams}"
-            )
+        return await self._acquire_local(user_id)
+    
+    async def _acquire_local(self, user_id: str) -> bool:
+        """Take a slot, waiting in the user's queue if one is configured."""
+        if self._take_slot(user_id):
             return True
+        
+        if not self.queue_enabled:
+            self._reject(user_id)
+            return False
+        
+        waiters = self._waiters.setdefault(user_id, deque())
+        if len(waiters) >= self.config.queue_max_depth:
+            self._queue_full += 1
+            self._reject(user_id)
+            return False
+        
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        self._queued_now += 1
+        self._queued_total += 1
+        started = time.monotonic()
+        
+        try:
+            return await asyncio.wait_for(waiter, self.config.queue_max_wait)
+        except asyncio.TimeoutError:
+            if self._handed_off(waiter):
+                return True
+            self._queue_timeouts += 1
+            self._reject(user_id)
+            return False
+        except asyncio.CancelledError:
+            # Pass on a slot handed over just before cancellation
+            if self._handed_off(waiter):
+                self.release_nowait(user_id)
+            raise
+        finally:
+            self._queued_now -= 1
+            waited = time.monotonic() - started
+            self._queue_wait_total += waited
+            if waited > self._queue_wait_max:
+                self._queue_wait_max = waited
+            
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters and self._waiters.get(user_id) is waiters:
+                del self._waiters[user_id]
+    
+    @staticmethod
+    def _handed_off(waiter: asyncio.Future) -> bool:
+        """Whether a slot was handed to this waiter."""
+        return waiter.done() and not waiter.cancelled()
     
     async def release(self, user_id: str, is_streaming: bool = True) -> None:
         """
@@ -102,23 +247,7 @@ class ConcurrencyLimiter:
         if not is_streaming:
             return
         
-        async with self._lock:
-            current = self._active_streams.get(user_id, 0)
-            
-            if current > 0:
-                self._active_streams[user_id] = current - 1
-                logger.debug(
-                    f"Released stream slot for user '{user_id}': "
-                    f"{current - 1}/{self.config.max_concurrent_streams}"
-                )
-                
-                # Clean up if no active streams
-                if self._active_streams[user_id] == 0:
-                    del self._active_streams[user_id]
-            else:
-                logger.warning(
-                    f"Attempted to release non-existent slot for user '{user_id}'"
-                )
+        self.release_nowait(user_id)
     
     async def get_active_count(self, user_id: str) -> int:
         """
@@ -130,8 +259,7 @@ class ConcurrencyLimiter:
         Returns:
             Number of active streaming requests
         """
-        async with self._lock:
-            return self._active_streams.get(user_id, 0)
+        return self._active_streams.get(user_id, 0)
     
     async def get_remaining(self, user_id: str) -> int:
         """
@@ -143,31 +271,294 @@ class ConcurrencyLimiter:
         Returns:
             Number of available slots
         """
-        async with self._lock:
-            current = self._active_streams.get(user_id, 0)
-            return max(0, self.config.max_concurrent_streams - current)
+        current = self._active_streams.get(user_id, 0)
+        return max(0, self.config.max_concurrent_streams - current)
+    
+    async def get_stats(self, include_users: bool = True) -> dict:
+        """
+        Get concurrency limiter statistics.
+        
+        Args:
+            include_users: Include the per-user breakdown (O(users) copy)
+            
+        Returns:
+            Dictionary with stats
+        """
+        stats = {
+            "total_active_streams": self._total_active,
+            "users_with_active_streams": len(self._active_streams),
+            "max_concurrent_per_user": self.config.max_concurrent_streams,
+            "peak_active_streams": self._peak_active,
+            "acquired_total": self._acquired,
+            "rejected_total": self._rejected,
+            "queued_streams": self._queued_now,
+            "queued_total": self._queued_total,
+            "queue_timeouts": self._queue_timeouts,
+            "queue_full_rejections": self._queue_full,
+            "queue_wait_avg_ms": round(
+                self._queue_wait_total / self._queued_total * 1000, 2
+            ) if self._queued_total else 0.0,
+            "queue_wait_max_ms": round(self._queue_wait_max * 1000, 2),
+        }
+        if include_users:
+            stats["active_by_user"] = dict(self._active_streams)
+        return stats
+    
+    async def reset(self) -> None:
+        """Reset all tracking (for testing)."""
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.cancel()
+        self._waiters.clear()
+        self._active_streams.clear()
+        self._total_active = 0
+        logger.info("Concurrency limiter reset")
+
+
+class DistributedConcurrencyLimiter(ConcurrencyLimiter):
+    """
+    Enforces the per-user stream limit across all workers.
+    
+    Every stream holds a row in stream_leases. Acquiring serializes on a
+    per-user transaction-scoped advisory lock, counts the user's unexpired
+    leases and inserts a new one only if under the limit. A heartbeat task
+    renews this worker's leases; leases of a crashed worker simply expire
+    after lease_ttl and stop counting.
+    
+    The in-process counter stays in front as a local pre-check: a user
+    already at the limit on this worker is rejected without a round trip.
+    If the database is unreachable, the local limit alone applies.
+    """
+    
+    def __init__(self, config: ConcurrencyConfig, db_pool):
+        """
+        Initialize distributed concurrency limiter.
+        
+        Args:
+            config: Concurrency configuration
+            db_pool: asyncpg connection pool
+        """
+        super().__init__(config)
+        self.db_pool = db_pool
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        
+        # Lease IDs held by this worker, per user
+        self._leases: dict[str, list[uuid.UUID]] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._running = False
+        self._lease_errors = 0
+    
+    async def start(self) -> None:
+        """Start the lease heartbeat."""
+        if self._running:
+            return
+        
+        self._running = True
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_worker())
+        logger.info(f"Distributed concurrency limiter started (worker {self.worker_id})")
+    
+    async def stop(self) -> None:
+        """Stop the heartbeat and drop this worker's leases."""
+        if not self._running:
+            return
+        
+        self._running = False
+        
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        
+        lease_ids = self._held_lease_ids()
+        self._leases.clear()
+        if lease_ids:
+            try:
+                async with self.db_pool.acquire() as conn:
+                    await conn.execute(
+                        "DELETE FROM stream_leases WHERE lease_id = ANY($1::uuid[])",
+                        lease_ids,
+                    )
+            except Exception as e:
+                logger.error(f"Error releasing stream leases on shutdown: {e}")
+    
+    def _held_lease_ids(self) -> list[uuid.UUID]:
+        """All lease IDs currently held by this worker."""
+        return [lease_id for ids in self._leases.values() for lease_id in ids]
+    
+    async def acquire(self, user_id: str, is_streaming: bool = True) -> bool:
+        """
+        Acquire a cluster-wide slot for a request.
+        
+        Args:
+            user_id: User identifier
+            is_streaming: Whether this is a streaming request
+            
+        Returns:
+            True if slot acquired, False if limit exceeded
+        """
+        if not is_streaming:
+            return True
+        
+        # Local pre-check, no round trip when this worker is already full
+        if not await self._acquire_local(user_id):
+            return False
+        
+        lease_id = uuid.uuid4()
+        try:
+            async with self.db_pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        "SELECT pg_advisory_xact_lock(hashtext($1::text))",
+                        user_id,
+                    )
+                    row = await conn.fetchrow(
+                        """
+                        INSERT INTO stream_leases (lease_id, user_id, worker_id, expires_at)
+                        SELECT $2, $1::uuid, $3, NOW() + make_interval(secs => $4)
+                        WHERE (
+                            SELECT COUNT(*) FROM stream_leases
+                            WHERE user_id = $1::uuid AND expires_at > NOW()
+                        ) < $5
+                        RETURNING lease_id
+                        """,
+                        user_id,
+                        lease_id,
+                        self.worker_id,
+                        float(self.config.lease_ttl),
+                        self.config.max_concurrent_streams,
+                    )
+        except Exception as e:
+            self._lease_errors += 1
+            logger.error(f"Database error acquiring stream lease: {e}")
+            # Fall back to the local limit
+            return True
+        except BaseException:
+            # Cancelled mid-insert, possibly after the lease was written
+            try:
+                await asyncio.shield(self._delete_lease(lease_id))
+            finally:
+                self.release_nowait(user_id)
+                self._acquired -= 1
+            raise
+        
+        if row is None:
+            # Slots are held on other workers; count a rejection, not an acquisition
+            self.release_nowait(user_id)
+            self._acquired -= 1
+            self._rejected += 1
+            logger.warning(
+                f"Cluster concurrency limit exceeded for user '{user_id}': "
+                f"limit {self.config.max_concurrent_streams}"
+            )
+            return False
+        
+        self._leases.setdefault(user_id, []).append(lease_id)
+        return True
+    
+    async def release(self, user_id: str, is_streaming: bool = True) -> None:
+        """
+        Release a slot and its lease.
+        
+        Args:
+            user_id: User identifier
+            is_streaming: Whether this was a streaming request
+        """
+        if not is_streaming:
+            return
+        
+        ids = self._leases.get(user_id)
+        if not ids:
+            # Acquired while the database was unavailable
+            self.release_nowait(user_id)
+            return
+        lease_id = ids.pop()
+        if not ids:
+            del self._leases[user_id]
+        
+        # Delete the lease before handing the local slot to a waiter,
+        # so the waiter's own lease insert sees the freed capacity
+        try:
+            await self._delete_lease(lease_id)
+        finally:
+            self.release_nowait(user_id)
+    
+    async def _delete_lease(self, lease_id: uuid.UUID) -> None:
+        """Delete one lease; on database errors it expires on its own."""
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    "DELETE FROM stream_leases WHERE lease_id = $1",
+                    lease_id,
+                )
+        except Exception as e:
+            self._lease_errors += 1
+            logger.error(f"Database error releasing stream lease: {e}")
+    
+    async def _heartbeat_worker(self) -> None:
+        """Periodically renew held leases."""
+        while self._running:
+            try:
+                await asyncio.sleep(self.config.heartbeat_interval)
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Stream lease heartbeat error: {e}")
     
-    async def get_stats(self) -> dict:
+    async def heartbeat(self) -> int:
+        """
+        Extend this worker's leases and purge expired ones.
+        
+        Returns:
+            Number of leases renewed
+        """
+        lease_ids = self._held_lease_ids()
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                if lease_ids:
+                    await conn.execute(
+                        """
+                        UPDATE stream_leases
+                        SET expires_at = NOW() + make_interval(secs => $2)
+                        WHERE lease_id = ANY($1::uuid[])
+                        """,
+                        lease_ids,
+                        float(self.config.lease_ttl),
+                    )
+                # Leases left behind by crashed workers
+                await conn.execute("DELETE FROM stream_leases WHERE expires_at < NOW()")
+        except Exception as e:
+            self._lease_errors += 1
+            logger.error(f"Database error renewing stream leases: {e}")
+            return 0
+        
+        return len(lease_ids)
+    
+    async def get_stats(self, include_users: bool = True) -> dict:
         """
         Get concurrency limiter statistics.
         
+        Args:
+            include_users: Include the per-user breakdown (O(users) copy)
+            
         Returns:
             Dictionary with stats
         """
-        async with self._lock:
-            total_active = sum(self._active_streams.values())
-            return {
-                "total_active_streams": total_active,
-                "users_with_active_streams": len(self._active_streams),
-                "max_concurrent_per_user": self.config.max_concurrent_streams,
-                "active_by_user": dict(self._active_streams),
-            }
+        stats = await super().get_stats(include_users)
+        stats["distributed"] = True
+        stats["worker_id"] = self.worker_id
+        stats["held_leases"] = sum(len(ids) for ids in self._leases.values())
+        stats["lease_errors"] = self._lease_errors
+        return stats
     
     async def reset(self) -> None:
         """Reset all tracking (for testing)."""
-        async with self._lock:
-            self._active_streams.clear()
-            logger.info("Concurrency limiter reset")
+        self._leases.clear()
+        await super().reset()
 
 
 class ConcurrencyContext:
@@ -26,6 +26,7 @@ class StageConfig:
     max_tokens: int = 4096
     temperature: float = 0.3
     fallback: list[str] = field(default_factory=list)
+    timeout: Optional[float] = None  # Upstream read timeout in seconds
 
 
 @dataclass
@@ -42,6 +43,12 @@ class ModelsConfig:
     direct: DirectModeConfig = field(default_factory=DirectModeConfig)
     rate_limit: dict[str, Any] = field(default_factory=dict)
     circuit_breaker: dict[str, Any] = field(default_factory=dict)
+    scheduler: dict[str, Any] = field(default_factory=dict)
+    timeouts: dict[str, Any] = field(default_factory=dict)
+    hedging: dict[str, Any] = field(default_factory=dict)
+    retries: dict[str, Any] = field(default_factory=dict)
+    upstream: dict[str, Any] = field(default_factory=dict)
+    streaming: dict[str, Any] = field(default_factory=dict)
 
 
 @dataclass
@@ -177,6 +184,7 @@ class Config:
                 max_tokens=stage_data.get("max_tokens", 4096),
                 temperature=stage_data.get("temperature", 0.3),
                 fallback=stage_data.get("fallback", []),
+                timeout=stage_data.get("timeout"),
             )
         
         direct_data = data.get("direct", {})
@@ -190,6 +198,12 @@ class Config:
             direct=direct,
             rate_limit=data.get("rate_limit", {}),
             circuit_breaker=data.get("circuit_breaker", {}),
+            scheduler=data.get("scheduler", {}),
+            timeouts=data.get("timeouts", {}),
+            hedging=data.get("hedging", {}),
+            retries=data.get("retries", {}),
+            upstream=data.get("upstream", {}),
+            streaming=data.get("streaming", {}),
         )
     
     @classmethod
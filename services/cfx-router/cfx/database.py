@@ -7,7 +7,7 @@ Provides async PostgreSQL connection pool and query utilities.
 import logging
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from typing import Any, AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Callable, Optional
 
 import asyncpg
 from asyncpg import Pool, Connection
@@ -40,6 +40,8 @@ class Database:
         """
         self.config = config
         self._pool: Optional[Pool] = None
+        self._listen_conn: Optional[Connection] = None
+        self._listeners: dict[str, Callable[..., Any]] = {}
     
     async def connect(self) -> None:
         """Create connection pool."""
@@ -60,6 +62,8 @@ class Database:
     
     async def disconnect(self) -> None:
         """Close connection pool."""
+        await self._release_listen_conn()
+        
         if self._pool is not None:
             await self._pool.close()
             self._pool = None
@@ -141,6 +145,76 @@ class Database:
         async with self.acquire() as conn:
             return await conn.fetchval(query, *args)
     
+    async def listen(
+        self,
+        channel: str,
+        callback: Callable[[str], None],
+        on_disconnect: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Subscribe to a Postgres NOTIFY channel.
+        
+        All channels share one connection held out of the pool for the
+        lifetime of the subscription.
+        
+        Args:
+            channel: Channel name
+            callback: Called with the notification payload
+            on_disconnect: Called if the listening connection is lost
+        """
+        if self._pool is None:
+            raise RuntimeError("Database not connected. Call connect() first.")
+        
+        if self._listen_conn is not None and self._listen_conn.is_closed():
+            await self._release_listen_conn()
+        
+        if self._listen_conn is None:
+            self._listen_conn = await self._pool.acquire()
+        
+        def _on_notify(connection: Any, pid: int, channel: str, payload: str) -> None:
+            callback(payload)
+        
+        def _on_terminate(connection: Any) -> None:
+            logger.warning(f"LISTEN connection for '{channel}' lost")
+            self._listeners.pop(channel, None)
+            if on_disconnect is not None:
+                on_disconnect()
+        
+        await self._listen_conn.add_listener(channel, _on_notify)
+        self._listen_conn.add_termination_listener(_on_terminate)
+        self._listeners[channel] = _on_notify
+        logger.info(f"Listening on channel '{channel}'")
+    
+    async def unlisten(self, channel: str) -> None:
+        """
+        Unsubscribe from a NOTIFY channel.
+        
+        Args:
+            channel: Channel name
+        """
+        listener = self._listeners.pop(channel, None)
+        if listener is not None and self._listen_conn is not None:
+            try:
+                await self._listen_conn.remove_listener(channel, listener)
+            except Exception as e:
+                logger.warning(f"Failed to unlisten '{channel}': {e}")
+        
+        if not self._listeners:
+            await self._release_listen_conn()
+    
+    async def _release_listen_conn(self) -> None:
+        """Return the listening connection to the pool."""
+        if self._listen_conn is None:
+            return
+        
+        conn, self._listen_conn = self._listen_conn, None
+        self._listeners.clear()
+        try:
+            if self._pool is not None:
+                await self._pool.release(conn)
+        except Exception as e:
+            logger.warning(f"Failed to release listening connection: {e}")
+    
     async def health_check(self) -> bool:
         """
         Check database connectivity.
@@ -0,0 +1,339 @@
+"""
+CF-X Router Latency Tracking Module
+
+Streaming per-model latency percentiles, the adaptive upstream
+timeouts derived from them, and per-stream chunk timing.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimator (P² algorithm, Jain & Chlamtac 1985).
+    
+    Tracks one quantile with five markers, so memory and per-sample cost
+    are O(1) regardless of how many samples are observed.
+    """
+    
+    __slots__ = ("p", "count", "_heights", "_positions", "_desired", "_increments")
+    
+    def __init__(self, p: float):
+        """
+        Initialize estimator.
+        
+        Args:
+            p: Quantile to track, in (0, 1)
+        """
+        self.p = p
+        self.count = 0
+        self._heights: list[float] = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self._increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+    
+    def add(self, x: float) -> None:
+        """
+        Add a sample.
+        
+        Args:
+            x: Observed value
+        """
+        self.count += 1
+        q = self._heights
+        
+        if self.count <= 5:
+            q.append(x)
+            if self.count == 5:
+                q.sort()
+            return
+        
+        # Find the cell containing x, extending the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        
+        # Move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+    
+    def _parabolic(self, i: int, step: int) -> float:
+        """Piecewise-parabolic prediction of marker i's new height."""
+        q, n = self._heights, self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+    
+    @property
+    def value(self) -> Optional[float]:
+        """Current estimate (None before the first sample)."""
+        if self.count == 0:
+            return None
+        if self.count < 5:
+            ordered = sorted(self._heights)
+            return ordered[min(int(self.p * self.count), self.count - 1)]
+        return self._heights[2]
+
+
+@dataclass
+class AdaptiveTimeoutConfig:
+    """Configuration for adaptive upstream timeouts."""
+    enabled: bool = False
+    percentile: float = 0.99      # Latency quantile tracked per model
+    multiplier: float = 2.0       # Deadline = multiplier × estimated quantile
+    min_timeout: float = 5.0      # Never cut deadlines below this (seconds)
+    min_samples: int = 50         # Samples before the estimate is trusted
+    window_samples: int = 1000    # Estimator restarts after this many samples
+    model_timeouts: dict[str, float] = field(default_factory=dict)  # Fixed ceilings
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "AdaptiveTimeoutConfig":
+        """
+        Build config from the models.yaml timeouts section.
+        
+        Args:
+            data: Timeout settings ("models" maps model name to seconds)
+        
+        Returns:
+            AdaptiveTimeoutConfig instance
+        """
+        defaults = cls()
+        return cls(
+            enabled=data.get("adaptive", defaults.enabled),
+            percentile=data.get("percentile", defaults.percentile),
+            multiplier=data.get("multiplier", defaults.multiplier),
+            min_timeout=data.get("min_timeout", defaults.min_timeout),
+            min_samples=data.get("min_samples", defaults.min_samples),
+            window_samples=data.get("window_samples", defaults.window_samples),
+            model_timeouts=data.get("models", {}),
+        )
+
+
+class _ModelLatency:
+    """Latency estimators for one model and request mode."""
+    
+    __slots__ = ("count", "current", "previous")
+    
+    def __init__(self, percentiles: tuple[float, ...]):
+        self.count = 0
+        self.current = {p: P2Quantile(p) for p in percentiles}
+        self.previous: Optional[dict[float, P2Quantile]] = None
+
+
+class LatencyTracker:
+    """
+    Per-model latency percentiles and adaptive deadlines.
+    
+    Non-streaming calls are measured end to end, streaming calls up to the
+    first chunk (the longest wait of a healthy stream). Each model/mode
+    pair keeps a P² estimator; every window_samples samples it is replaced
+    by a fresh one, with the old estimate serving until the new one has
+    min_samples, so the deadline follows shifts in model latency.
+    """
+    
+    def __init__(
+        self,
+        config: AdaptiveTimeoutConfig,
+        extra_percentiles: tuple[float, ...] = (),
+    ):
+        """
+        Initialize latency tracker.
+        
+        Args:
+            config: Adaptive timeout configuration
+            extra_percentiles: Further quantiles to track (e.g. for hedging)
+        """
+        self.config = config
+        self.percentiles = tuple(sorted({config.percentile, *extra_percentiles}))
+        self._latencies: dict[tuple[str, bool], _ModelLatency] = {}
+    
+    def observe(self, model: str, seconds: float, streaming: bool = False) -> None:
+        """
+        Record an upstream latency sample.
+        
+        Args:
+            model: Model name
+            seconds: Latency (end to end, or to first chunk for streams)
+            streaming: Whether the call was streaming
+        """
+        key = (model, streaming)
+        latency = self._latencies.get(key)
+        if latency is None:
+            latency = _ModelLatency(self.percentiles)
+            self._latencies[key] = latency
+        
+        for estimator in latency.current.values():
+            estimator.add(seconds)
+        latency.count += 1
+        if latency.count >= self.config.window_samples:
+            latency.previous = latency.current
+            latency.current = {p: P2Quantile(p) for p in self.percentiles}
+            latency.count = 0
+    
+    def estimate(
+        self,
+        model: str,
+        streaming: bool = False,
+        percentile: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        Get a latency quantile estimate for a model.
+        
+        Args:
+            model: Model name
+            streaming: Whether to use the streaming estimate
+            percentile: Tracked quantile (defaults to the configured one)
+        
+        Returns:
+            Estimated quantile in seconds, or None with too few samples
+        """
+        latency = self._latencies.get((model, streaming))
+        if latency is None:
+            return None
+        p = self.config.percentile if percentile is None else percentile
+        if latency.count >= self.config.min_samples:
+            estimator = latency.current.get(p)
+        elif latency.previous is not None:
+            estimator = latency.previous.get(p)
+        else:
+            return None
+        return estimator.value if estimator is not None else None
+    
+    def timeout_for(
+        self,
+        model: str,
+        ceiling: float,
+        streaming: bool = False,
+    ) -> float:
+        """
+        Get the upstream read timeout for a call.
+        
+        Args:
+            model: Model name
+            ceiling: Configured timeout (stage or client default)
+            streaming: Whether the call is streaming
+        
+        Returns:
+            Timeout in seconds, never above the model's fixed timeout or ceiling
+        """
+        ceiling = min(ceiling, self.config.model_timeouts.get(model, ceiling))
+        if not self.config.enabled:
+            return ceiling
+        
+        estimate = self.estimate(model, streaming)
+        if estimate is None:
+            return ceiling
+        
+        return min(ceiling, max(self.config.min_timeout, estimate * self.config.multiplier))
+    
+    def get_stats(self) -> dict:
+        """
+        Get latency estimates per model.
+        
+        Returns:
+            Dictionary keyed by model with per-mode estimates in ms
+        """
+        stats: dict[str, dict] = {}
+        for (model, streaming), latency in self._latencies.items():
+            estimate = self.estimate(model, streaming)
+            stats.setdefault(model, {})["stream" if streaming else "non_stream"] = {
+                "samples": latency.count,
+                "percentile": self.config.percentile,
+                "estimate_ms": round(estimate * 1000, 1) if estimate is not None else None,
+            }
+        return stats
+
+
+class StreamTimer:
+    """
+    Timing of one streamed response, on the monotonic clock.
+    
+    Records time to first chunk, generation time (first to last chunk)
+    and the gaps between consecutive chunks. Per chunk it only appends
+    one float; percentiles are computed once in finish().
+    """
+    
+    __slots__ = ("started", "first_chunk_at", "last_chunk_at", "chunks", "_gaps")
+    
+    def __init__(self, started: float):
+        """
+        Initialize timer.
+        
+        Args:
+            started: time.monotonic() when the request arrived
+        """
+        self.started = started
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.chunks = 0
+        self._gaps: list[float] = []
+    
+    def chunk(self, now: Optional[float] = None) -> None:
+        """
+        Record a chunk received from upstream.
+        
+        Args:
+            now: Arrival time (defaults to time.monotonic())
+        """
+        now = time.monotonic() if now is None else now
+        if self.last_chunk_at is None:
+            self.first_chunk_at = now
+        else:
+            self._gaps.append(now - self.last_chunk_at)
+        self.last_chunk_at = now
+        self.chunks += 1
+    
+    def finish(self) -> dict[str, Optional[int]]:
+        """
+        Summarize the stream.
+        
+        Returns:
+            Dictionary with time_to_first_token_ms, stream_duration_ms,
+            chunk_count and chunk_gap_p50/p95/p99_ms (None when unknown)
+        """
+        timings: dict[str, Optional[int]] = {
+            "time_to_first_token_ms": None,
+            "stream_duration_ms": None,
+            "chunk_count": self.chunks,
+            "chunk_gap_p50_ms": None,
+            "chunk_gap_p95_ms": None,
+            "chunk_gap_p99_ms": None,
+        }
+        if self.first_chunk_at is None:
+            return timings
+        
+        timings["time_to_first_token_ms"] = int((self.first_chunk_at - self.started) * 1000)
+        timings["stream_duration_ms"] = int((self.last_chunk_at - self.first_chunk_at) * 1000)
+        
+        gaps = sorted(self._gaps)
+        if gaps:
+            last = len(gaps) - 1
+            for p in (50, 95, 99):
+                timings[f"chunk_gap_p{p}_ms"] = int(gaps[min(last, p * len(gaps) // 100)] * 1000)
+        return timings
@@ -6,14 +6,88 @@ Handles communication with LiteLLM proxy, including streaming and retries.
 
 import asyncio
 import logging
-from dataclasses import dataclass
-from typing import Any, AsyncGenerator, Optional
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncGenerator, AsyncIterator, Optional
 
 import httpx
 
+from cfx.upstreams import (
+    BalancerConfig,
+    PooledRequest,
+    Upstream,
+    UpstreamBalancer,
+    UNHEALTHY_STATUS_CODES,
+)
+
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class RetryConfig:
+    """Configuration for retry backoff and the retry budget."""
+    backoff_base: float = 0.1      # Minimum delay between attempts (seconds)
+    backoff_cap: float = 5.0       # Maximum jittered delay (seconds)
+    max_retry_after: float = 10.0  # Longer Retry-After hints are not waited out
+    budget_ratio: float = 0.2      # Retry tokens earned per request
+    budget_burst: float = 10.0     # Max saved-up retry tokens
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RetryConfig":
+        """
+        Build config from the models.yaml retries section.
+        
+        Args:
+            data: Retry settings
+            
+        Returns:
+            RetryConfig instance
+        """
+        defaults = cls()
+        return cls(
+            backoff_base=data.get("backoff_base", defaults.backoff_base),
+            backoff_cap=data.get("backoff_cap", defaults.backoff_cap),
+            max_retry_after=data.get("max_retry_after", defaults.max_retry_after),
+            budget_ratio=data.get("budget_ratio", defaults.budget_ratio),
+            budget_burst=data.get("budget_burst", defaults.budget_burst),
+        )
+
+
+@dataclass
+class PoolConfig:
+    """Configuration for the HTTP connection pool to LiteLLM."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 5.0  # Seconds an idle connection is kept open
+    pool_timeout: float = 10.0     # Max seconds to wait for a free connection
+    http2: bool = False            # Multiplex requests over shared connections
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "PoolConfig":
+        """
+        Build config from the models.yaml upstream section.
+        
+        Args:
+            data: Pool settings
+            
+        Returns:
+            PoolConfig instance
+        """
+        defaults = cls()
+        return cls(
+            max_connections=data.get("max_connections", defaults.max_connections),
+            max_keepalive_connections=data.get(
+                "max_keepalive_connections", defaults.max_keepalive_connections
+            ),
+            keepalive_expiry=data.get("keepalive_expiry", defaults.keepalive_expiry),
+            pool_timeout=data.get("pool_timeout", defaults.pool_timeout),
+            http2=data.get("http2", defaults.http2),
+        )
+
+
 @dataclass
 class LiteLLMConfig:
     """Configuration for LiteLLM client."""
@@ -22,7 +96,138 @@ class LiteLLMConfig:
     connect_timeout: float = 10.0
     read_timeout: float = 120.0
     max_retries: int = 1
-    retry_status_codes: tuple[int, ...] = (502, 503, 504)
+    retry_status_codes: tuple[int, ...] = (429, 502, 503, 504)
+    retry: RetryConfig = field(default_factory=RetryConfig)
+    pool: PoolConfig = field(default_factory=PoolConfig)
+    upstreams: list[str] = field(default_factory=list)  # Replicas (default: base_url)
+    balancer: BalancerConfig = field(default_factory=BalancerConfig)
+
+
+def http2_available() -> bool:
+    """Check whether the optional h2 package (httpx[http2]) is installed."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class HedgeConfig:
+    """Configuration for hedged non-streaming requests."""
+    enabled: bool = False
+    percentile: float = 0.95      # Hedge once the model's latency quantile passes
+    stages: list[str] = field(default_factory=lambda: ["review"])
+    budget_ratio: float = 0.1     # Hedge tokens earned per eligible request
+    budget_burst: float = 10.0    # Max saved-up hedge tokens
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "HedgeConfig":
+        """
+        Build config from the models.yaml hedging section.
+        
+        Args:
+            data: Hedging settings
+            
+        Returns:
+            HedgeConfig instance
+        """
+        defaults = cls()
+        return cls(
+            enabled=data.get("enabled", defaults.enabled),
+            percentile=data.get("percentile", defaults.percentile),
+            stages=data.get("stages", defaults.stages),
+            budget_ratio=data.get("budget_ratio", defaults.budget_ratio),
+            budget_burst=data.get("budget_burst", defaults.budget_burst),
+        )
+
+
+@dataclass
+class CoalesceConfig:
+    """Configuration for coalescing streamed SSE events into fewer writes."""
+    enabled: bool = False
+    max_delay: float = 0.005      # Longest an event is held back (seconds)
+    max_bytes: int = 16384        # Write as soon as this much is waiting
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "CoalesceConfig":
+        """
+        Build config from the models.yaml streaming section.
+        
+        Args:
+            data: Streaming settings
+            
+        Returns:
+            CoalesceConfig instance
+        """
+        defaults = cls()
+        return cls(
+            enabled=data.get("coalesce", defaults.enabled),
+            max_delay=data.get("max_delay", defaults.max_delay),
+            max_bytes=data.get("max_bytes", defaults.max_bytes),
+        )
+
+
+class TokenBudget:
+    """
+    Token bucket limiting extra upstream work to a share of traffic.
+    
+    Every request deposits ratio tokens (up to burst) and every extra
+    attempt (a retry or a hedge) withdraws a whole one, so extra attempts
+    stay below ratio × requests however much upstream is failing.
+    """
+    
+    __slots__ = ("ratio", "burst", "tokens")
+    
+    def __init__(self, ratio: float, burst: float):
+        """
+        Initialize budget, starting full.
+        
+        Args:
+            ratio: Tokens earned per request
+            burst: Maximum saved-up tokens
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+    
+    def deposit(self) -> None:
+        """Earn tokens for one request."""
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+    
+    def try_withdraw(self) -> bool:
+        """
+        Spend a token for one extra attempt.
+        
+        Returns:
+            True if the attempt is within budget
+        """
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """
+    Parse a Retry-After header.
+    
+    Args:
+        value: Header value (delay in seconds or an HTTP date)
+        
+    Returns:
+        Seconds to wait, or None if absent or malformed
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 @dataclass
@@ -35,6 +240,8 @@ class CompletionRequest:
     temperature: Optional[float] = None
     top_p: Optional[float] = None
     stop: Optional[list[str]] = None
+    include_usage: bool = False      # Ask for a final usage chunk when streaming
+    timeout: Optional[float] = None  # Read timeout override (not sent upstream)
     
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary for API request."""
@@ -52,6 +259,8 @@ class CompletionRequest:
             data["top_p"] = self.top_p
         if self.stop is not None:
             data["stop"] = self.stop
+        if self.stream and self.include_usage:
+            data["stream_options"] = {"include_usage": True}
         
         return data
 
@@ -80,39 +289,64 @@ class LiteLLMClient:
     Async client for LiteLLM proxy.
     
     Features:
-    - Connection pooling
+    - Connection pooling (one pool per proxy replica)
+    - Load balancing across replicas with passive ejection
     - Configurable timeouts
-    - Retry logic for transient errors
+    - Retry logic for transient errors (jittered backoff, retry budget)
     - SSE streaming support
+    - Optional request hedging under a process-wide budget
     """
     
-    def __init__(self, config: LiteLLMConfig):
+    def __init__(self, config: LiteLLMConfig, hedge_config: Optional[HedgeConfig] = None):
         """
         Initialize LiteLLM client.
         
         Args:
             config: Client configuration
+            hedge_config: Hedging configuration (disabled if omitted)
         """
         self.config = config
-        self._client: Optional[httpx.AsyncClient] = None
+        self.hedge_config = hedge_config or HedgeConfig()
+        self._balancer = UpstreamBalancer(
+            config.upstreams or [config.base_url], config.balancer
+        )
+        
+        self._http2 = config.pool.http2 and http2_available()
+        if config.pool.http2 and not self._http2:
+            logger.warning("HTTP/2 requested but the h2 package is missing, using HTTP/1.1")
+        
+        # Process-wide retry and hedge budgets, with metrics
+        self._retry_budget = TokenBudget(config.retry.budget_ratio, config.retry.budget_burst)
+        self._retries = 0
+        self._retries_denied = 0
+        self._hedge_budget = TokenBudget(
+            self.hedge_config.budget_ratio, self.hedge_config.budget_burst
+        )
+        self._hedge_eligible = 0
+        self._hedges_sent = 0
+        self._hedges_denied = 0
+        self._hedge_wins = 0
     
-    async def _get_client(self) -> httpx.AsyncClient:
-        """Get or create HTTP client."""
-        if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(
-                base_url=self.config.base_url,
+    async def _get_client(self, upstream: Upstream) -> httpx.AsyncClient:
+        """Get or create the HTTP client of a replica."""
+        if upstream.client is None or upstream.client.is_closed:
+            pool = self.config.pool
+            upstream.client = httpx.AsyncClient(
+                base_url=upstream.url,
                 timeout=httpx.Timeout(
                     connect=self.config.connect_timeout,
                     read=self.config.read_timeout,
                     write=30.0,
-                    pool=10.0,
+                    pool=pool.pool_timeout,
                 ),
                 limits=httpx.Limits(
-                    max_connections=100,
-                    max_keepalive_connections=20,
+                    max_connections=pool.max_connections,
+                    max_keepalive_connections=pool.max_keepalive_connections,
+                    keepalive_expiry=pool.keepalive_expiry,
                 ),
+                http2=self._http2,
             )
-        return self._client
+        return upstream.client
     
     def _get_headers(self) -> dict[str, str]:
         """Get request headers with API key."""
@@ -121,21 +355,43 @@ class LiteLLMClient:
             headers["Authorization"] = f"Bearer {self.config.api_key}"
         return headers
     
+    def _request_kwargs(
+        self,
+        request: CompletionRequest,
+        tracked: Optional[PooledRequest] = None,
+    ) -> dict[str, Any]:
+        """Per-request httpx options (read timeout override, pool tracing)."""
+        kwargs: dict[str, Any] = {}
+        if tracked is not None:
+            kwargs["extensions"] = {"trace": tracked.trace}
+        if request.timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(
+                connect=self.config.connect_timeout,
+                read=request.timeout,
+                write=30.0,
+                pool=self.config.pool.pool_timeout,
+            )
+        return kwargs
+    
     async def close(self) -> None:
-        """Close the HTTP client."""
-        if self._client is not None:
-            await self._client.aclose()
-            self._client = None
+        """Close the HTTP clients of all replicas."""
+        for upstream in self._balancer.upstreams:
+            if upstream.client is not None:
+                await upstream.client.aclose()
+                upstream.client = None
     
     async def complete(
         self,
         request: CompletionRequest,
+        hedge_after: Optional[float] = None,
     ) -> CompletionResponse:
         """
         Send a non-streaming completion request.
         
         Args:
             request: Completion request
+            hedge_after: Seconds after which to send a hedge request
+                (ignored unless hedging is enabled)
             
         Returns:
             CompletionResponse
@@ -143,54 +399,245 @@ class LiteLLMClient:
         Raises:
             LiteLLMError: If request fails after retries
         """
-        client = await self._get_client()
+        if hedge_after is None or not self.hedge_config.enabled:
+            return await self._complete(request)
+        return await self._complete_hedged(request, hedge_after)
+    
+    async def _complete_hedged(
+        self,
+        request: CompletionRequest,
+        hedge_after: float,
+    ) -> CompletionResponse:
+        """
+        Race a second identical request against a slow first one.
+        
+        The hedge goes to the same model; LiteLLM may route it to another
+        deployment. Each eligible request earns budget_ratio hedge tokens
+        and a hedge spends one, so hedges stay within that fraction of
+        traffic. The first successful response wins and the other request
+        is cancelled.
+        """
+        self._hedge_eligible += 1
+        self._hedge_budget.deposit()
+        
+        primary = asyncio.create_task(self._complete(request))
+        hedge: Optional[asyncio.Task] = None
+        
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+            
+            if not self._hedge_budget.try_withdraw():
+                self._hedges_denied += 1
+                return await primary
+            
+            self._hedges_sent += 1
+            logger.info(f"Hedging {request.model} request after {hedge_after:.2f}s")
+            hedge = asyncio.create_task(self._complete(request))
+            
+            pending = {primary, hedge}
+            first_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is hedge:
+                            self._hedge_wins += 1
+                        return task.result()
+                    first_error = first_error or error
+            raise first_error
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Mark a losing failure as retrieved
+    
+    def _next_backoff(self, previous: float) -> float:
+        """Decorrelated jitter: random delay between base and 3x the last one."""
+        retry = self.config.retry
+        return min(retry.backoff_cap, random.uniform(retry.backoff_base, previous * 3))
+    
+    def _retry_delay(
+        self,
+        attempt: int,
+        backoff: float,
+        retry_after: Optional[float],
+        reason: str,
+    ) -> Optional[float]:
+        """
+        Decide whether to retry a failed attempt and how long to wait.
+        
+        Args:
+            attempt: Zero-based number of the failed attempt
+            backoff: Jittered backoff for this retry
+            retry_after: Upstream Retry-After hint in seconds, if any
+            reason: Failure description for logging
+            
+        Returns:
+            Seconds to sleep before retrying, or None to give up
+        """
+        if attempt >= self.config.max_retries:
+            return None
+        
+        # A long Retry-After is better served by a fallback model
+        if retry_after is not None and retry_after > self.config.retry.max_retry_after:
+            logger.warning(f"LiteLLM {reason} with Retry-After {retry_after:.0f}s, not retrying")
+            return None
+        
+        if not self._retry_budget.try_withdraw():
+            self._retries_denied += 1
+            logger.warning(f"LiteLLM {reason}, retry budget exhausted")
+            return None
+        
+        delay = backoff if retry_after is None else retry_after
+        self._retries += 1
+        logger.warning(
+            f"LiteLLM {reason}, retrying in {delay:.2f}s "
+            f"({attempt + 1}/{self.config.max_retries})"
+        )
+        return delay
+    
+    async def _complete(self, request: CompletionRequest) -> CompletionResponse:
+        """Send one completion request with retries (each on a fresh replica if possible)."""
+        self._retry_budget.deposit()
         last_error: Optional[Exception] = None
+        backoff = self.config.retry.backoff_base
+        tried: list[Upstream] = []
         
         for attempt in range(self.config.max_retries + 1):
+            retry_after = None
+            upstream = self._balancer.pick(exclude=tried)
+            tried.append(upstream)
+            client = await self._get_client(upstream)
+            started = time.monotonic()
             try:
-                response = await client.post(
-                    "/v1/chat/completions",
-                    json=request.to_dict(),
-                    headers=self._get_headers(),
-                )
+                with upstream.pool.track() as tracked:
+                    response = await client.post(
+                        "/v1/chat/completions",
+                        json=request.to_dict(),
+                        headers=self._get_headers(),
+                        **self._request_kwargs(request, tracked),
+                    )
                 
+                self._record_response(upstream, response.status_code, started)
                 if response.status_code == 200:
                     return CompletionResponse.from_dict(response.json())
                 
-                # Check if should retry
-                if response.status_code in self.config.retry_status_codes:
-                    if attempt < self.config.max_retries:
-                        logger.warning(
-                            f"LiteLLM returned {response.status_code}, "
-                            f"retrying ({attempt + 1}/{self.config.max_retries})"
-                        )
-                        await asyncio.sleep(1.0)  # Brief delay before retry
-                        continue
-                
-                # Non-retryable error
-                raise LiteLLMError(
+                last_error = LiteLLMError(
                     status_code=response.status_code,
                     message=response.text,
                 )
                 
+                # Non-retryable error
+                if response.status_code not in self.config.retry_status_codes:
+                    raise last_error
+                
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                reason = f"returned {response.status_code}"
+                
             except httpx.TimeoutException as e:
+                upstream.record_failure()
                 last_error = e
-                if attempt < self.config.max_retries:
-                    logger.warning(f"LiteLLM timeout, retrying ({attempt + 1})")
-                    continue
+                reason = "timeout"
                     
             except httpx.ConnectError as e:
+                upstream.record_failure()
                 last_error = e
-                if attempt < self.config.max_retries:
-                    logger.warning(f"LiteLLM connection error, retrying ({attempt + 1})")
-                    await asyncio.sleep(1.0)
-                    continue
+                reason = "connection error"
+            
+            backoff = self._next_backoff(backoff)
+            delay = self._retry_delay(attempt, backoff, retry_after, reason)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
         
-        # All retries exhausted
+        attempts = attempt + 1
+        if isinstance(last_error, LiteLLMError):
+            raise last_error
+        if isinstance(last_error, httpx.TimeoutException):
+            raise LiteLLMTimeoutError(
+                f"LiteLLM timed out after {attempts} attempts: {last_error}"
+            )
         raise LiteLLMUnavailableError(
-            f"LiteLLM unavailable after {self.config.max_retries + 1} attempts: {last_error}"
+            f"LiteLLM unavailable after {attempts} attempts: {last_error}"
         )
     
+    @asynccontextmanager
+    async def _open_stream(self, request: CompletionRequest) -> AsyncIterator[httpx.Response]:
+        """
+        Open a streaming response, retrying until the first byte.
+        
+        Connection failures and retryable statuses are retried like
+        complete(), which is safe because nothing has been read yet; read
+        timeouts are not retried.
+        
+        Yields:
+            httpx response with status 200, body unread
+        """
+        request.stream = True
+        self._retry_budget.deposit()
+        backoff = self.config.retry.backoff_base
+        tried: list[Upstream] = []
+        
+        for attempt in range(self.config.max_retries + 1):
+            retry_after = None
+            upstream = self._balancer.pick(exclude=tried)
+            tried.append(upstream)
+            client = await self._get_client(upstream)
+            started = time.monotonic()
+            streaming = False
+            try:
+                with upstream.pool.track() as tracked:
+                    async with client.stream(
+                        "POST",
+                        "/v1/chat/completions",
+                        json=request.to_dict(),
+                        headers=self._get_headers(),
+                        **self._request_kwargs(request, tracked),
+                    ) as response:
+                        self._record_response(upstream, response.status_code, started)
+                        if response.status_code == 200:
+                            streaming = True
+                            yield response
+                            return
+                        
+                        body = await response.aread()
+                        error = LiteLLMError(
+                            status_code=response.status_code,
+                            message=body.decode("utf-8"),
+                        )
+                        if response.status_code not in self.config.retry_status_codes:
+                            raise error
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        reason = f"stream returned {response.status_code}"
+                        
+            except httpx.ConnectTimeout:
+                upstream.record_failure()
+                if streaming:
+                    raise LiteLLMTimeoutError("LiteLLM streaming timeout")
+                error = LiteLLMTimeoutError("LiteLLM streaming connect timeout")
+                reason = "stream connect timeout"
+            except httpx.TimeoutException:
+                upstream.record_failure()
+                raise LiteLLMTimeoutError("LiteLLM streaming timeout")
+            except httpx.ConnectError:
+                upstream.record_failure()
+                error = LiteLLMUnavailableError("LiteLLM connection failed")
+                if streaming:
+                    raise error
+                reason = "stream connection error"
+            
+            backoff = self._next_backoff(backoff)
+            delay = self._retry_delay(attempt, backoff, retry_after, reason)
+            if delay is None:
+                raise error
+            await asyncio.sleep(delay)
+    
     async def stream(
         self,
         request: CompletionRequest,
@@ -198,7 +645,7 @@ class LiteLLMClient:
         """
         Send a streaming completion request.
         
-        Yields SSE-formatted chunks.
+        Yields SSE-formatted chunks, one per upstream data line.
         
         Args:
             request: Completion request (stream should be True)
@@ -209,53 +656,98 @@ class LiteLLMClient:
         Raises:
             LiteLLMError: If request fails
         """
-        client = await self._get_client()
-        request.stream = True
+        async with self._open_stream(request) as response:
+            async for line in response.aiter_lines():
+                if line:
+                    yield line + "\n"
+            
+            # Send done marker
+            yield "data: [DONE]\n\n"
+    
+    async def stream_raw(
+        self,
+        request: CompletionRequest,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Send a streaming completion request, passing upstream bytes through.
         
-        try:
-            async with client.stream(
-                "POST",
-                "/v1/chat/completions",
-                json=request.to_dict(),
-                headers=self._get_headers(),
-            ) as response:
-                if response.status_code != 200:
-                    body = await response.aread()
-                    raise LiteLLMError(
-                        status_code=response.status_code,
-                        message=body.decode("utf-8"),
-                    )
-                
-                async for line in response.aiter_lines():
-                    if line:
-                        yield line + "\n"
-                
-                # Send done marker
-                yield "data: [DONE]\n\n"
-                
-        except httpx.TimeoutException:
-            raise LiteLLMUnavailableError("LiteLLM streaming timeout")
-        except httpx.ConnectError:
-            raise LiteLLMUnavailableError("LiteLLM connection failed")
+        Unlike stream(), chunks are neither decoded nor re-encoded: each
+        upstream chunk is forwarded as is when it ends on an SSE event
+        boundary, and only split or joined when it does not, so callers can
+        inject their own events between chunks.
+        
+        Args:
+            request: Completion request (stream should be True)
+            
+        Yields:
+            Byte chunks holding whole SSE events
+            
+        Raises:
+            LiteLLMError: If request fails
+        """
+        async with self._open_stream(request) as response:
+            chunk = b""
+            async for chunk in frame_sse_events(response.aiter_bytes()):
+                yield chunk
+            
+            # Send done marker unless upstream already did
+            if not chunk.rstrip().endswith(b"[DONE]"):
+                yield b"data: [DONE]\n\n"
+    
+    @staticmethod
+    def _record_response(upstream: Upstream, status_code: int, started: float) -> None:
+        """Feed a replica's response into its health and latency tracking."""
+        if status_code in UNHEALTHY_STATUS_CODES:
+            upstream.record_failure()
+        else:
+            upstream.record_success(time.monotonic() - started)
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get retry, hedging, replica and connection pool statistics."""
+        eligible = self._hedge_eligible
+        pool = self.config.pool
+        return {
+            "pool": {
+                "http2": self._http2,
+                "max_connections": pool.max_connections,
+                "max_keepalive_connections": pool.max_keepalive_connections,
+            },
+            "upstreams": self._balancer.get_stats(),
+            "retries": self._retries,
+            "retries_denied": self._retries_denied,
+            "retry_budget_tokens": round(self._retry_budget.tokens, 2),
+            "hedging_enabled": self.hedge_config.enabled,
+            "hedge_eligible": eligible,
+            "hedges_sent": self._hedges_sent,
+            "hedges_denied": self._hedges_denied,
+            "hedge_wins": self._hedge_wins,
+            "hedge_rate": round(self._hedges_sent / eligible, 4) if eligible else 0.0,
+            "hedge_win_rate": (
+                round(self._hedge_wins / self._hedges_sent, 4) if self._hedges_sent else 0.0
+            ),
+            "hedge_budget_tokens": round(self._hedge_budget.tokens, 2),
+        }
     
     async def health_check(self) -> bool:
         """
         Check if LiteLLM is reachable.
         
         Returns:
-            True if healthy, False otherwise
+            True if any replica is healthy, False otherwise
         """
-        try:
-            client = await self._get_client()
-            response = await client.get(
-                "/health", 
-                timeout=5.0,
-                headers=self._get_headers(),
-            )
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"LiteLLM health check failed: {e}")
-            return False
+        for upstream in self._balancer.upstreams:
+            try:
+                client = await self._get_client(upstream)
+                response = await client.get(
+                    "/health", 
+                    timeout=5.0,
+                    headers=self._get_headers(),
+                )
+                if response.status_code == 200:
+                    return True
+            except Exception as e:
+                logger.error(f"LiteLLM health check failed for {upstream.url}: {e}")
+        return False
 
 
 class LiteLLMError(Exception):
@@ -272,6 +764,276 @@ class LiteLLMUnavailableError(Exception):
     pass
 
 
+class LiteLLMTimeoutError(LiteLLMUnavailableError):
+    """LiteLLM did not respond within the read timeout."""
+    pass
+
+
+async def frame_sse_events(chunks: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+    """
+    Re-frame a byte stream on SSE event boundaries (blank lines).
+    
+    Chunks ending on a boundary, the usual case, pass through without a
+    copy; a partial trailing event is held back and joined to the next
+    chunk. A final unterminated event is flushed with its terminator.
+    CRLF and CR line endings, which SSE also allows, are rewritten to LF
+    so events are always separated by b"\n\n".
+    
+    Args:
+        chunks: Raw upstream body chunks
+        
+    Yields:
+        Chunks holding one or more whole events
+    """
+    pending = b""
+    async for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+            pending = b""
+        held = b""
+        if b"\r" in chunk:
+            if chunk.endswith(b"\r"):
+                # May be the first half of a CRLF split across chunks
+                chunk, held = chunk[:-1], b"\r"
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        
+        if chunk.endswith(b"\n\n"):
+            pending = held
+            yield chunk
+            continue
+        
+        cut = chunk.rfind(b"\n\n")
+        if cut == -1:
+            pending = chunk + held
+            continue
+        pending = chunk[cut + 2:] + held
+        yield chunk[:cut + 2]
+    
+    if pending.strip():
+        yield pending.rstrip(b"\r\n") + b"\n\n"
+
+
+async def coalesce_sse_events(
+    chunks: AsyncGenerator[bytes, None],
+    max_delay: float,
+    max_bytes: int,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Batch chunks of whole SSE events into fewer, larger writes.
+    
+    A background task reads ahead from chunks. After a quiet spell the
+    next chunk is written at once, so the first token is never delayed;
+    a write following the previous one by less than max_delay is held
+    back until max_delay has passed or max_bytes are waiting, and goes
+    out together with whatever arrived meanwhile. Chunks are joined
+    whole, preserving event boundaries. Reading pauses while max_bytes
+    are waiting, and closing the generator closes chunks.
+    
+    Args:
+        chunks: Chunks holding whole SSE events (e.g. from stream_raw())
+        max_delay: Longest a chunk is held back, in seconds
+        max_bytes: Write as soon as this many bytes are waiting
+        
+    Yields:
+        One or more chunks joined
+        
+    Raises:
+        The error iterating chunks raised, once the chunks before it are out
+    """
+    loop = asyncio.get_running_loop()
+    ready: list[bytes] = []
+    size = 0
+    finished = False
+    error: Optional[Exception] = None
+    wakeup: Optional[asyncio.Future] = None
+    wake_at = 1  # Waiting bytes that wake the writer
+    drained: Optional[asyncio.Future] = None
+    
+    def wake(future: Optional[asyncio.Future]) -> None:
+        if future is not None and not future.done():
+            future.set_result(None)
+    
+    async def read() -> None:
+        nonlocal size, finished, error, drained
+        try:
+            async for chunk in chunks:
+                ready.append(chunk)
+                size += len(chunk)
+                if size >= wake_at:
+                    wake(wakeup)
+                if size >= max_bytes:
+                    drained = loop.create_future()
+                    await drained
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            wake(wakeup)
+            await chunks.aclose()
+    
+    reader = loop.create_task(read())
+    last_write = float("-inf")
+    try:
+        while True:
+            if not ready:
+                if finished:
+                    break
+                wake_at = 1
+                wakeup = loop.create_future()
+                await wakeup
+                continue
+            
+            hold = last_write + max_delay - loop.time()
+            if hold > 0 and size < max_bytes and not finished:
+                wake_at = max_bytes
+                wakeup = loop.create_future()
+                timer = loop.call_later(hold, wake, wakeup)
+                try:
+                    await wakeup
+                finally:
+                    timer.cancel()
+                continue
+            
+            data = ready[0] if len(ready) == 1 else b"".join(ready)
+            ready.clear()
+            size = 0
+            wake(drained)
+            last_write = loop.time()
+            yield data
+        
+        if error is not None:
+            raise error
+    finally:
+        reader.cancel()
+        try:
+            await reader
+        except asyncio.CancelledError:
+            pass
+
+
+class StreamUsage:
+    """
+    Token usage of a streamed completion, sniffed from framed SSE chunks.
+    
+    Deltas are never JSON-parsed: a byte search finds each "content"
+    string to total its length for the fallback estimate, and only the
+    event carrying a non-null "usage" object (the final chunk sent for
+    stream_options.include_usage) is decoded.
+    """
+    
+    __slots__ = ("usage", "content_bytes", "forward_usage")
+    
+    def __init__(self, forward_usage: bool = False):
+        """
+        Initialize usage tracking.
+        
+        Args:
+            forward_usage: Keep the usage-only event in the stream (the
+                client asked for it); otherwise it is removed
+        """
+        self.usage: Optional[dict[str, Any]] = None
+        self.content_bytes = 0
+        self.forward_usage = forward_usage
+    
+    def feed(self, chunk: bytes) -> bytes:
+        """
+        Account one chunk of whole SSE events.
+        
+        Args:
+            chunk: Framed chunk from LiteLLMClient.stream_raw()
+            
+        Returns:
+            The chunk to forward (without the usage event unless forwarded)
+        """
+        # Content lengths, skipping escaped quotes inside the string
+        pos = chunk.find(b'"content":')
+        while pos != -1:
+            start = pos + 10
+            while chunk[start:start + 1] == b" ":
+                start += 1
+            if chunk[start:start + 1] != b'"':
+                pos = chunk.find(b'"content":', start)
+                continue
+            end = chunk.find(b'"', start + 1)
+            while end != -1:
+                backslashes = 0
+                while chunk[end - 1 - backslashes] == 0x5C:
+                    backslashes += 1
+                if backslashes % 2 == 0:
+                    break
+                end = chunk.find(b'"', end + 1)
+            if end == -1:
+                break
+            self.content_bytes += end - start - 1
+            pos = chunk.find(b'"content":', end)
+        
+        # Skip the "usage": null carried by ordinary deltas, which may share
+        # the chunk with the usage event
+        pos = chunk.find(b'"usage":')
+        while pos != -1:
+            value = pos + 8
+            while chunk[value:value + 1] == b" ":
+                value += 1
+            if chunk[value:value + 1] == b"{":
+                break
+            pos = chunk.find(b'"usage":', value)
+        if pos == -1:
+            return chunk
+        
+        start = chunk.rfind(b"\n\n", 0, pos)
+        start = 0 if start == -1 else start + 2
+        end = chunk.find(b"\n\n", pos)
+        end = len(chunk) if end == -1 else end + 2
+        data = parse_sse_chunk(chunk[start:end].decode("utf-8", "replace"))
+        if data is None:
+            return chunk
+        self.usage = data.get("usage")
+        
+        if self.forward_usage or data.get("choices"):
+            return chunk
+        return chunk[:start] + chunk[end:]
+    
+    def tokens(self, prompt_estimate: int) -> tuple[int, int, bool]:
+        """
+        Get the stream's prompt and completion tokens.
+        
+        Args:
+            prompt_estimate: Local prompt token estimate for the fallback
+            
+        Returns:
+            (prompt_tokens, completion_tokens, estimated) - upstream usage if
+            it was seen, else a ~4 bytes per token estimate of the content
+        """
+        if self.usage:
+            return (
+                self.usage.get("prompt_tokens", 0) or 0,
+                self.usage.get("completion_tokens", 0) or 0,
+                False,
+            )
+        return prompt_estimate, (self.content_bytes + 3) // 4, True
+
+
+# Upstream statuses worth retrying on another model
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether an upstream error is transient.
+    
+    Args:
+        error: Exception raised by LiteLLMClient
+        
+    Returns:
+        True for unavailability and retryable status codes
+    """
+    if isinstance(error, LiteLLMUnavailableError):
+        return True
+    if isinstance(error, LiteLLMError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
 def format_sse_chunk(data: dict[str, Any]) -> str:
     """
     Format a dictionary as an SSE chunk.
@@ -40,6 +40,16 @@ class RequestLogEntry:
     status_code: int
     error_message: Optional[str] = None
     created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    completed_at: Optional[datetime] = None
+    
+    # Streaming timings (None for non-streaming requests)
+    is_streaming: bool = False
+    time_to_first_token_ms: Optional[int] = None
+    stream_duration_ms: Optional[int] = None   # First to last chunk
+    chunk_count: Optional[int] = None
+    chunk_gap_p50_ms: Optional[int] = None
+    chunk_gap_p95_ms: Optional[int] = None
+    chunk_gap_p99_ms: Optional[int] = None
     
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary for database insertion."""
@@ -57,6 +67,14 @@ class RequestLogEntry:
             "status_code": self.status_code,
             "error_message": self.error_message,
             "created_at": self.created_at.isoformat(),
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "is_streaming": self.is_streaming,
+            "time_to_first_token_ms": self.time_to_first_token_ms,
+            "stream_duration_ms": self.stream_duration_ms,
+            "chunk_count": self.chunk_count,
+            "chunk_gap_p50_ms": self.chunk_gap_p50_ms,
+            "chunk_gap_p95_ms": self.chunk_gap_p95_ms,
+            "chunk_gap_p99_ms": self.chunk_gap_p99_ms,
         }
 
 
@@ -121,6 +139,46 @@ def calculate_cost(
     return prompt_cost + completion_cost
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for text (~4 characters per token).
+    
+    Args:
+        text: Text to estimate
+        
+    Returns:
+        Estimated token count
+    """
+    return (len(text) + 3) // 4
+
+
+def estimate_request_tokens(
+    messages: list[dict[str, Any]],
+    max_tokens: Optional[int] = None,
+) -> int:
+    """
+    Estimate the worst-case tokens a request may consume.
+    
+    Args:
+        messages: Chat messages
+        max_tokens: Completion token cap
+        
+    Returns:
+        Estimated prompt tokens plus max_tokens
+    """
+    prompt_tokens = 0
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            prompt_tokens += estimate_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and isinstance(part.get("text"), str):
+                    prompt_tokens += estimate_tokens(part["text"])
+        prompt_tokens += 4  # Per-message framing overhead
+    return prompt_tokens + (max_tokens or 0)
+
+
 class AsyncLogger:
     """
     Async logger with background worker for non-blocking writes.
@@ -262,9 +320,13 @@ class AsyncLogger:
                         INSERT INTO request_logs (
                             request_id, user_id, api_key_id, stage, model,
                             prompt_tokens, completion_tokens, total_tokens,
-                            cost, latency_ms, status_code, error_message, created_at
+                            cost, latency_ms, status_code, error_message, created_at,
+                            completed_at, is_streaming, time_to_first_token_ms,
+                            stream_duration_ms, chunk_count,
+                            chunk_gap_p50_ms, chunk_gap_p95_ms, chunk_gap_p99_ms
                         ) VALUES (
-                            $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13
+                            $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13,
+                            $14, $15, $16, $17, $18, $19, $20, $21
                         )
                         """,
                         [
@@ -273,6 +335,9 @@ class AsyncLogger:
                                 e.prompt_tokens, e.completion_tokens, e.total_tokens,
                                 float(e.cost), e.latency_ms, e.status_code,
                                 e.error_message, e.created_at,
+                                e.completed_at, e.is_streaming, e.time_to_first_token_ms,
+                                e.stream_duration_ms, e.chunk_count,
+                                e.chunk_gap_p50_ms, e.chunk_gap_p95_ms, e.chunk_gap_p99_ms,
                             )
                             for e in batch
                         ],
@@ -222,7 +222,7 @@ class ChatCompletionResponse(BaseModel):
             ))
         
         usage = None
-        if "usage" in data:
+        if data.get("usage"):
             usage = Usage(**data["usage"])
         
         return cls(
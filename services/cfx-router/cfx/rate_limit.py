@@ -1,21 +1,304 @@
 """
 CF-X Router Rate Limiting Module
 
-Provides daily request rate limiting per user with atomic operations.
+Provides per-user rate limiting with atomic operations: a daily request
+quota, optional per-second/per-minute burst tiers (GCRA) and an optional
+daily token budget, configurable per plan.
 """
 
+import asyncio
 import logging
-from dataclasses import dataclass
-from datetime import date, datetime, timezone, timedelta
-from typing import Any, Optional, Tuple
+import math
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class PlanLimits:
+    """Request limits for one user plan."""
+    daily_limit: int = 1000
+    per_second: int = 0   # Burst tier (0 = disabled)
+    per_minute: int = 0   # Burst tier (0 = disabled)
+    daily_token_limit: int = 0  # Prompt + completion tokens per day (0 = disabled)
+    
+    def burst_tiers(self) -> list[tuple[str, int, float]]:
+        """Enabled burst tiers as (name, limit, period_seconds)."""
+        tiers = []
+        if self.per_second > 0:
+            tiers.append(("second", self.per_second, 1.0))
+        if self.per_minute > 0:
+            tiers.append(("minute", self.per_minute, 60.0))
+        return tiers
+
+
 @dataclass
 class RateLimitConfig:
     """Configuration for rate limiter."""
     daily_limit: int = 1000
+    per_second: int = 0                # Default burst tiers (0 = disabled)
+    per_minute: int = 0
+    daily_token_limit: int = 0         # Default token budget (0 = disabled)
+    plans: dict[str, PlanLimits] = field(default_factory=dict)  # Per-plan overrides
+    lease_size: int = 0                # Requests reserved per DB round trip (0 = per-request upsert)
+    lease_idle_timeout: float = 30.0   # Seconds before an idle lease is returned
+    reconcile_interval: float = 5.0    # Seconds between bulk lease reconciliations
+    memory_max_entries: int = 100000   # Hard cap on users tracked by the in-memory backend
+    
+    def limits_for(self, plan: Optional[str]) -> PlanLimits:
+        """
+        Get limits for a user plan.
+        
+        Args:
+            plan: Plan name (e.g. "free", "pro"), or None
+            
+        Returns:
+            The plan's limits, or the top-level defaults if not configured
+        """
+        limits = self.plans.get(plan) if plan else None
+        if limits is not None:
+            return limits
+        return PlanLimits(
+            daily_limit=self.daily_limit,
+            per_second=self.per_second,
+            per_minute=self.per_minute,
+            daily_token_limit=self.daily_token_limit,
+        )
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RateLimitConfig":
+        """
+        Create config from the `rate_limit` section of models.yaml.
+        
+        Plans inherit any limit they don't set from the top-level values.
+        """
+        daily_limit = data.get("daily_requests", 1000)
+        per_second = data.get("requests_per_second", 0)
+        per_minute = data.get("requests_per_minute", 0)
+        daily_token_limit = data.get("daily_tokens", 0)
+        
+        plans = {
+            name: PlanLimits(
+                daily_limit=plan_data.get("daily_requests", daily_limit),
+                per_second=plan_data.get("requests_per_second", per_second),
+                per_minute=plan_data.get("requests_per_minute", per_minute),
+                daily_token_limit=plan_data.get("daily_tokens", daily_token_limit),
+            )
+            for name, plan_data in (data.get("plans") or {}).items()
+        }
+        
+        return cls(
+            daily_limit=daily_limit,
+            per_second=per_second,
+            per_minute=per_minute,
+            daily_token_limit=daily_token_limit,
+            plans=plans,
+            lease_size=data.get("lease_size", 0),
+            lease_idle_timeout=data.get("lease_idle_timeout", 30.0),
+            reconcile_interval=data.get("reconcile_interval", 5.0),
+            memory_max_entries=data.get("memory_max_entries", 100000),
+        )
+
+
+@dataclass
+class RateLimitStatus:
+    """
+    Outcome of a single rate limit check.
+    
+    Carries everything needed for the X-RateLimit-* headers so callers don't
+    have to query the limiter again. Unpacks as (allowed, remaining, reset_time)
+    for backwards compatibility.
+    """
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_time: datetime
+    tier: str = "day"                    # Tier this status describes ("second", "minute", "day")
+    retry_after: Optional[float] = None  # Seconds until a denied request may succeed
+    
+    def __iter__(self) -> Iterator[Any]:
+        return iter((self.allowed, self.remaining, self.reset_time))
+    
+    def to_headers(self) -> dict[str, str]:
+        """Build X-RateLimit-* response headers."""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": self.reset_time.isoformat(),
+        }
+        if self.tier != "day":
+            headers["X-RateLimit-Tier"] = self.tier
+        if not self.allowed and self.retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+@dataclass
+class TokenReservation:
+    """
+    Tokens pre-reserved against a user's daily token budget.
+    
+    Created by RateLimiter.reserve_tokens() at admission and passed back to
+    settle_tokens() once actual usage is known.
+    """
+    user_id: str
+    day: date
+    reserved: int
+    allowed: bool
+    limit: int       # 0 if no token budget applies
+    remaining: int
+    settled: bool = False
+    
+    def to_headers(self) -> dict[str, str]:
+        """Build X-CFX-Token-* response headers."""
+        if self.limit <= 0:
+            return {}
+        return {
+            "X-CFX-Token-Limit": str(self.limit),
+            "X-CFX-Token-Remaining": str(self.remaining),
+        }
+
+
+class _CounterEntry:
+    """Compact per-user state for the in-memory backend."""
+    __slots__ = ("day", "requests", "tokens", "tat_second", "tat_minute")
+    
+    def __init__(self, day: date):
+        self.day = day
+        self.requests = 0
+        self.tokens = 0
+        self.tat_second = 0.0   # GCRA theoretical arrival times (time.monotonic())
+        self.tat_minute = 0.0
+    
+    def roll(self, day: date) -> None:
+        """Zero the daily counters if the UTC day changed."""
+        if self.day != day:
+            self.day = day
+            self.requests = 0
+            self.tokens = 0
+
+
+_TAT_SLOTS = {"second": "tat_second", "minute": "tat_minute"}
+
+
+class MemoryCounterStore:
+    """
+    Bounded LRU store of per-user counters for the in-memory backend.
+    
+    One __slots__ entry per user holds the daily request/token counters and
+    burst-tier state. Beyond `max_entries` the least recently seen user is
+    evicted (their usage is forgotten). Entries from previous days whose
+    burst state has drained are swept from the LRU end as new users arrive,
+    so memory stays proportional to recently active users.
+    """
+    
+    SWEEP_EVERY = 256   # New entries between sweeps
+    SWEEP_BATCH = 64    # Max entries examined per sweep
+    
+    def __init__(self, max_entries: int):
+        """
+        Initialize store.
+        
+        Args:
+            max_entries: Hard cap on tracked users
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, _CounterEntry] = OrderedDict()
+        self._since_sweep = 0
+        
+        # Metrics
+        self._evictions = 0
+        self._expired = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, user_id: str) -> Optional[_CounterEntry]:
+        """
+        Get a user's entry without creating it.
+        
+        Args:
+            user_id: User identifier
+            
+        Returns:
+            Entry or None
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+        return entry
+    
+    def get_or_create(self, user_id: str, day: date) -> _CounterEntry:
+        """
+        Get a user's entry for `day`, creating it (and evicting) as needed.
+        
+        Args:
+            user_id: User identifier
+            day: Current UTC day
+            
+        Returns:
+            Entry with counters rolled to `day`
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            entry.roll(day)
+            return entry
+        
+        self._since_sweep += 1
+        if self._since_sweep >= self.SWEEP_EVERY:
+            self._since_sweep = 0
+            self._sweep(day)
+        
+        entry = _CounterEntry(day)
+        self._entries[user_id] = entry
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+        
+        return entry
+    
+    def _sweep(self, day: date) -> None:
+        """Drop stale entries from the least recently used end."""
+        now = time.monotonic()
+        for _ in range(min(self.SWEEP_BATCH, len(self._entries))):
+            user_id, entry = next(iter(self._entries.items()))
+            if entry.day == day or entry.tat_second > now or entry.tat_minute > now:
+                break
+            del self._entries[user_id]
+            self._expired += 1
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get store statistics, including approximate memory use."""
+        entry_bytes = sys.getsizeof(_CounterEntry(date.min))
+        approx_bytes = sys.getsizeof(self._entries) + sum(
+            entry_bytes + sys.getsizeof(user_id) + 64  # 64: linked-list node overhead
+            for user_id in self._entries
+        )
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self._evictions,
+            "expired": self._expired,
+            "approx_bytes": approx_bytes,
+        }
+
+
+@dataclass
+class _QuotaLease:
+    """Slice of a user's daily quota reserved by this worker."""
+    day: date
+    remaining: int          # Requests this worker may still admit locally
+    db_count: int           # usage_counters.request_count right after the reservation
+    last_used: float        # time.monotonic() of last local admission
+    retry_at: float = 0.0   # When an exhausted lease may ask the database again
 
 
 class RateLimiter:
@@ -23,6 +306,24 @@ class RateLimiter:
     Rate limiter with atomic operations.
     
     Supports both PostgreSQL (production) and in-memory (development) backends.
+    
+    Burst tiers use GCRA (generic cell rate algorithm): one "theoretical
+    arrival time" per user and tier, so each check is O(1) in memory and a
+    single upsert on rate_limit_gcra in PostgreSQL. Burst tiers are checked
+    before the daily counter so a throttled burst doesn't burn daily quota.
+    
+    With `lease_size > 0` the PostgreSQL backend runs in leased mode: each
+    worker reserves up to `lease_size` requests per user in one upsert and
+    admits from that slice locally. Unused slices are returned in a single
+    bulk UPDATE when idle and on stop(). Reservations are clamped against the
+    daily limit, so the limit is never exceeded; at worst quota stranded in
+    other workers' leases (workers x lease_size) is denied until returned.
+    In leased mode burst tiers are enforced per worker in memory.
+    
+    Token budgets are enforced with reserve_tokens()/settle_tokens(): an
+    estimate is added to usage_counters.token_count at admission (one
+    conditional upsert), and the difference to actual usage is applied
+    later in a bulk UPDATE by the background task.
     """
     
     def __init__(self, config: RateLimitConfig, db_pool: Optional[Any] = None):
@@ -36,9 +337,50 @@ class RateLimiter:
         self.config = config
         self.db_pool = db_pool
         
-        # In-memory storage for development
-        self._counters: dict[str, int] = {}
-        self._last_reset: Optional[date] = None
+        # In-memory storage for development (and local burst tiers)
+        self._store = MemoryCounterStore(config.memory_max_entries)
+        self._token_deltas: dict[tuple[str, date], int] = {}
+        
+        # Leased mode state
+        self._leases: dict[str, _QuotaLease] = {}
+        self._lease_locks: dict[str, asyncio.Lock] = {}
+        self._unreturned: dict[tuple[str, date], int] = {}
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._running = False
+        self._lease_reservations = 0
+        self._lease_returns = 0
+    
+    @property
+    def leased_mode(self) -> bool:
+        """Whether quota leasing is active."""
+        return self.db_pool is not None and self.config.lease_size > 0
+    
+    async def start(self) -> None:
+        """Start background reconciliation (database backend only)."""
+        if self._running or self.db_pool is None:
+            return
+        
+        self._running = True
+        self._reconcile_task = asyncio.create_task(self._reconcile_worker())
+        if self.leased_mode:
+            logger.info(f"Rate limiter leasing {self.config.lease_size} requests per reservation")
+    
+    async def stop(self) -> None:
+        """Stop reconciliation, return unused leases and flush token usage."""
+        if not self._running:
+            return
+        
+        self._running = False
+        
+        if self._reconcile_task:
+            self._reconcile_task.cancel()
+            try:
+                await self._reconcile_task
+            except asyncio.CancelledError:
+                pass
+        
+        await self.reconcile(return_all=True)
+        await self.flush_token_usage()
     
     def _get_today_utc(self) -> date:
         """Get current UTC date."""
@@ -53,42 +395,174 @@ class RateLimiter:
             0, 0, 0, tzinfo=timezone.utc
         )
     
-    def _maybe_reset_memory(self) -> None:
-        """Reset in-memory counters if day changed."""
-        today = self._get_today_utc()
-        if self._last_reset != today:
-            self._counters.clear()
-            self._last_reset = today
-    
     async def check_and_increment(
         self,
         user_id: str,
-    ) -> Tuple[bool, int, datetime]:
+        plan: Optional[str] = None,
+    ) -> RateLimitStatus:
         """
         Check rate limit and increment counter atomically.
         
         Args:
             user_id: User identifier
+            plan: User plan for per-plan limits (optional)
             
         Returns:
-            Tuple of (allowed, remaining, reset_time)
+            RateLimitStatus for this request (the denying tier if denied,
+            otherwise the daily tier)
         """
         reset_time = self._get_reset_time()
-        limit = self.config.daily_limit
+        limits = self.config.limits_for(plan)
+        limit = limits.daily_limit
+        
+        tiers = limits.burst_tiers()
+        if tiers:
+            denied = await self._check_burst(user_id, tiers)
+            if denied is not None:
+                return denied
         
         # Use database if available
+        if self.leased_mode:
+            return await self._check_leased(user_id, limit, reset_time)
         if self.db_pool is not None:
             return await self._check_db(user_id, limit, reset_time)
         
         # Fall back to in-memory
         return await self._check_memory(user_id, limit, reset_time)
     
+    async def _check_burst(
+        self,
+        user_id: str,
+        tiers: list[tuple[str, int, float]],
+    ) -> Optional[RateLimitStatus]:
+        """
+        Check burst tiers.
+        
+        Returns:
+            RateLimitStatus for the denying tier, or None if admitted
+        """
+        if self.db_pool is not None and not self.leased_mode:
+            return await self._check_burst_db(user_id, tiers)
+        return self._check_burst_memory(user_id, tiers)
+    
+    def _check_burst_memory(
+        self,
+        user_id: str,
+        tiers: list[tuple[str, int, float]],
+    ) -> Optional[RateLimitStatus]:
+        """GCRA check for all tiers; state is only updated if every tier admits."""
+        now = time.monotonic()
+        entry = self._store.get_or_create(user_id, self._get_today_utc())
+        updates = []
+        
+        for name, limit, period in tiers:
+            interval = period / limit
+            slot = _TAT_SLOTS[name]
+            new_tat = max(getattr(entry, slot), now) + interval
+            
+            if new_tat - now > period:
+                retry_after = new_tat - now - period
+                return RateLimitStatus(
+                    allowed=False,
+                    limit=limit,
+                    remaining=0,
+                    reset_time=datetime.now(timezone.utc) + timedelta(seconds=retry_after),
+                    tier=name,
+                    retry_after=retry_after,
+                )
+            updates.append((slot, new_tat))
+        
+        for slot, new_tat in updates:
+            setattr(entry, slot, new_tat)
+        return None
+    
+    async def _check_burst_db(
+        self,
+        user_id: str,
+        tiers: list[tuple[str, int, float]],
+    ) -> Optional[RateLimitStatus]:
+        """
+        GCRA check for all tiers in one upsert on rate_limit_gcra.
+        
+        The row lock taken by ON CONFLICT DO UPDATE makes each tier atomic;
+        a tier that doesn't admit is simply not updated. Tiers that did admit
+        keep their increment even if another tier denies (slight over-count).
+        Every tier is returned with whether it admitted and how far its TAT
+        is ahead of now, from which a denied tier's retry_after follows.
+        """
+        names = [name for name, _, _ in tiers]
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    WITH now_epoch AS (
+                        SELECT EXTRACT(EPOCH FROM clock_timestamp())::float8 AS t
+                    ), admitted AS (
+                        INSERT INTO rate_limit_gcra (user_id, tier, tat, emission_interval, period)
+                        SELECT $1, t.tier, now_epoch.t + t.emission_interval,
+                               t.emission_interval, t.period
+                        FROM unnest($2::text[], $3::float8[], $4::float8[])
+                            AS t(tier, emission_interval, period),
+                            now_epoch
+                        ON CONFLICT (user_id, tier) DO UPDATE SET
+                            tat = GREATEST(
+                                rate_limit_gcra.tat,
+                                EXCLUDED.tat - EXCLUDED.emission_interval
+                            ) + EXCLUDED.emission_interval,
+                            emission_interval = EXCLUDED.emission_interval,
+                            period = EXCLUDED.period
+                        WHERE GREATEST(
+                                rate_limit_gcra.tat,
+                                EXCLUDED.tat - EXCLUDED.emission_interval
+                            ) + EXCLUDED.emission_interval
+                            - (EXCLUDED.tat - EXCLUDED.emission_interval) <= EXCLUDED.period
+                        RETURNING tier
+                    )
+                    SELECT t.tier,
+                           t.tier IN (SELECT tier FROM admitted) AS admitted,
+                           g.tat - now_epoch.t AS tat_ahead
+                    FROM unnest($2::text[]) AS t(tier)
+                    CROSS JOIN now_epoch
+                    LEFT JOIN rate_limit_gcra g ON g.user_id = $1 AND g.tier = t.tier
+                    """,
+                    user_id,
+                    names,
+                    [period / limit for _, limit, period in tiers],
+                    [period for _, _, period in tiers],
+                )
+        except Exception as e:
+            logger.error(f"Database error in burst rate limiter: {e}")
+            # On error, allow the request but log it
+            return None
+        
+        # A denied tier's row is untouched, so tat_ahead is its current TAT
+        denied = {row["tier"]: row["tat_ahead"] for row in rows if not row["admitted"]}
+        for name, limit, period in tiers:
+            if name in denied:
+                interval = period / limit
+                tat_ahead = denied[name]
+                if tat_ahead is None:
+                    retry_after = interval
+                else:
+                    # As in memory: max(TAT, now) + interval - now - period
+                    retry_after = max(0.0, max(tat_ahead, 0.0) + interval - period)
+                return RateLimitStatus(
+                    allowed=False,
+                    limit=limit,
+                    remaining=0,
+                    reset_time=datetime.now(timezone.utc) + timedelta(seconds=retry_after),
+                    tier=name,
+                    retry_after=retry_after,
+                )
+        return None
+    
     async def _check_db(
         self,
         user_id: str,
         limit: int,
         reset_time: datetime,
-    ) -> Tuple[bool, int, datetime]:
+    ) -> RateLimitStatus:
         """Check rate limit using database."""
         today = self._get_today_utc()
         
@@ -113,45 +587,339 @@ class RateLimiter:
                 allowed = current_count <= limit
                 remaining = max(0, limit - current_count)
                 
-                return (allowed, remaining, reset_time)
+                return RateLimitStatus(allowed, limit, remaining, reset_time)
                 
         except Exception as e:
             logger.error(f"Database error in rate limiter: {e}")
             # On error, allow the request but log it
-            return (True, limit, reset_time)
+            return RateLimitStatus(True, limit, limit, reset_time)
+    
+    async def _check_leased(
+        self,
+        user_id: str,
+        limit: int,
+        reset_time: datetime,
+    ) -> RateLimitStatus:
+        """Check rate limit against a locally held quota lease."""
+        today = self._get_today_utc()
+        lease = self._leases.get(user_id)
+        
+        if not self._lease_usable(lease, today):
+            lock = self._lease_locks.setdefault(user_id, asyncio.Lock())
+            async with lock:
+                # Another request may have refilled the lease while we waited
+                lease = self._leases.get(user_id)
+                if not self._lease_usable(lease, today):
+                    lease = await self._reserve_lease(user_id, today, limit)
+            
+            if lease is None:
+                # On error, allow the request but log it
+                return RateLimitStatus(True, limit, limit, reset_time)
+        
+        if lease.remaining <= 0:
+            return RateLimitStatus(False, limit, 0, reset_time)
+        
+        lease.remaining -= 1
+        lease.last_used = time.monotonic()
+        remaining = max(0, limit - (lease.db_count - lease.remaining))
+        return RateLimitStatus(True, limit, remaining, reset_time)
+    
+    def _lease_usable(self, lease: Optional[_QuotaLease], today: date) -> bool:
+        """Whether a lease can answer locally (admit, or deny during back-off)."""
+        if lease is None or lease.day != today:
+            return False
+        return lease.remaining > 0 or time.monotonic() < lease.retry_at
+    
+    async def _reserve_lease(
+        self,
+        user_id: str,
+        today: date,
+        limit: int,
+    ) -> Optional[_QuotaLease]:
+        """Reserve a quota slice with a single upsert."""
+        size = self.config.lease_size
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO usage_counters (user_id, day, request_count)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (user_id, day)
+                    DO UPDATE SET 
+                        request_count = usage_counters.request_count + $3,
+                        updated_at = NOW()
+                    RETURNING request_count
+                    """,
+                    user_id,
+                    today,
+                    size,
+                )
+        except Exception as e:
+            logger.error(f"Database error reserving quota lease: {e}")
+            return None
+        
+        self._lease_reservations += 1
+        db_count = row["request_count"]
+        
+        # Only the part of the reservation that fits under the limit is usable
+        granted = max(0, min(size, limit - (db_count - size)))
+        if granted < size:
+            key = (user_id, today)
+            self._unreturned[key] = self._unreturned.get(key, 0) + size - granted
+        
+        now = time.monotonic()
+        lease = _QuotaLease(
+            day=today,
+            remaining=granted,
+            db_count=db_count,
+            last_used=now,
+            retry_at=now + self.config.reconcile_interval if granted == 0 else 0.0,
+        )
+        self._leases[user_id] = lease
+        return lease
+    
+    async def _reconcile_worker(self) -> None:
+        """Background worker that returns idle leases and flushes token usage."""
+        while self._running:
+            try:
+                await asyncio.sleep(self.config.reconcile_interval)
+                await self.reconcile()
+                await self.flush_token_usage()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Rate limiter reconcile error: {e}")
+    
+    async def reconcile(self, return_all: bool = False) -> int:
+        """
+        Return unused lease capacity to usage_counters in one bulk UPDATE.
+        
+        Args:
+            return_all: Return every lease, not just idle ones (shutdown)
+            
+        Returns:
+            Number of requests returned
+        """
+        if self.db_pool is None:
+            return 0
+        
+        today = self._get_today_utc()
+        cutoff = time.monotonic() - self.config.lease_idle_timeout
+        returns, self._unreturned = self._unreturned, {}
+        
+        for user_id, lease in list(self._leases.items()):
+            if lease.day != today:
+                # Yesterday's counter no longer matters
+                del self._leases[user_id]
+            elif return_all or lease.last_used < cutoff:
+                del self._leases[user_id]
+                if lease.remaining > 0:
+                    key = (user_id, lease.day)
+                    returns[key] = returns.get(key, 0) + lease.remaining
+        
+        for user_id in list(self._lease_locks):
+            if user_id not in self._leases and not self._lease_locks[user_id].locked():
+                del self._lease_locks[user_id]
+        
+        returns = {key: n for key, n in returns.items() if key[1] == today}
+        if not returns:
+            return 0
+        
+        keys = list(returns.keys())
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE usage_counters AS u
+                    SET request_count = GREATEST(0, u.request_count - v.n),
+                        updated_at = NOW()
+                    FROM unnest($1::uuid[], $2::date[], $3::int[]) AS v(user_id, day, n)
+                    WHERE u.user_id = v.user_id AND u.day = v.day
+                    """,
+                    [user_id for user_id, _ in keys],
+                    [day for _, day in keys],
+                    [returns[key] for key in keys],
+                )
+        except Exception as e:
+            logger.error(f"Database error returning quota leases: {e}")
+            # Keep them for the next reconciliation
+            for key, n in returns.items():
+                self._unreturned[key] = self._unreturned.get(key, 0) + n
+            return 0
+        
+        returned = sum(returns.values())
+        self._lease_returns += returned
+        return returned
+    
+    async def reserve_tokens(
+        self,
+        user_id: str,
+        estimated_tokens: int,
+        plan: Optional[str] = None,
+    ) -> TokenReservation:
+        """
+        Reserve estimated tokens against the daily token budget.
+        
+        Args:
+            user_id: User identifier
+            estimated_tokens: Prompt estimate plus max_tokens
+            plan: User plan for per-plan limits (optional)
+            
+        Returns:
+            TokenReservation (allowed=False if the budget can't cover it)
+        """
+        today = self._get_today_utc()
+        limit = self.config.limits_for(plan).daily_token_limit
+        estimated_tokens = max(0, estimated_tokens)
+        
+        if limit <= 0:
+            # No budget: nothing to reserve or settle
+            return TokenReservation(user_id, today, 0, True, 0, 0, settled=True)
+        
+        if estimated_tokens > limit:
+            return TokenReservation(user_id, today, 0, False, limit, 0, settled=True)
+        
+        if self.db_pool is None:
+            entry = self._store.get_or_create(user_id, today)
+            used = entry.tokens
+            if used + estimated_tokens > limit:
+                return TokenReservation(
+                    user_id, today, 0, False, limit, max(0, limit - used), settled=True
+                )
+            entry.tokens = used + estimated_tokens
+            return TokenReservation(
+                user_id, today, estimated_tokens, True, limit,
+                limit - used - estimated_tokens,
+            )
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                # Conditional upsert: only reserves if the budget covers it
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO usage_counters (user_id, day, request_count, token_count)
+                    VALUES ($1, $2, 0, $3)
+                    ON CONFLICT (user_id, day)
+                    DO UPDATE SET 
+                        token_count = usage_counters.token_count + $3,
+                        updated_at = NOW()
+                    WHERE usage_counters.token_count + $3 <= $4
+                    RETURNING token_count
+                    """,
+                    user_id,
+                    today,
+                    estimated_tokens,
+                    limit,
+                )
+        except Exception as e:
+            logger.error(f"Database error reserving tokens: {e}")
+            # On error, allow the request but log it
+            return TokenReservation(user_id, today, 0, True, limit, limit, settled=True)
+        
+        if row is None:
+            return TokenReservation(user_id, today, 0, False, limit, 0, settled=True)
+        
+        return TokenReservation(
+            user_id, today, estimated_tokens, True, limit,
+            max(0, limit - row["token_count"]),
+        )
+    
+    def settle_tokens(self, reservation: TokenReservation, actual_tokens: int) -> None:
+        """
+        Replace a reservation's estimate with actual usage. O(1), no I/O.
+        
+        Args:
+            reservation: Reservation from reserve_tokens()
+            actual_tokens: Actual prompt + completion tokens (0 to refund)
+        """
+        if reservation.settled:
+            return
+        reservation.settled = True
+        
+        delta = max(0, actual_tokens) - reservation.reserved
+        if delta == 0:
+            return
+        
+        if self.db_pool is None:
+            entry = self._store.get(reservation.user_id)
+            if entry is not None and entry.day == reservation.day:
+                entry.tokens = max(0, entry.tokens + delta)
+            return
+        
+        key = (reservation.user_id, reservation.day)
+        self._token_deltas[key] = self._token_deltas.get(key, 0) + delta
+    
+    async def flush_token_usage(self) -> int:
+        """
+        Apply pending token settlements in one bulk UPDATE.
+        
+        Returns:
+            Number of (user, day) counters updated
+        """
+        if self.db_pool is None or not self._token_deltas:
+            return 0
+        
+        deltas, self._token_deltas = self._token_deltas, {}
+        keys = [key for key, delta in deltas.items() if delta != 0]
+        if not keys:
+            return 0
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE usage_counters AS u
+                    SET token_count = GREATEST(0, u.token_count + v.delta),
+                        updated_at = NOW()
+                    FROM unnest($1::uuid[], $2::date[], $3::bigint[]) AS v(user_id, day, delta)
+                    WHERE u.user_id = v.user_id AND u.day = v.day
+                    """,
+                    [user_id for user_id, _ in keys],
+                    [day for _, day in keys],
+                    [deltas[key] for key in keys],
+                )
+        except Exception as e:
+            logger.error(f"Database error settling token usage: {e}")
+            for key in keys:
+                self._token_deltas[key] = self._token_deltas.get(key, 0) + deltas[key]
+            return 0
+        
+        return len(keys)
     
     async def _check_memory(
         self,
         user_id: str,
         limit: int,
         reset_time: datetime,
-    ) -> Tuple[bool, int, datetime]:
+    ) -> RateLimitStatus:
         """Check rate limit using in-memory storage."""
-        self._maybe_reset_memory()
-        
-        current = self._counters.get(user_id, 0) + 1
-        self._counters[user_id] = current
+        entry = self._store.get_or_create(user_id, self._get_today_utc())
+        entry.requests += 1
+        current = entry.requests
         
         allowed = current <= limit
         remaining = max(0, limit - current)
         
-        return (allowed, remaining, reset_time)
+        return RateLimitStatus(allowed, limit, remaining, reset_time)
     
     async def get_status(
         self,
         user_id: str,
-    ) -> Tuple[int, int, datetime]:
+        plan: Optional[str] = None,
+    ) -> tuple[int, int, datetime]:
         """
-        Get current rate limit status without incrementing.
+        Get current daily rate limit status without incrementing.
         
         Args:
             user_id: User identifier
+            plan: User plan for per-plan limits (optional)
             
         Returns:
             Tuple of (current_count, remaining, reset_time)
         """
         reset_time = self._get_reset_time()
-        limit = self.config.daily_limit
+        limit = self.config.limits_for(plan).daily_limit
         
         if self.db_pool is not None:
             today = self._get_today_utc()
@@ -170,9 +938,15 @@ class RateLimiter:
             except Exception as e:
                 logger.error(f"Database error getting status: {e}")
                 current = 0
+            
+            # Capacity leased by this worker but not yet used isn't usage
+            lease = self._leases.get(user_id)
+            if lease is not None and lease.day == today:
+                current = max(0, current - lease.remaining)
         else:
-            self._maybe_reset_memory()
-            current = self._counters.get(user_id, 0)
+            entry = self._store.get(user_id)
+            today = self._get_today_utc()
+            current = entry.requests if entry is not None and entry.day == today else 0
         
         remaining = max(0, limit - current)
         return (current, remaining, reset_time)
@@ -186,6 +960,7 @@ class RateLimiter:
         """
         if self.db_pool is not None:
             today = self._get_today_utc()
+            self._leases.pop(user_id, None)
             try:
                 async with self.db_pool.acquire() as conn:
                     await conn.execute(
@@ -200,6 +975,21 @@ class RateLimiter:
             except Exception as e:
                 logger.error(f"Database error resetting usage: {e}")
         else:
-            self._maybe_reset_memory()
-            if user_id in self._counters:
-                self._counters[user_id] = 0
+            entry = self._store.get(user_id)
+            if entry is not None:
+                entry.requests = 0
+                entry.tat_second = 0.0
+                entry.tat_minute = 0.0
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get rate limiter statistics."""
+        return {
+            "backend": "leased" if self.leased_mode else ("db" if self.db_pool else "memory"),
+            "daily_limit": self.config.daily_limit,
+            "active_leases": len(self._leases),
+            "leased_unused": sum(lease.remaining for lease in self._leases.values()),
+            "lease_reservations": self._lease_reservations,
+            "lease_returns": self._lease_returns,
+            "pending_token_settlements": len(self._token_deltas),
+            "memory_store": self._store.get_stats(),
+        }
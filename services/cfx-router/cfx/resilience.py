@@ -4,12 +4,11 @@ CF-X Router Resilience Module
 Provides circuit breaker pattern for handling upstream failures.
 """
 
-import asyncio
 import logging
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
-from typing import Any, Callable, TypeVar, Optional
+from typing import Any, Awaitable, Callable, TypeVar, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -23,12 +22,134 @@ class CircuitState(str, Enum):
     HALF_OPEN = "half_open"  # Testing if service recovered
 
 
+class CircuitMode(str, Enum):
+    """How a closed circuit decides to open."""
+    CONSECUTIVE = "consecutive"  # After failure_threshold failures in a row
+    RATE = "rate"                # On failure / slow-call rate over a rolling window
+
+
 @dataclass
 class CircuitBreakerConfig:
     """Configuration for circuit breaker."""
     failure_threshold: int = 5      # Consecutive failures before opening
     recovery_timeout: float = 30.0  # Seconds before trying half-open
     half_open_max_calls: int = 1    # Max calls in half-open state
+    
+    # Rate mode
+    mode: CircuitMode = CircuitMode.CONSECUTIVE
+    window_seconds: float = 60.0          # Rolling window length
+    window_buckets: int = 10              # Ring-buffer buckets in the window
+    minimum_calls: int = 20               # Calls in window before rates count
+    failure_rate_threshold: float = 0.5   # Open at this failure fraction
+    slow_call_duration: float = 0.0       # Seconds; 0 disables slow-call tracking
+    slow_call_rate_threshold: float = 0.5 # Open at this slow-call fraction
+    
+    @classmethod
+    def from_dict(
+        cls,
+        data: dict[str, Any],
+        base: Optional["CircuitBreakerConfig"] = None,
+    ) -> "CircuitBreakerConfig":
+        """
+        Build config from a models.yaml circuit_breaker section.
+        
+        Args:
+            data: Settings keyed by field name (unknown keys are ignored)
+            base: Config supplying values missing from data
+            
+        Returns:
+            CircuitBreakerConfig instance
+        """
+        base = base or cls()
+        values = {
+            f.name: data.get(f.name, getattr(base, f.name))
+            for f in fields(cls)
+        }
+        values["mode"] = CircuitMode(values["mode"])
+        return cls(**values)
+
+
+class SlidingWindow:
+    """
+    Call outcomes over a rolling time window.
+    
+    A ring buffer of fixed-width buckets with running totals. Recording
+    clears only the buckets that expired since the last record, so both
+    updates and rate reads are O(1) amortized.
+    """
+    
+    def __init__(self, window_seconds: float, buckets: int):
+        """
+        Initialize sliding window.
+        
+        Args:
+            window_seconds: Window length in seconds
+            buckets: Number of buckets the window is split into
+        """
+        self.size = max(1, buckets)
+        self.bucket_width = window_seconds / self.size
+        self._calls = [0] * self.size
+        self._failures = [0] * self.size
+        self._slow = [0] * self.size
+        self._head: Optional[int] = None  # Absolute index of the newest bucket
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+    
+    def _advance(self, now: float) -> int:
+        """Expire buckets older than the window and return the current slot."""
+        index = int(now / self.bucket_width)
+        
+        if self._head is None or index - self._head >= self.size:
+            self.reset()
+        else:
+            for stale in range(self._head + 1, index + 1):
+                slot = stale % self.size
+                self.calls -= self._calls[slot]
+                self.failures -= self._failures[slot]
+                self.slow_calls -= self._slow[slot]
+                self._calls[slot] = self._failures[slot] = self._slow[slot] = 0
+        
+        if self._head is None or index > self._head:
+            self._head = index
+        return self._head % self.size
+    
+    def record(self, failed: bool, slow: bool, now: Optional[float] = None) -> None:
+        """
+        Record a call outcome.
+        
+        Args:
+            failed: Whether the call failed
+            slow: Whether the call exceeded the slow-call duration
+            now: Monotonic timestamp (defaults to now)
+        """
+        slot = self._advance(time.monotonic() if now is None else now)
+        self._calls[slot] += 1
+        self.calls += 1
+        if failed:
+            self._failures[slot] += 1
+            self.failures += 1
+        if slow:
+            self._slow[slot] += 1
+            self.slow_calls += 1
+    
+    @property
+    def failure_rate(self) -> float:
+        """Fraction of calls in the window that failed."""
+        return self.failures / self.calls if self.calls else 0.0
+    
+    @property
+    def slow_call_rate(self) -> float:
+        """Fraction of calls in the window that were slow."""
+        return self.slow_calls / self.calls if self.calls else 0.0
+    
+    def reset(self) -> None:
+        """Forget all recorded calls."""
+        for counts in (self._calls, self._failures, self._slow):
+            for i in range(self.size):
+                counts[i] = 0
+        self._head = None
+        self.calls = self.failures = self.slow_calls = 0
 
 
 class CircuitBreaker:
@@ -41,10 +162,17 @@ class CircuitBreaker:
     - HALF_OPEN: Testing if service recovered, limited requests allowed
     
     Transitions:
-    - CLOSED → OPEN: After `failure_threshold` consecutive failures
+    - CLOSED → OPEN: After `failure_threshold` consecutive failures, or in
+      rate mode once the window holds `minimum_calls` calls and the failure
+      or slow-call rate reaches its threshold
     - OPEN → HALF_OPEN: After `recovery_timeout` seconds
     - HALF_OPEN → CLOSED: On successful request
     - HALF_OPEN → OPEN: On failed request
+    
+    Lock-free: no method awaits between reading and updating state, so
+    every call is atomic on the event loop. In the CLOSED state (nearly
+    every request) can_execute and record_success are a single attribute
+    check; only transitions take the slow path.
     """
     
     def __init__(self, config: CircuitBreakerConfig, name: str = "default"):
@@ -62,7 +190,9 @@ class CircuitBreaker:
         self._failure_count = 0
         self._last_failure_time: Optional[float] = None
         self._half_open_calls = 0
-        self._lock = asyncio.Lock()
+        self._window: Optional[SlidingWindow] = None
+        if config.mode == CircuitMode.RATE:
+            self._window = SlidingWindow(config.window_seconds, config.window_buckets)
     
     @property
     def state(self) -> CircuitState:
@@ -84,7 +214,7 @@ class CircuitBreaker:
         """Check if circuit is half-open (testing recovery)."""
         return self._state == CircuitState.HALF_OPEN
     
-    async def _check_state_transition(self) -> None:
+    def _check_state_transition(self) -> None:
         """Check if state should transition based on time."""
         if self._state == CircuitState.OPEN:
             if self._last_failure_time is not None:
@@ -104,51 +234,115 @@ class CircuitBreaker:
         Returns:
             True if request should proceed, False if circuit is open
         """
-        async with self._lock:
-            await self._check_state_transition()
-            
-            if self._state == CircuitState.CLOSED:
+        # Fast path
+        if self._state is CircuitState.CLOSED:
+            return True
+        
+        return self._can_execute_slow()
+    
+    def _can_execute_slow(self) -> bool:
+        """Admission check for the OPEN and HALF_OPEN states."""
+        self._check_state_transition()
+        
+        if self._state == CircuitState.CLOSED:
+            return True
+        
+        if self._state == CircuitState.HALF_OPEN:
+            if self._half_open_calls < self.config.half_open_max_calls:
+                self._half_open_calls += 1
                 return True
-            
-            if self._state == CircuitState.HALF_OPEN:
-                if self._half_open_calls < self.config.half_open_max_calls:
-                    self._half_open_calls += 1
-                    return True
-                return False
-            
-            # OPEN state
             return False
+        
+        # OPEN state
+        return False
     
-    async def record_success(self) -> None:
-        """Record a successful request."""
-        async with self._lock:
-            if self._state == CircuitState.HALF_OPEN:
-                logger.info(f"Circuit '{self.name}' transitioning from HALF_OPEN to CLOSED")
-                self._state = CircuitState.CLOSED
-            
-            self._failure_count = 0
+    async def record_success(self, duration: Optional[float] = None) -> None:
+        """
+        Record a successful request.
+        
+        Args:
+            duration: Call duration in seconds, for slow-call tracking
+        """
+        # Fast path
+        if self._state is CircuitState.CLOSED:
+            if self._window is not None:
+                self._record_in_window(False, duration)
+            if self._failure_count:
+                self._failure_count = 0
+            return
+        
+        if self._state == CircuitState.HALF_OPEN:
+            logger.info(f"Circuit '{self.name}' transitioning from HALF_OPEN to CLOSED")
+            self._state = CircuitState.CLOSED
+        
+        self._failure_count = 0
     
-    async def record_failure(self) -> None:
-        """Record a failed request."""
-        async with self._lock:
-            self._failure_count += 1
-            self._last_failure_time = time.monotonic()
-            
-            if self._state == CircuitState.HALF_OPEN:
+    async def record_failure(self, duration: Optional[float] = None) -> None:
+        """
+        Record a failed request.
+        
+        Args:
+            duration: Call duration in seconds, for slow-call tracking
+        """
+        self._failure_count += 1
+        self._last_failure_time = time.monotonic()
+        
+        if self._state == CircuitState.HALF_OPEN:
+            logger.warning(
+                f"Circuit '{self.name}' transitioning from HALF_OPEN to OPEN "
+                f"(test request failed)"
+            )
+            self._state = CircuitState.OPEN
+            self._half_open_calls = 0
+        
+        elif self._state == CircuitState.CLOSED:
+            if self._window is not None:
+                self._record_in_window(True, duration)
+            elif self._failure_count >= self.config.failure_threshold:
                 logger.warning(
-                    f"Circuit '{self.name}' transitioning from HALF_OPEN to OPEN "
-                    f"(test request failed)"
+                    f"Circuit '{self.name}' transitioning from CLOSED to OPEN "
+                    f"after {self._failure_count} consecutive failures"
                 )
                 self._state = CircuitState.OPEN
-                self._half_open_calls = 0
-            
-            elif self._state == CircuitState.CLOSED:
-                if self._failure_count >= self.config.failure_threshold:
-                    logger.warning(
-                        f"Circuit '{self.name}' transitioning from CLOSED to OPEN "
-                        f"after {self._failure_count} consecutive failures"
-                    )
-                    self._state = CircuitState.OPEN
+    
+    async def record_cancelled(self) -> None:
+        """
+        Record an admitted request that was cancelled before it finished.
+        
+        A cancellation says nothing about the service's health, so no
+        outcome is counted, but a HALF_OPEN probe gives back its slot so
+        the next request can test recovery instead.
+        """
+        if self._state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+    
+    def _record_in_window(self, failed: bool, duration: Optional[float]) -> None:
+        """Record a CLOSED-state outcome and open on excessive rates."""
+        window = self._window
+        slow = (
+            self.config.slow_call_duration > 0
+            and duration is not None
+            and duration >= self.config.slow_call_duration
+        )
+        window.record(failed, slow)
+        
+        if window.calls < self.config.minimum_calls:
+            return
+        
+        if window.failure_rate >= self.config.failure_rate_threshold:
+            reason = f"failure rate {window.failure_rate:.0%}"
+        elif slow and window.slow_call_rate >= self.config.slow_call_rate_threshold:
+            reason = f"slow-call rate {window.slow_call_rate:.0%}"
+        else:
+            return
+        
+        logger.warning(
+            f"Circuit '{self.name}' transitioning from CLOSED to OPEN "
+            f"({reason} over {window.calls} calls)"
+        )
+        self._state = CircuitState.OPEN
+        self._last_failure_time = time.monotonic()
+        window.reset()
     
     async def execute(
         self,
@@ -176,28 +370,34 @@ class CircuitBreaker:
                 f"Circuit '{self.name}' is open, request rejected"
             )
         
+        started = time.monotonic()
         try:
             result = await func(*args, **kwargs)
-            await self.record_success()
+            await self.record_success(time.monotonic() - started)
             return result
         except Exception as e:
-            await self.record_failure()
+            await self.record_failure(time.monotonic() - started)
+            raise
+        except BaseException:
+            await self.record_cancelled()
             raise
     
     async def reset(self) -> None:
         """Reset circuit breaker to closed state."""
-        async with self._lock:
-            self._state = CircuitState.CLOSED
-            self._failure_count = 0
-            self._last_failure_time = None
-            self._half_open_calls = 0
-            logger.info(f"Circuit '{self.name}' reset to CLOSED")
+        self._state = CircuitState.CLOSED
+        self._failure_count = 0
+        self._last_failure_time = None
+        self._half_open_calls = 0
+        if self._window is not None:
+            self._window.reset()
+        logger.info(f"Circuit '{self.name}' reset to CLOSED")
     
     def get_stats(self) -> dict[str, Any]:
         """Get circuit breaker statistics."""
-        return {
+        stats = {
             "name": self.name,
             "state": self._state.value,
+            "mode": self.config.mode.value,
             "failure_count": self._failure_count,
             "last_failure_time": self._last_failure_time,
             "config": {
@@ -205,6 +405,20 @@ class CircuitBreaker:
                 "recovery_timeout": self.config.recovery_timeout,
             },
         }
+        if self._window is not None:
+            stats["window"] = {
+                "calls": self._window.calls,
+                "failure_rate": round(self._window.failure_rate, 4),
+                "slow_call_rate": round(self._window.slow_call_rate, 4),
+            }
+            stats["config"].update({
+                "window_seconds": self.config.window_seconds,
+                "minimum_calls": self.config.minimum_calls,
+                "failure_rate_threshold": self.config.failure_rate_threshold,
+                "slow_call_duration": self.config.slow_call_duration,
+                "slow_call_rate_threshold": self.config.slow_call_rate_threshold,
+            })
+        return stats
 
 
 class CircuitOpenError(Exception):
@@ -212,6 +426,11 @@ class CircuitOpenError(Exception):
     pass
 
 
+class AllCircuitsOpenError(CircuitOpenError):
+    """Raised when every candidate's circuit breaker is open."""
+    pass
+
+
 class CircuitBreakerRegistry:
     """
     Registry for managing multiple circuit breakers.
@@ -219,16 +438,42 @@ class CircuitBreakerRegistry:
     Useful for having separate circuits for different services/models.
     """
     
-    def __init__(self, default_config: Optional[CircuitBreakerConfig] = None):
+    def __init__(
+        self,
+        default_config: Optional[CircuitBreakerConfig] = None,
+        configs: Optional[dict[str, CircuitBreakerConfig]] = None,
+    ):
         """
         Initialize registry.
         
         Args:
             default_config: Default config for new circuit breakers
+            configs: Per-name configs overriding the default
         """
         self.default_config = default_config or CircuitBreakerConfig()
+        self.configs = configs or {}
         self._breakers: dict[str, CircuitBreaker] = {}
-        self._lock = asyncio.Lock()
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "CircuitBreakerRegistry":
+        """
+        Build a registry from the models.yaml circuit_breaker section.
+        
+        Top-level keys configure every breaker; entries under "models"
+        override them for one model.
+        
+        Args:
+            data: circuit_breaker section
+            
+        Returns:
+            CircuitBreakerRegistry instance
+        """
+        default_config = CircuitBreakerConfig.from_dict(data)
+        configs = {
+            name: CircuitBreakerConfig.from_dict(overrides or {}, base=default_config)
+            for name, overrides in data.get("models", {}).items()
+        }
+        return cls(default_config, configs)
     
     async def get(self, name: str) -> CircuitBreaker:
         """
@@ -240,13 +485,74 @@ class CircuitBreakerRegistry:
         Returns:
             CircuitBreaker instance
         """
-        async with self._lock:
-            if name not in self._breakers:
-                self._breakers[name] = CircuitBreaker(
-                    config=self.default_config,
-                    name=name,
-                )
-            return self._breakers[name]
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                config=self.configs.get(name, self.default_config),
+                name=name,
+            )
+            self._breakers[name] = breaker
+        return breaker
+    
+    async def execute_with_fallback(
+        self,
+        names: list[str],
+        func: Callable[[str], Awaitable[T]],
+        is_retryable: Callable[[Exception], bool] = lambda e: True,
+    ) -> tuple[T, str]:
+        """
+        Execute func against the first available candidate, failing over.
+        
+        Candidates whose circuit is open are skipped. A retryable error
+        counts as a failure of that candidate's circuit and moves on to the
+        next one; a non-retryable error means the candidate responded, so
+        it counts as a success and is raised as-is.
+        
+        Args:
+            names: Candidate names in preference order (e.g. models)
+            func: Async function called with the candidate name
+            is_retryable: Whether an error should fail over
+            
+        Returns:
+            Tuple of (result, name of the candidate that produced it)
+            
+        Raises:
+            AllCircuitsOpenError: If no candidate's circuit allowed a call
+            Exception: The last retryable error, or any non-retryable error
+        """
+        last_error: Optional[Exception] = None
+        
+        for name in names:
+            breaker = await self.get(name)
+            if not await breaker.can_execute():
+                continue
+            
+            started = time.monotonic()
+            try:
+                result = await func(name)
+            except Exception as e:
+                if not is_retryable(e):
+                    await breaker.record_success(time.monotonic() - started)
+                    raise
+                await breaker.record_failure(time.monotonic() - started)
+                last_error = e
+                logger.warning(f"Circuit '{name}' call failed, trying next candidate: {e}")
+                continue
+            except BaseException:
+                # Cancelled mid-call, e.g. the client disconnected
+                await breaker.record_cancelled()
+                raise
+            
+            await breaker.record_success(time.monotonic() - started)
+            if name != names[0]:
+                logger.info(f"Served by fallback '{name}' instead of '{names[0]}'")
+            return result, name
+        
+        if last_error is not None:
+            raise last_error
+        raise AllCircuitsOpenError(
+            f"All circuits open: {', '.join(names)}"
+        )
     
     async def get_all_stats(self) -> list[dict[str, Any]]:
         """Get statistics for all circuit breakers."""
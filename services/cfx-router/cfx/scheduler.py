@@ -0,0 +1,365 @@
+"""
+CF-X Router Request Scheduler Module
+
+Weighted fair queuing of admitted requests in front of LiteLLM, so bulk
+traffic (e.g. REVIEW batch jobs) cannot starve interactive PLAN/CODE work.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Class dimensions, in the order they appear in a class name
+DIMENSIONS = ("stage", "plan", "mode")
+
+
+@dataclass
+class SchedulerConfig:
+    """Configuration for the request scheduler."""
+    enabled: bool = False
+    max_concurrent: int = 64       # Requests in flight to LiteLLM, all classes
+    max_queue_depth: int = 1000    # Waiting requests, all classes
+    max_wait: float = 30.0         # Seconds a request may wait for dispatch
+    
+    # Relative share per dimension value; a class's weight is the product
+    # of its stage, plan and mode weights (unlisted values weigh 1.0)
+    stage_weights: dict[str, float] = field(default_factory=lambda: {
+        "plan": 4.0, "code": 4.0, "review": 1.0, "direct": 2.0,
+    })
+    plan_weights: dict[str, float] = field(default_factory=dict)
+    mode_weights: dict[str, float] = field(default_factory=lambda: {
+        "stream": 2.0, "non_stream": 1.0,
+    })
+    
+    # Max requests in flight per dimension value (unlisted = unbounded)
+    stage_budgets: dict[str, int] = field(default_factory=dict)
+    plan_budgets: dict[str, int] = field(default_factory=dict)
+    mode_budgets: dict[str, int] = field(default_factory=dict)
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SchedulerConfig":
+        """
+        Build config from the models.yaml scheduler section.
+        
+        Args:
+            data: Scheduler settings (weights/budgets nested by dimension)
+        
+        Returns:
+            SchedulerConfig instance
+        """
+        defaults = cls()
+        weights = data.get("weights", {})
+        budgets = data.get("budgets", {})
+        
+        return cls(
+            enabled=data.get("enabled", False),
+            max_concurrent=data.get("max_concurrent", defaults.max_concurrent),
+            max_queue_depth=data.get("max_queue_depth", defaults.max_queue_depth),
+            max_wait=data.get("max_wait", defaults.max_wait),
+            stage_weights=weights.get("stage", defaults.stage_weights),
+            plan_weights=weights.get("plan", defaults.plan_weights),
+            mode_weights=weights.get("mode", defaults.mode_weights),
+            stage_budgets=budgets.get("stage", {}),
+            plan_budgets=budgets.get("plan", {}),
+            mode_budgets=budgets.get("mode", {}),
+        )
+
+
+@dataclass(frozen=True)
+class RequestClass:
+    """Scheduling class of a request."""
+    stage: str
+    plan: str
+    mode: str  # stream | non_stream
+    
+    @property
+    def name(self) -> str:
+        """Class name, e.g. "code/pro/stream"."""
+        return f"{self.stage}/{self.plan}/{self.mode}"
+
+
+class _Waiter:
+    """A queued request awaiting dispatch."""
+    
+    __slots__ = ("future", "finish", "enqueued_at")
+    
+    def __init__(self, future: asyncio.Future, finish: float):
+        self.future = future
+        self.finish = finish
+        self.enqueued_at = time.monotonic()
+
+
+class _ClassState:
+    """Queue and counters of one request class."""
+    
+    __slots__ = (
+        "weight", "queue", "last_finish", "in_flight",
+        "admitted", "rejected", "timeouts", "wait_total", "wait_max", "waited",
+    )
+    
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.queue: deque[_Waiter] = deque()
+        self.last_finish = 0.0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waited = 0
+
+
+class RequestScheduler:
+    """
+    Weighted fair queuing scheduler with per-class concurrency budgets.
+    
+    Requests are classified by stage, user plan and stream mode. While
+    capacity is free and the class is within its budgets a request is
+    admitted at once; otherwise it queues with a virtual finish tag of
+    start + 1/weight, and each freed slot goes to the dispatchable class
+    whose head has the smallest tag. Over time each backlogged class gets
+    a share of dispatches proportional to its weight.
+    
+    Like ConcurrencyLimiter, all bookkeeping happens without awaits and
+    slots are handed directly to waiters, so it needs no locks.
+    """
+    
+    def __init__(self, config: SchedulerConfig):
+        """
+        Initialize request scheduler.
+        
+        Args:
+            config: Scheduler configuration
+        """
+        self.config = config
+        self._classes: dict[RequestClass, _ClassState] = {}
+        self._budgets = {
+            "stage": config.stage_budgets,
+            "plan": config.plan_budgets,
+            "mode": config.mode_budgets,
+        }
+        self._dim_in_flight: dict[tuple[str, str], int] = {}
+        self._in_flight = 0
+        self._queued = 0
+        self._virtual_time = 0.0
+        self._peak_in_flight = 0
+    
+    def classify(self, stage: str, plan: Optional[str], streaming: bool) -> RequestClass:
+        """
+        Build the scheduling class of a request.
+        
+        Args:
+            stage: Routing stage value (plan, code, review, direct)
+            plan: User plan, None for the default plan
+            streaming: Whether the request streams
+        
+        Returns:
+            RequestClass
+        """
+        return RequestClass(
+            stage=stage,
+            plan=plan or "default",
+            mode="stream" if streaming else "non_stream",
+        )
+    
+    def weight(self, request_class: RequestClass) -> float:
+        """
+        Get the scheduling weight of a class.
+        
+        Args:
+            request_class: Request class
+        
+        Returns:
+            Product of the stage, plan and mode weights
+        """
+        return (
+            self.config.stage_weights.get(request_class.stage, 1.0)
+            * self.config.plan_weights.get(request_class.plan, 1.0)
+            * self.config.mode_weights.get(request_class.mode, 1.0)
+        )
+    
+    def _state(self, request_class: RequestClass) -> _ClassState:
+        """Get or create the state of a class."""
+        state = self._classes.get(request_class)
+        if state is None:
+            state = _ClassState(max(self.weight(request_class), 1e-6))
+            self._classes[request_class] = state
+        return state
+    
+    def _dispatchable(self, request_class: RequestClass) -> bool:
+        """Whether a request of this class fits the global and class budgets."""
+        if self._in_flight >= self.config.max_concurrent:
+            return False
+        for dim in DIMENSIONS:
+            value = getattr(request_class, dim)
+            budget = self._budgets[dim].get(value)
+            if budget is not None and self._dim_in_flight.get((dim, value), 0) >= budget:
+                return False
+        return True
+    
+    def _admit(self, request_class: RequestClass, state: _ClassState) -> None:
+        """Account a dispatched request."""
+        self._in_flight += 1
+        if self._in_flight > self._peak_in_flight:
+            self._peak_in_flight = self._in_flight
+        for dim in DIMENSIONS:
+            key = (dim, getattr(request_class, dim))
+            self._dim_in_flight[key] = self._dim_in_flight.get(key, 0) + 1
+        state.in_flight += 1
+        state.admitted += 1
+    
+    async def acquire(
+        self,
+        stage: str,
+        plan: Optional[str] = None,
+        streaming: bool = False,
+    ) -> Optional[RequestClass]:
+        """
+        Wait for a dispatch slot.
+        
+        Args:
+            stage: Routing stage value
+            plan: User plan
+            streaming: Whether the request streams
+        
+        Returns:
+            RequestClass to pass to release(), or None if the queue is
+            full or max_wait elapsed
+        """
+        request_class = self.classify(stage, plan, streaming)
+        state = self._state(request_class)
+        
+        # Waiters left queued are all budget-blocked (every release
+        # dispatches), so a dispatchable arrival overtakes nobody
+        if self._dispatchable(request_class):
+            self._admit(request_class, state)
+            return request_class
+        
+        if self._queued >= self.config.max_queue_depth:
+            state.rejected += 1
+            logger.warning(f"Scheduler queue full, rejecting {request_class.name}")
+            return None
+        
+        start = max(self._virtual_time, state.last_finish)
+        state.last_finish = start + 1.0 / state.weight
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), state.last_finish)
+        state.queue.append(waiter)
+        self._queued += 1
+        
+        try:
+            await asyncio.wait_for(waiter.future, self.config.max_wait)
+            return request_class
+        except asyncio.TimeoutError:
+            if self._handed_off(waiter):
+                return request_class
+            state.timeouts += 1
+            state.rejected += 1
+            logger.warning(
+                f"Scheduler wait exceeded {self.config.max_wait}s for {request_class.name}"
+            )
+            return None
+        except asyncio.CancelledError:
+            # Pass on a slot handed over just before cancellation
+            if self._handed_off(waiter):
+                self.release(request_class)
+            raise
+        finally:
+            waited = time.monotonic() - waiter.enqueued_at
+            state.waited += 1
+            state.wait_total += waited
+            if waited > state.wait_max:
+                state.wait_max = waited
+            
+            if not waiter.future.done() or waiter.future.cancelled():
+                try:
+                    state.queue.remove(waiter)
+                    self._queued -= 1
+                except ValueError:
+                    pass
+    
+    @staticmethod
+    def _handed_off(waiter: _Waiter) -> bool:
+        """Whether a slot was handed to this waiter."""
+        return waiter.future.done() and not waiter.future.cancelled()
+    
+    def release(self, request_class: RequestClass) -> None:
+        """
+        Release a dispatch slot and dispatch queued requests.
+        
+        Args:
+            request_class: Class returned by acquire()
+        """
+        state = self._classes.get(request_class)
+        if state is None or state.in_flight <= 0:
+            logger.warning(f"Attempted to release idle scheduler class {request_class.name}")
+            return
+        
+        self._in_flight -= 1
+        for dim in DIMENSIONS:
+            key = (dim, getattr(request_class, dim))
+            self._dim_in_flight[key] -= 1
+        state.in_flight -= 1
+        
+        self._dispatch()
+    
+    def _dispatch(self) -> None:
+        """Hand free slots to the waiters with the smallest finish tags."""
+        while self._queued and self._in_flight < self.config.max_concurrent:
+            best: Optional[tuple[RequestClass, _ClassState]] = None
+            
+            for request_class, state in self._classes.items():
+                # Drop waiters that timed out or were cancelled
+                while state.queue and state.queue[0].future.done():
+                    state.queue.popleft()
+                    self._queued -= 1
+                if not state.queue or not self._dispatchable(request_class):
+                    continue
+                if best is None or state.queue[0].finish < best[1].queue[0].finish:
+                    best = (request_class, state)
+            
+            if best is None:
+                return
+            
+            request_class, state = best
+            waiter = state.queue.popleft()
+            self._queued -= 1
+            self._virtual_time = waiter.finish
+            self._admit(request_class, state)
+            waiter.future.set_result(True)
+    
+    def get_stats(self) -> dict:
+        """
+        Get scheduler statistics.
+        
+        Returns:
+            Dictionary with global and per-class stats
+        """
+        classes = {}
+        for request_class, state in self._classes.items():
+            classes[request_class.name] = {
+                "weight": state.weight,
+                "in_flight": state.in_flight,
+                "queued": len(state.queue),
+                "admitted": state.admitted,
+                "rejected": state.rejected,
+                "timeouts": state.timeouts,
+                "queue_wait_avg_ms": round(
+                    state.wait_total / state.waited * 1000, 2
+                ) if state.waited else 0.0,
+                "queue_wait_max_ms": round(state.wait_max * 1000, 2),
+            }
+        
+        return {
+            "max_concurrent": self.config.max_concurrent,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "queued": self._queued,
+            "classes": classes,
+        }
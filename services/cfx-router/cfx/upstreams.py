@@ -0,0 +1,293 @@
+"""
+CF-X Router Upstream Balancing Module
+
+Client-side load balancing across LiteLLM proxy replicas, with passive
+health ejection and per-replica connection pool tracking.
+"""
+
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# Statuses that indicate a sick proxy replica rather than a bad request
+UNHEALTHY_STATUS_CODES = frozenset({502, 503, 504})
+
+
+@dataclass
+class BalancerConfig:
+    """Configuration for upstream balancing and ejection."""
+    eject_after_failures: int = 5   # Consecutive failures before ejection
+    eject_duration: float = 30.0    # Seconds an ejected replica sits out
+    latency_ewma: float = 0.3       # Weight of the newest latency sample
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "BalancerConfig":
+        """
+        Build config from the models.yaml upstream section.
+        
+        Args:
+            data: Upstream settings
+        
+        Returns:
+            BalancerConfig instance
+        """
+        defaults = cls()
+        return cls(
+            eject_after_failures=data.get(
+                "eject_after_failures", defaults.eject_after_failures
+            ),
+            eject_duration=data.get("eject_duration", defaults.eject_duration),
+            latency_ewma=data.get("latency_ewma", defaults.latency_ewma),
+        )
+
+
+class PoolMonitor:
+    """
+    Connection pool wait tracking.
+    
+    httpx reports no pool metrics, so each request is traced: it counts as
+    waiting from send until httpcore's first connection event (opening a
+    connection or sending headers on one), which is when the pool handed
+    it a connection.
+    """
+    
+    def __init__(self):
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pool_timeouts = 0
+    
+    def track(self) -> "PooledRequest":
+        """
+        Start tracking one request.
+        
+        Returns:
+            Context manager whose trace callback goes in the request extensions
+        """
+        return PooledRequest(self)
+    
+    def get_stats(self) -> dict[str, Any]:
+        """Get pool wait statistics."""
+        return {
+            "requests_in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "pool_timeouts": self.pool_timeouts,
+            "wait_avg_ms": round(
+                self.wait_total / self.acquired * 1000, 2
+            ) if self.acquired else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+class PooledRequest:
+    """One request's passage through the connection pool."""
+    
+    __slots__ = ("monitor", "started", "has_connection")
+    
+    def __init__(self, monitor: PoolMonitor):
+        self.monitor = monitor
+        self.started = time.monotonic()
+        self.has_connection = False
+    
+    def __enter__(self) -> "PooledRequest":
+        monitor = self.monitor
+        monitor.in_flight += 1
+        monitor.waiting += 1
+        if monitor.waiting > monitor.peak_waiting:
+            monitor.peak_waiting = monitor.waiting
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        monitor = self.monitor
+        monitor.in_flight -= 1
+        if not self.has_connection:
+            monitor.waiting -= 1
+            if exc_type is not None and issubclass(exc_type, httpx.PoolTimeout):
+                monitor.pool_timeouts += 1
+        return False
+    
+    async def trace(self, event_name: str, info: dict) -> None:
+        """httpcore trace hook; the first event means a connection was assigned."""
+        if self.has_connection:
+            return
+        self.has_connection = True
+        monitor = self.monitor
+        monitor.waiting -= 1
+        waited = time.monotonic() - self.started
+        monitor.acquired += 1
+        monitor.wait_total += waited
+        if waited > monitor.wait_max:
+            monitor.wait_max = waited
+
+
+class Upstream:
+    """One LiteLLM proxy replica with its own connection pool."""
+    
+    def __init__(self, url: str, config: BalancerConfig):
+        """
+        Initialize upstream.
+        
+        Args:
+            url: Base URL of the replica
+            config: Balancer configuration
+        """
+        self.url = url
+        self.config = config
+        self.client: Optional[httpx.AsyncClient] = None
+        self.pool = PoolMonitor()
+        self.latency: Optional[float] = None  # EWMA of response latency (seconds)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+    
+    @property
+    def in_flight(self) -> int:
+        """Requests currently sent to this replica."""
+        return self.pool.in_flight
+    
+    def is_ejected(self, now: Optional[float] = None) -> bool:
+        """Whether the replica is sitting out after repeated failures."""
+        return (now if now is not None else time.monotonic()) < self.ejected_until
+    
+    def score(self, default_latency: float) -> float:
+        """
+        Expected cost of sending one more request here.
+        
+        In-flight requests (plus this one) times the latency EWMA, so a
+        replica that is busy or slow scores high.
+        
+        Args:
+            default_latency: Latency assumed while the replica is unmeasured
+            
+        Returns:
+            Score, lower is better
+        """
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.in_flight + 1) * latency
+    
+    def record_success(self, latency: float) -> None:
+        """
+        Record a response from the replica.
+        
+        Args:
+            latency: Seconds until the response (headers for streams)
+        """
+        self.requests += 1
+        self.consecutive_failures = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            alpha = self.config.latency_ewma
+            self.latency = alpha * latency + (1 - alpha) * self.latency
+    
+    def record_failure(self) -> None:
+        """Record a connection failure, timeout or gateway error."""
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        
+        if self.consecutive_failures >= self.config.eject_after_failures:
+            self.ejected_until = time.monotonic() + self.config.eject_duration
+            self.ejections += 1
+            self.consecutive_failures = 0
+            logger.warning(
+                f"Ejecting upstream {self.url} for {self.config.eject_duration}s "
+                f"after {self.config.eject_after_failures} consecutive failures"
+            )
+    
+    def get_stats(self) -> dict[str, Any]:
+        """
+        Get replica statistics.
+        
+        Returns:
+            Dictionary with health, latency and pool utilization; active/idle
+            connection counts when the transport exposes them
+        """
+        stats: dict[str, Any] = {
+            "url": self.url,
+            "ejected": self.is_ejected(),
+            "ejections": self.ejections,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            **self.pool.get_stats(),
+        }
+        
+        # httpx has no public pool state; read httpcore's pool behind the transport
+        connections = getattr(
+            getattr(getattr(self.client, "_transport", None), "_pool", None),
+            "connections",
+            None,
+        )
+        if connections is not None:
+            idle = sum(1 for connection in connections if connection.is_idle())
+            stats["connections_active"] = len(connections) - idle
+            stats["connections_idle"] = idle
+        
+        return stats
+
+
+class UpstreamBalancer:
+    """
+    Power-of-two-choices balancing across proxy replicas.
+    
+    Each pick samples two replicas and takes the one with the lower
+    score(), which keeps load even without scanning every replica and
+    avoids herding onto a single "best" one. Replicas failing
+    eject_after_failures times in a row sit out eject_duration seconds;
+    if every replica is ejected, all are used rather than failing.
+    """
+    
+    def __init__(self, urls: Sequence[str], config: BalancerConfig):
+        """
+        Initialize balancer.
+        
+        Args:
+            urls: Replica base URLs
+            config: Balancer configuration
+        """
+        if not urls:
+            raise ValueError("At least one upstream URL is required")
+        self.config = config
+        self.upstreams = [Upstream(url, config) for url in urls]
+    
+    def pick(self, exclude: Sequence[Upstream] = ()) -> Upstream:
+        """
+        Choose a replica for one attempt.
+        
+        Args:
+            exclude: Replicas already tried for this request (avoided
+                unless no other healthy replica remains)
+        
+        Returns:
+            Upstream to send the attempt to
+        """
+        now = time.monotonic()
+        healthy = [u for u in self.upstreams if not u.is_ejected(now)] or self.upstreams
+        candidates = [u for u in healthy if u not in exclude] or healthy
+        
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        
+        # Unmeasured replicas are assumed average, so load alone decides
+        measured = [u.latency for u in self.upstreams if u.latency is not None]
+        default = sum(measured) / len(measured) if measured else 1.0
+        return first if first.score(default) <= second.score(default) else second
+    
+    def get_stats(self) -> list[dict[str, Any]]:
+        """Get statistics for every replica."""
+        return [upstream.get_stats() for upstream in self.upstreams]
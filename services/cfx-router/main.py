@@ -9,6 +9,7 @@ import logging
 import os
 import time
 from contextlib import asynccontextmanager
+from dataclasses import replace
 from datetime import datetime, timezone
 from decimal import Decimal
 from typing import Optional
@@ -19,19 +20,42 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from cfx import __version__
 from cfx.config import load_config, ModelsConfig
-from cfx.auth import AuthModule, AuthResult
-from cfx.rate_limit import RateLimiter, RateLimitConfig
-from cfx.concurrency import ConcurrencyLimiter, ConcurrencyConfig, ConcurrencyContext
+from cfx.auth import AuthModule, AuthResult, AuthCacheConfig, KeyStatusListener
+from cfx.rate_limit import RateLimiter, RateLimitConfig, TokenReservation
+from cfx.concurrency import (
+    ConcurrencyLimiter,
+    ConcurrencyConfig,
+    ConcurrencyContext,
+    DistributedConcurrencyLimiter,
+)
 from cfx.routing import StageRouter, Stage
+from cfx.scheduler import RequestScheduler, RequestClass, SchedulerConfig
 from cfx.litellm_client import (
     LiteLLMClient, 
     LiteLLMConfig, 
     CompletionRequest,
+    HedgeConfig,
+    RetryConfig,
+    PoolConfig,
+    CoalesceConfig,
     LiteLLMError,
     LiteLLMUnavailableError,
+    LiteLLMTimeoutError,
+    StreamUsage,
+    coalesce_sse_events,
+    is_retryable_error,
+)
+from cfx.upstreams import BalancerConfig
+from cfx.latency import LatencyTracker, AdaptiveTimeoutConfig, StreamTimer
+from cfx.resilience import CircuitBreakerRegistry, CircuitOpenError
+from cfx.logger import (
+    AsyncLogger,
+    LoggerConfig,
+    RequestLogEntry,
+    calculate_cost,
+    estimate_request_tokens,
+    estimate_tokens,
 )
-from cfx.resilience import CircuitBreaker, CircuitBreakerConfig, CircuitOpenError
-from cfx.logger import AsyncLogger, LoggerConfig, RequestLogEntry, calculate_cost
 from cfx.database import Database, DatabaseConfig
 from cfx.models import (
     ChatCompletionRequest,
@@ -59,11 +83,15 @@ class AppState:
         self.config: Optional[ModelsConfig] = None
         self.database: Optional[Database] = None
         self.auth: Optional[AuthModule] = None
+        self.key_status_listener: Optional[KeyStatusListener] = None
         self.rate_limiter: Optional[RateLimiter] = None
         self.concurrency_limiter: Optional[ConcurrencyLimiter] = None
         self.stage_router: Optional[StageRouter] = None
+        self.scheduler: Optional[RequestScheduler] = None
         self.litellm_client: Optional[LiteLLMClient] = None
-        self.circuit_breaker: Optional[CircuitBreaker] = None
+        self.coalesce_config: Optional[CoalesceConfig] = None
+        self.latency_tracker: Optional[LatencyTracker] = None
+        self.circuit_breakers: Optional[CircuitBreakerRegistry] = None
         self.async_logger: Optional[AsyncLogger] = None
 
 
@@ -117,46 +145,90 @@ async def lifespan(app: FastAPI):
     
     # Initialize auth module
     hash_salt = os.getenv("HASH_SALT", "cfx-default-salt")
+    auth_cache_config = AuthCacheConfig(
+        ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+        negative_ttl=float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "10")),
+        max_size=int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000")),
+        notified_ttl=float(os.getenv("AUTH_CACHE_NOTIFIED_TTL", "3600")),
+    )
     app_state.auth = AuthModule(
         db_pool=app_state.database.pool if app_state.database else None,
         hash_salt=hash_salt,
+        cache_config=auth_cache_config,
     )
+    await app_state.auth.start()
+    
+    # Evict revoked keys from every worker's auth cache via LISTEN/NOTIFY
+    if app_state.database:
+        app_state.key_status_listener = KeyStatusListener(app_state.auth, app_state.database)
+        await app_state.key_status_listener.start()
     
     # Initialize rate limiter
-    rate_config = RateLimitConfig(
-        daily_limit=app_state.config.rate_limit.get("daily_requests", 1000),
-    )
+    rate_config = RateLimitConfig.from_dict(app_state.config.rate_limit)
     app_state.rate_limiter = RateLimiter(
         config=rate_config,
         db_pool=app_state.database.pool if app_state.database else None,
     )
+    await app_state.rate_limiter.start()
     
     # Initialize concurrency limiter
     conc_config = ConcurrencyConfig(
         max_concurrent_streams=app_state.config.rate_limit.get("concurrent_streams", 3),
+        distributed=app_state.config.rate_limit.get("distributed_streams", False),
+        lease_ttl=app_state.config.rate_limit.get("stream_lease_ttl", 30.0),
+        heartbeat_interval=app_state.config.rate_limit.get("stream_heartbeat_interval", 10.0),
+        queue_max_wait=app_state.config.rate_limit.get("stream_queue_max_wait", 0.0),
+        queue_max_depth=app_state.config.rate_limit.get("stream_queue_depth", 0),
     )
-    app_state.concurrency_limiter = ConcurrencyLimiter(conc_config)
+    if conc_config.distributed and app_state.database:
+        app_state.concurrency_limiter = DistributedConcurrencyLimiter(
+            conc_config, app_state.database.pool
+        )
+        await app_state.concurrency_limiter.start()
+    else:
+        app_state.concurrency_limiter = ConcurrencyLimiter(conc_config)
     
     # Initialize stage router
     app_state.stage_router = StageRouter(app_state.config)
     
-    # Initialize LiteLLM client
-    litellm_url = os.getenv("LITELLM_URL", "http://litellm:4000")
+    # Initialize request scheduler (weighted fair queuing in front of LiteLLM)
+    scheduler_config = SchedulerConfig.from_dict(app_state.config.scheduler)
+    if scheduler_config.enabled:
+        app_state.scheduler = RequestScheduler(scheduler_config)
+    
+    # Initialize LiteLLM client (LITELLM_URL may list several replicas)
+    litellm_urls = [
+        url.strip()
+        for url in os.getenv("LITELLM_URL", "http://litellm:4000").split(",")
+        if url.strip()
+    ]
     litellm_api_key = os.getenv("LITELLM_API_KEY", "")
     litellm_config = LiteLLMConfig(
-        base_url=litellm_url,
+        base_url=litellm_urls[0],
+        upstreams=litellm_urls,
         api_key=litellm_api_key,
         connect_timeout=10.0,
         read_timeout=120.0,
+        max_retries=app_state.config.retries.get("max_retries", 1),
+        retry=RetryConfig.from_dict(app_state.config.retries),
+        pool=PoolConfig.from_dict(app_state.config.upstream),
+        balancer=BalancerConfig.from_dict(app_state.config.upstream),
+    )
+    hedge_config = HedgeConfig.from_dict(app_state.config.hedging)
+    app_state.litellm_client = LiteLLMClient(litellm_config, hedge_config)
+    app_state.coalesce_config = CoalesceConfig.from_dict(app_state.config.streaming)
+    
+    # Per-model upstream timeouts (adaptive from observed latency if enabled),
+    # plus the latency quantile that triggers hedged requests
+    app_state.latency_tracker = LatencyTracker(
+        AdaptiveTimeoutConfig.from_dict(app_state.config.timeouts),
+        extra_percentiles=(hedge_config.percentile,) if hedge_config.enabled else (),
     )
-    app_state.litellm_client = LiteLLMClient(litellm_config)
     
-    # Initialize circuit breaker
-    cb_config = CircuitBreakerConfig(
-        failure_threshold=app_state.config.circuit_breaker.get("failure_threshold", 5),
-        recovery_timeout=app_state.config.circuit_breaker.get("recovery_timeout", 30.0),
+    # Initialize per-model circuit breakers
+    app_state.circuit_breakers = CircuitBreakerRegistry.from_dict(
+        app_state.config.circuit_breaker
     )
-    app_state.circuit_breaker = CircuitBreaker(cb_config, name="litellm")
     
     # Initialize async logger
     logger_config = LoggerConfig()
@@ -173,6 +245,18 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down CF-X Router")
     
+    if app_state.key_status_listener:
+        await app_state.key_status_listener.stop()
+    
+    if app_state.auth:
+        await app_state.auth.stop()
+    
+    if app_state.rate_limiter:
+        await app_state.rate_limiter.stop()
+    
+    if isinstance(app_state.concurrency_limiter, DistributedConcurrencyLimiter):
+        await app_state.concurrency_limiter.stop()
+    
     if app_state.async_logger:
         await app_state.async_logger.stop()
     
@@ -271,6 +355,42 @@ async def health_check() -> HealthStatus:
         return HealthStatus.unhealthy(__version__, checks)
 
 
+@app.get("/health/stats")
+async def component_stats() -> dict:
+    """
+    Router internals for tuning and capacity planning.
+    
+    Like /health this needs no API key, so keep it off public ingress.
+    """
+    stats: dict = {}
+    
+    # Connection pool utilization, replica health, retries and hedging
+    if app_state.litellm_client:
+        stats["litellm"] = app_state.litellm_client.get_stats()
+    
+    # Queue depth and queue wait per request class
+    if app_state.scheduler:
+        stats["scheduler"] = app_state.scheduler.get_stats()
+    
+    # Active streams and the stream admission queue (no per-user breakdown)
+    if app_state.concurrency_limiter:
+        stats["concurrency"] = await app_state.concurrency_limiter.get_stats(
+            include_users=False
+        )
+    
+    # API key cache hits, misses and invalidations
+    if app_state.auth:
+        stats["auth"] = app_state.auth.get_stats()
+        if app_state.key_status_listener:
+            stats["auth"]["key_status_listener"] = app_state.key_status_listener.get_stats()
+    
+    # Quota lease use and the in-memory counter store's footprint
+    if app_state.rate_limiter:
+        stats["rate_limiter"] = app_state.rate_limiter.get_stats()
+    
+    return stats
+
+
 @app.post("/v1/chat/completions")
 async def chat_completions(
     request: ChatCompletionRequest,
@@ -291,22 +411,23 @@ async def chat_completions(
     start_time = time.monotonic()
     request_id = app_state.async_logger.generate_request_id() if app_state.async_logger else "unknown"
     
-    # Check rate limit
+    # Check rate limit (status is kept on the request for response headers)
+    rate_status = None
     if app_state.rate_limiter and auth.user_id:
-        allowed, remaining, reset_time = await app_state.rate_limiter.check_and_increment(
-            auth.user_id
+        rate_status = await app_state.rate_limiter.check_and_increment(
+            auth.user_id, plan=auth.plan
         )
+        raw_request.state.rate_limit_status = rate_status
         
-        if not allowed:
+        if not rate_status.allowed:
             return JSONResponse(
                 status_code=429,
                 content=ErrorResponse.rate_limited(
-                    f"Rate limit exceeded. Resets at {reset_time.isoformat()}"
+                    f"Rate limit exceeded ({rate_status.tier}). "
+                    f"Resets at {rate_status.reset_time.isoformat()}"
                 ).model_dump(),
                 headers={
-                    "X-RateLimit-Limit": str(app_state.rate_limiter.config.daily_limit),
-                    "X-RateLimit-Remaining": "0",
-                    "X-RateLimit-Reset": reset_time.isoformat(),
+                    **rate_status.to_headers(),
                     "X-CFX-Request-Id": request_id,
                 },
             )
@@ -327,15 +448,25 @@ async def chat_completions(
             headers={"X-CFX-Request-Id": request_id},
         )
     
-    # Check circuit breaker
-    if app_state.circuit_breaker and not await app_state.circuit_breaker.can_execute():
-        return JSONResponse(
-            status_code=503,
-            content=ErrorResponse.service_unavailable(
-                "Service temporarily unavailable due to upstream issues"
-            ).model_dump(),
-            headers={"X-CFX-Request-Id": request_id},
+    # Reserve estimated tokens against the daily token budget
+    token_reservation = None
+    if app_state.rate_limiter and auth.user_id:
+        token_reservation = await app_state.rate_limiter.reserve_tokens(
+            auth.user_id,
+            estimate_request_tokens(messages_dict, routing_result.max_tokens),
+            plan=auth.plan,
         )
+        if not token_reservation.allowed:
+            return JSONResponse(
+                status_code=429,
+                content=ErrorResponse.rate_limited(
+                    "Daily token budget exceeded"
+                ).model_dump(),
+                headers={
+                    **token_reservation.to_headers(),
+                    "X-CFX-Request-Id": request_id,
+                },
+            )
     
     # Build completion request
     completion_request = CompletionRequest(
@@ -346,6 +477,7 @@ async def chat_completions(
         temperature=routing_result.temperature if request.temperature is None else request.temperature,
         top_p=request.top_p,
         stop=request.stop,
+        include_usage=request.stream,
     )
     
     # Common response headers
@@ -355,13 +487,10 @@ async def chat_completions(
         "X-CFX-Model-Used": routing_result.model,
     }
     
-    if app_state.rate_limiter and auth.user_id:
-        _, remaining, reset_time = await app_state.rate_limiter.get_status(auth.user_id)
-        response_headers.update({
-            "X-RateLimit-Limit": str(app_state.rate_limiter.config.daily_limit),
-            "X-RateLimit-Remaining": str(remaining),
-            "X-RateLimit-Reset": reset_time.isoformat(),
-        })
+    if rate_status is not None:
+        response_headers.update(rate_status.to_headers())
+    if token_reservation is not None:
+        response_headers.update(token_reservation.to_headers())
     
     # Handle streaming
     if request.stream:
@@ -372,6 +501,9 @@ async def chat_completions(
             routing_result=routing_result,
             response_headers=response_headers,
             start_time=start_time,
+            token_reservation=token_reservation,
+            forward_usage=client_requested_usage(request),
+            raw_request=raw_request,
         )
     
     # Handle non-streaming
@@ -382,9 +514,92 @@ async def chat_completions(
         routing_result=routing_result,
         response_headers=response_headers,
         start_time=start_time,
+        token_reservation=token_reservation,
     )
 
 
+async def acquire_schedule_slot(routing_result, auth: AuthResult, streaming: bool):
+    """
+    Wait for a scheduler dispatch slot.
+    
+    Returns:
+        RequestClass to release, None without a scheduler, or False if
+        the scheduler rejected the request
+    """
+    if not app_state.scheduler:
+        return None
+    
+    slot = await app_state.scheduler.acquire(
+        routing_result.stage.value, plan=auth.plan, streaming=streaming
+    )
+    return slot if slot is not None else False
+
+
+def release_schedule_slot(slot: Optional[RequestClass]) -> None:
+    """Release a scheduler dispatch slot (no-op without one)."""
+    if slot and app_state.scheduler:
+        app_state.scheduler.release(slot)
+
+
+def scheduler_unavailable_response(response_headers: dict) -> JSONResponse:
+    """503 for requests the scheduler could not dispatch in time."""
+    return JSONResponse(
+        status_code=503,
+        content=ErrorResponse.service_unavailable(
+            "Server is busy, please retry shortly"
+        ).model_dump(),
+        headers={**response_headers, "Retry-After": "1"},
+    )
+
+
+def client_requested_usage(request: ChatCompletionRequest) -> bool:
+    """Whether the client asked for the final usage chunk of a stream."""
+    stream_options = (request.model_extra or {}).get("stream_options")
+    return isinstance(stream_options, dict) and bool(stream_options.get("include_usage"))
+
+
+# Logged status of streams the client abandoned (nginx's "client closed request")
+CLIENT_CLOSED_STATUS = 499
+
+
+class ClientDisconnectedError(Exception):
+    """The client went away before the upstream stream started."""
+
+
+async def wait_for_disconnect(raw_request: Request) -> None:
+    """Return once the client has closed the connection."""
+    while (await raw_request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def unless_disconnected(coro, disconnect: Optional[asyncio.Task]):
+    """
+    Await a coroutine, cancelling it if the client disconnects first.
+    
+    Raises:
+        ClientDisconnectedError: If the client went away first
+    """
+    if disconnect is None:
+        return await coro
+    
+    task = asyncio.ensure_future(coro)
+    try:
+        await asyncio.wait((task, disconnect), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait((task,))
+    if task.cancelled():
+        raise ClientDisconnectedError()
+    return task.result()
+
+
+def settle_tokens(reservation: Optional[TokenReservation], actual_tokens: int) -> None:
+    """Settle a token reservation with actual usage (no-op without one)."""
+    if reservation is not None and app_state.rate_limiter:
+        app_state.rate_limiter.settle_tokens(reservation, actual_tokens)
+
+
 async def handle_streaming_request(
     completion_request: CompletionRequest,
     auth: AuthResult,
@@ -392,13 +607,17 @@ async def handle_streaming_request(
     routing_result,
     response_headers: dict,
     start_time: float,
+    token_reservation: Optional[TokenReservation] = None,
+    forward_usage: bool = False,
+    raw_request: Optional[Request] = None,
 ):
     """Handle streaming chat completion request."""
     
-    # Check concurrency limit
+    # Check concurrency limit (may wait briefly in the admission queue)
     if app_state.concurrency_limiter and auth.user_id:
         acquired = await app_state.concurrency_limiter.acquire(auth.user_id, is_streaming=True)
         if not acquired:
+            settle_tokens(token_reservation, 0)
             return JSONResponse(
                 status_code=429,
                 content=ErrorResponse.rate_limited(
@@ -407,40 +626,180 @@ async def handle_streaming_request(
                 headers=response_headers,
             )
     
+    # Wait for a dispatch slot
+    schedule_slot = await acquire_schedule_slot(routing_result, auth, streaming=True)
+    if schedule_slot is False:
+        if app_state.concurrency_limiter and auth.user_id:
+            await app_state.concurrency_limiter.release(auth.user_id, is_streaming=True)
+        settle_tokens(token_reservation, 0)
+        return scheduler_unavailable_response(response_headers)
+    
+    # Chunk timings from request arrival, across fallback attempts
+    timer = StreamTimer(start_time)
+    usage = StreamUsage(forward_usage=forward_usage)
+    
+    # Stop upstream work as soon as the client goes away, rather than at
+    # the next write to the closed connection
+    disconnect = (
+        asyncio.create_task(wait_for_disconnect(raw_request)) if raw_request else None
+    )
+    
+    async def finish(status_code: int, error_message: Optional[str] = None):
+        """Settle tokens, release slots and log the stream (best effort)."""
+        if disconnect is not None:
+            disconnect.cancel()
+        
+        # Upstream usage if it arrived, else an estimate of what was streamed
+        prompt_tokens, completion_tokens, estimated = usage.tokens(
+            estimate_request_tokens(completion_request.messages)
+        )
+        if estimated:
+            logger.debug(f"No upstream usage for stream {request_id}, using estimate")
+        settle_tokens(token_reservation, prompt_tokens + completion_tokens)
+        
+        # Release scheduler and concurrency slots
+        release_schedule_slot(schedule_slot)
+        if app_state.concurrency_limiter and auth.user_id:
+            await app_state.concurrency_limiter.release(auth.user_id, is_streaming=True)
+        
+        latency_ms = int((time.monotonic() - start_time) * 1000)
+        await log_request(
+            request_id=request_id,
+            auth=auth,
+            routing_result=routing_result,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=latency_ms,
+            status_code=status_code,
+            error_message=error_message,
+            stream_timer=timer,
+        )
+    
+    async def open_stream(model: str):
+        """Start the upstream stream and wait for its first chunk."""
+        upstream = app_state.litellm_client.stream_raw(
+            upstream_request(completion_request, routing_result, model)
+        )
+        started = time.monotonic()
+        try:
+            first_chunk = await upstream.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        except BaseException as e:
+            if isinstance(e, LiteLLMTimeoutError):
+                observe_latency(model, time.monotonic() - started, streaming=True)
+            await upstream.aclose()
+            raise
+        observe_latency(model, time.monotonic() - started, streaming=True)
+        if first_chunk is not None:
+            timer.chunk()
+        return upstream, first_chunk
+    
+    # Fail over to fallback models until one starts streaming, so the
+    # headers can report the model actually used
+    try:
+        (upstream, first_chunk), model_used = await unless_disconnected(
+            call_with_fallback(routing_result, open_stream), disconnect
+        )
+    except ClientDisconnectedError:
+        logger.info(f"Client disconnected before stream {request_id} started")
+        await finish(CLIENT_CLOSED_STATUS, "Client disconnected")
+        return Response(status_code=CLIENT_CLOSED_STATUS)
+    except (CircuitOpenError, LiteLLMError, LiteLLMUnavailableError) as e:
+        if disconnect is not None:
+            disconnect.cancel()
+        release_schedule_slot(schedule_slot)
+        if app_state.concurrency_limiter and auth.user_id:
+            await app_state.concurrency_limiter.release(auth.user_id, is_streaming=True)
+        return await upstream_error_response(
+            e, auth, request_id, routing_result, response_headers, start_time,
+            token_reservation, stream_timer=timer,
+        )
+    
+    routing_result = replace(routing_result, model=model_used)
+    response_headers["X-CFX-Model-Used"] = model_used
+    
+    # Batch per-token events into fewer writes (the first chunk goes out alone)
+    chunks = upstream
+    coalesce = app_state.coalesce_config
+    if coalesce and coalesce.enabled:
+        chunks = coalesce_sse_events(upstream, coalesce.max_delay, coalesce.max_bytes)
+    
+    async def close_stream(abandoned: bool):
+        """Close upstream, then settle and log the stream."""
+        await chunks.aclose()
+        await upstream.aclose()
+        if abandoned:
+            logger.info(f"Client disconnected from stream {request_id}, upstream cancelled")
+            await finish(CLIENT_CLOSED_STATUS, "Client disconnected")
+        else:
+            await finish(200)
+    
     async def stream_generator():
         """Generate SSE stream."""
+        task = asyncio.current_task()
+        abandoned = False
+        reading = False  # Awaiting upstream, so safe to interrupt
+        
+        def on_disconnect(watcher: asyncio.Task):
+            nonlocal abandoned
+            if watcher.cancelled():
+                return
+            abandoned = True
+            # Interrupt a pending upstream read; a write in progress is
+            # followed by a disconnect check instead
+            if reading:
+                task.cancel()
+        
+        if disconnect is not None:
+            disconnect.add_done_callback(on_disconnect)
+        
         try:
-            async for chunk in app_state.litellm_client.stream(completion_request):
-                yield chunk
+            if first_chunk is not None:
+                chunk = usage.feed(first_chunk)
+                if chunk:
+                    yield chunk
+            if not abandoned:
+                reading = True
+                async for chunk in chunks:
+                    timer.chunk()
+                    chunk = usage.feed(chunk)
+                    if chunk:
+                        reading = False
+                        yield chunk
+                        if abandoned:
+                            break
+                        reading = True
+                reading = False
+        
+        except asyncio.CancelledError:
+            # Ours (client gone) ends the stream quietly; anyone else's,
+            # e.g. the server's own disconnect handling, propagates
+            reading = False
+            if not abandoned:
+                abandoned = True
+                raise
+            task.uncancel()
+            
+        except GeneratorExit:
+            # Closed at a yield without finishing: the client stopped reading
+            abandoned = True
+            raise
             
-            # Record success
-            if app_state.circuit_breaker:
-                await app_state.circuit_breaker.record_success()
-                
         except (LiteLLMError, LiteLLMUnavailableError) as e:
+            reading = False
             logger.error(f"LiteLLM streaming error: {e}")
-            if app_state.circuit_breaker:
-                await app_state.circuit_breaker.record_failure()
+            await record_model_failure(model_used)
             # Send error in SSE format
             error_data = ErrorResponse.service_unavailable(str(e)).model_dump()
             yield f"data: {error_data}\n\n"
             
         finally:
-            # Release concurrency slot
-            if app_state.concurrency_limiter and auth.user_id:
-                await app_state.concurrency_limiter.release(auth.user_id, is_streaming=True)
-            
-            # Log request (best effort)
-            latency_ms = int((time.monotonic() - start_time) * 1000)
-            await log_request(
-                request_id=request_id,
-                auth=auth,
-                routing_result=routing_result,
-                prompt_tokens=0,  # Unknown for streaming
-                completion_tokens=0,
-                latency_ms=latency_ms,
-                status_code=200,
-            )
+            reading = False
+            if disconnect is not None:
+                disconnect.remove_done_callback(on_disconnect)
+            # Shielded so a cancelled response still releases its slots
+            await asyncio.shield(close_stream(abandoned))
     
     return StreamingResponse(
         stream_generator(),
@@ -456,94 +815,204 @@ async def handle_non_streaming_request(
     routing_result,
     response_headers: dict,
     start_time: float,
+    token_reservation: Optional[TokenReservation] = None,
 ):
     """Handle non-streaming chat completion request."""
     
+    # Wait for a dispatch slot
+    schedule_slot = await acquire_schedule_slot(routing_result, auth, streaming=False)
+    if schedule_slot is False:
+        settle_tokens(token_reservation, 0)
+        return scheduler_unavailable_response(response_headers)
+    
+    async def complete(model: str):
+        started = time.monotonic()
+        try:
+            response = await app_state.litellm_client.complete(
+                upstream_request(completion_request, routing_result, model),
+                hedge_after=hedge_delay(routing_result, model),
+            )
+        except LiteLLMTimeoutError:
+            observe_latency(model, time.monotonic() - started)
+            raise
+        observe_latency(model, time.monotonic() - started)
+        return response
+    
     try:
-        response = await app_state.litellm_client.complete(completion_request)
-        
-        # Record success
-        if app_state.circuit_breaker:
-            await app_state.circuit_breaker.record_success()
-        
-        latency_ms = int((time.monotonic() - start_time) * 1000)
-        
-        # Log request
-        prompt_tokens = response.usage.get("prompt_tokens", 0) if response.usage else 0
-        completion_tokens = response.usage.get("completion_tokens", 0) if response.usage else 0
-        
-        await log_request(
-            request_id=request_id,
-            auth=auth,
-            routing_result=routing_result,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            latency_ms=latency_ms,
-            status_code=200,
-        )
-        
-        # Build response
-        result = ChatCompletionResponse.from_litellm({
-            "id": response.id,
-            "created": int(datetime.now(timezone.utc).timestamp()),
-            "model": routing_result.model,
-            "choices": response.choices,
-            "usage": response.usage,
-        })
-        
-        return JSONResponse(
-            content=result.model_dump(),
-            headers=response_headers,
+        response, model_used = await call_with_fallback(routing_result, complete)
+    except (CircuitOpenError, LiteLLMError, LiteLLMUnavailableError) as e:
+        return await upstream_error_response(
+            e, auth, request_id, routing_result, response_headers, start_time,
+            token_reservation,
         )
-        
-    except LiteLLMUnavailableError as e:
-        logger.error(f"LiteLLM unavailable: {e}")
-        if app_state.circuit_breaker:
-            await app_state.circuit_breaker.record_failure()
-        
-        latency_ms = int((time.monotonic() - start_time) * 1000)
-        await log_request(
-            request_id=request_id,
-            auth=auth,
-            routing_result=routing_result,
-            prompt_tokens=0,
-            completion_tokens=0,
-            latency_ms=latency_ms,
-            status_code=503,
-            error_message=str(e),
+    finally:
+        release_schedule_slot(schedule_slot)
+    
+    routing_result = replace(routing_result, model=model_used)
+    response_headers["X-CFX-Model-Used"] = model_used
+    
+    latency_ms = int((time.monotonic() - start_time) * 1000)
+    
+    # Upstream usage if reported, else an estimate of the prompt and answer,
+    # so the reservation is always settled
+    if response.usage:
+        prompt_tokens = response.usage.get("prompt_tokens", 0) or 0
+        completion_tokens = response.usage.get("completion_tokens", 0) or 0
+    else:
+        logger.debug(f"No upstream usage for request {request_id}, using estimate")
+        prompt_tokens = estimate_request_tokens(completion_request.messages)
+        completion_tokens = sum(
+            estimate_tokens((choice.get("message") or {}).get("content") or "")
+            for choice in response.choices
         )
-        
-        return JSONResponse(
-            status_code=503,
-            content=ErrorResponse.service_unavailable(str(e)).model_dump(),
-            headers=response_headers,
+    settle_tokens(token_reservation, prompt_tokens + completion_tokens)
+    
+    # Log request
+    await log_request(
+        request_id=request_id,
+        auth=auth,
+        routing_result=routing_result,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency_ms=latency_ms,
+        status_code=200,
+    )
+    
+    # Build response
+    result = ChatCompletionResponse.from_litellm({
+        "id": response.id,
+        "created": int(datetime.now(timezone.utc).timestamp()),
+        "model": model_used,
+        "choices": response.choices,
+        "usage": response.usage,
+    })
+    
+    return JSONResponse(
+        content=result.model_dump(),
+        headers=response_headers,
+    )
+
+
+def upstream_request(
+    completion_request: CompletionRequest,
+    routing_result,
+    model: str,
+) -> CompletionRequest:
+    """Copy of the request for one model, with that model's read timeout."""
+    ceiling = app_state.litellm_client.config.read_timeout
+    stage_config = app_state.stage_router.get_stage_config(routing_result.stage)
+    if stage_config and stage_config.timeout:
+        ceiling = stage_config.timeout
+    
+    timeout = ceiling
+    if app_state.latency_tracker:
+        timeout = app_state.latency_tracker.timeout_for(
+            model, ceiling, streaming=completion_request.stream
         )
-        
-    except LiteLLMError as e:
-        logger.error(f"LiteLLM error: {e}")
-        if app_state.circuit_breaker:
-            await app_state.circuit_breaker.record_failure()
-        
-        latency_ms = int((time.monotonic() - start_time) * 1000)
-        await log_request(
-            request_id=request_id,
-            auth=auth,
-            routing_result=routing_result,
-            prompt_tokens=0,
-            completion_tokens=0,
-            latency_ms=latency_ms,
-            status_code=e.status_code,
-            error_message=str(e),
+    return replace(completion_request, model=model, timeout=timeout)
+
+
+def hedge_delay(routing_result, model: str) -> Optional[float]:
+    """Seconds after which to hedge a non-streaming call (None = never)."""
+    hedge_config = app_state.litellm_client.hedge_config
+    if not hedge_config.enabled or not app_state.latency_tracker:
+        return None
+    if routing_result.stage.value not in hedge_config.stages:
+        return None
+    return app_state.latency_tracker.estimate(
+        model, streaming=False, percentile=hedge_config.percentile
+    )
+
+
+def observe_latency(model: str, seconds: float, streaming: bool = False) -> None:
+    """Feed an upstream latency sample to the adaptive timeouts."""
+    if app_state.latency_tracker:
+        app_state.latency_tracker.observe(model, seconds, streaming=streaming)
+
+
+def get_candidate_models(routing_result) -> list[str]:
+    """Routed model followed by its stage's fallbacks (none in direct mode)."""
+    models = [routing_result.model]
+    if routing_result.stage != Stage.DIRECT and app_state.stage_router:
+        for model in app_state.stage_router.get_fallback_models(routing_result.stage):
+            if model not in models:
+                models.append(model)
+    return models
+
+
+async def call_with_fallback(routing_result, func):
+    """
+    Call func with the routed model, failing over to fallback models.
+    
+    Returns:
+        Tuple of (result, model used)
+    """
+    if not app_state.circuit_breakers:
+        return await func(routing_result.model), routing_result.model
+    
+    return await app_state.circuit_breakers.execute_with_fallback(
+        get_candidate_models(routing_result),
+        func,
+        is_retryable=is_retryable_error,
+    )
+
+
+async def record_model_failure(model: str) -> None:
+    """Count a failure against a model's circuit breaker."""
+    if app_state.circuit_breakers:
+        breaker = await app_state.circuit_breakers.get(model)
+        await breaker.record_failure()
+
+
+async def upstream_error_response(
+    error: Exception,
+    auth: AuthResult,
+    request_id: str,
+    routing_result,
+    response_headers: dict,
+    start_time: float,
+    token_reservation: Optional[TokenReservation] = None,
+    stream_timer: Optional[StreamTimer] = None,
+) -> JSONResponse:
+    """Refund, log and build the error response for a failed upstream call."""
+    if isinstance(error, CircuitOpenError):
+        logger.warning(f"No model available for stage {routing_result.stage.value}: {error}")
+        status_code = 503
+        content = ErrorResponse.service_unavailable(
+            "Service temporarily unavailable due to upstream issues"
         )
-        
-        return JSONResponse(
-            status_code=e.status_code,
-            content=ErrorResponse.create(
-                message=e.message,
-                error_type="upstream_error",
-            ).model_dump(),
-            headers=response_headers,
+    elif isinstance(error, LiteLLMUnavailableError):
+        logger.error(f"LiteLLM unavailable: {error}")
+        status_code = 503
+        content = ErrorResponse.service_unavailable(str(error))
+    else:
+        logger.error(f"LiteLLM error: {error}")
+        status_code = error.status_code
+        content = ErrorResponse.create(
+            message=error.message,
+            error_type="upstream_error",
         )
+    
+    settle_tokens(token_reservation, 0)
+    
+    latency_ms = int((time.monotonic() - start_time) * 1000)
+    await log_request(
+        request_id=request_id,
+        auth=auth,
+        routing_result=routing_result,
+        prompt_tokens=0,
+        completion_tokens=0,
+        latency_ms=latency_ms,
+        status_code=status_code,
+        error_message=str(error),
+        stream_timer=stream_timer,
+    )
+    
+    return JSONResponse(
+        status_code=status_code,
+        content=content.model_dump(),
+        headers=response_headers,
+    )
 
 
 async def log_request(
@@ -555,11 +1024,14 @@ async def log_request(
     latency_ms: int,
     status_code: int,
     error_message: Optional[str] = None,
+    stream_timer: Optional[StreamTimer] = None,
 ):
     """Log request to async logger."""
     if not app_state.async_logger:
         return
     
+    timings = stream_timer.finish() if stream_timer else {}
+    
     cost = calculate_cost(
         model=routing_result.model,
         prompt_tokens=prompt_tokens,
@@ -579,6 +1051,9 @@ async def log_request(
         latency_ms=latency_ms,
         status_code=status_code,
         error_message=error_message,
+        completed_at=datetime.now(timezone.utc),
+        is_streaming=stream_timer is not None,
+        **timings,
     )
     
     await app_state.async_logger.log(entry)
@@ -597,7 +1072,9 @@ async def get_stats(auth: AuthResult = Depends(get_auth_result)):
             "todayRequests": 0,
             "totalCost": 0,
             "avgLatency": 0,
+            "avgTimeToFirstToken": 0,
             "dailyLimit": 1000,
+            "streamingModels": [],
         }
     
     try:
@@ -632,12 +1109,60 @@ async def get_stats(auth: AuthResult = Depends(get_auth_result)):
                 auth.user_id
             )
             
+            # Average time to first token (streaming only)
+            avg_ttft = await conn.fetchval(
+                """
+                SELECT COALESCE(AVG(time_to_first_token_ms), 0) FROM request_logs 
+                WHERE user_id = $1 AND is_streaming AND status_code = 200
+                """,
+                auth.user_id
+            )
+            
+            # Streaming latency per model over the last week, slowest start first
+            stream_rows = await conn.fetch(
+                """
+                SELECT 
+                    model,
+                    COUNT(*) AS requests,
+                    AVG(time_to_first_token_ms) AS avg_ttft,
+                    PERCENTILE_CONT(0.95) WITHIN GROUP (
+                        ORDER BY time_to_first_token_ms
+                    ) AS p95_ttft,
+                    AVG(stream_duration_ms) AS avg_duration,
+                    AVG(chunk_gap_p50_ms) AS avg_gap_p50,
+                    AVG(chunk_gap_p95_ms) AS avg_gap_p95
+                FROM request_logs 
+                WHERE user_id = $1 AND is_streaming AND status_code = 200
+                    AND time_to_first_token_ms IS NOT NULL
+                    AND created_at >= NOW() - INTERVAL '7 days'
+                GROUP BY model
+                ORDER BY p95_ttft DESC
+                """,
+                auth.user_id
+            )
+            
             return {
                 "totalRequests": total or 0,
                 "todayRequests": today or 0,
                 "totalCost": float(cost or 0),
                 "avgLatency": int(avg_latency or 0),
-                "dailyLimit": app_state.rate_limiter.config.daily_limit if app_state.rate_limiter else 1000,
+                "avgTimeToFirstToken": int(avg_ttft or 0),
+                "dailyLimit": (
+                    app_state.rate_limiter.config.limits_for(auth.plan).daily_limit
+                    if app_state.rate_limiter else 1000
+                ),
+                "streamingModels": [
+                    {
+                        "model": row["model"],
+                        "requests": row["requests"],
+                        "avgTtft": int(row["avg_ttft"] or 0),
+                        "p95Ttft": int(row["p95_ttft"] or 0),
+                        "avgStreamDuration": int(row["avg_duration"] or 0),
+                        "avgChunkGapP50": int(row["avg_gap_p50"] or 0),
+                        "avgChunkGapP95": int(row["avg_gap_p95"] or 0),
+                    }
+                    for row in stream_rows
+                ],
             }
     except Exception as e:
         logger.error(f"Error fetching stats: {e}")
@@ -837,18 +1362,22 @@ async def revoke_key(
     
     try:
         async with app_state.database.pool.acquire() as conn:
-            result = await conn.execute(
+            row = await conn.fetchrow(
                 """
                 UPDATE api_keys 
                 SET status = 'revoked', revoked_at = NOW()
                 WHERE id = $1 AND user_id = $2
+                RETURNING key_hash
                 """,
                 key_id, auth.user_id
             )
             
-            if result == "UPDATE 0":
+            if row is None:
                 raise HTTPException(status_code=404, detail="Key not found")
             
+            # Stop serving the key from the auth cache immediately
+            app_state.auth.invalidate(row["key_hash"])
+            
             return {"message": "Key revoked successfully"}
     except HTTPException:
         raise
@@ -0,0 +1,31 @@
+-- CF-X Router API Key Status Notifications
+-- Migration: 002_api_key_status_notify
+-- Date: 2026-10-16
+
+-- ============================================
+-- API Key Status Change Notifications
+-- ============================================
+-- Broadcasts key status changes on the cfx_api_key_status channel so every
+-- router worker can evict the key from its in-memory auth cache.
+CREATE OR REPLACE FUNCTION notify_api_key_status()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Workers cache by the previous hash, so always publish OLD.key_hash
+    PERFORM pg_notify(
+        'cfx_api_key_status',
+        json_build_object(
+            'key_id', OLD.id,
+            'key_hash', OLD.key_hash,
+            'status', CASE WHEN TG_OP = 'DELETE' THEN 'deleted' ELSE NEW.status END
+        )::text
+    );
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS api_keys_status_notify ON api_keys;
+CREATE TRIGGER api_keys_status_notify
+    AFTER UPDATE OF status, key_hash OR DELETE ON api_keys
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_api_key_status();
@@ -0,0 +1,19 @@
+-- CF-X Router Burst Rate Limit State
+-- Migration: 003_rate_limit_gcra
+-- Date: 2026-10-16
+
+-- ============================================
+-- GCRA State Table
+-- ============================================
+-- One theoretical arrival time (TAT) per user and burst tier
+-- (per-second / per-minute). Checked and advanced by a single
+-- INSERT ... ON CONFLICT DO UPDATE ... WHERE statement.
+CREATE TABLE IF NOT EXISTS rate_limit_gcra (
+    user_id UUID NOT NULL,
+    tier TEXT NOT NULL,                       -- second | minute
+    tat DOUBLE PRECISION NOT NULL,            -- Theoretical arrival time (epoch seconds)
+    emission_interval DOUBLE PRECISION NOT NULL,  -- period / limit
+    period DOUBLE PRECISION NOT NULL,         -- Tier window in seconds
+    
+    PRIMARY KEY (user_id, tier)
+);
@@ -0,0 +1,12 @@
+-- CF-X Router Token Budget Counters
+-- Migration: 004_usage_token_count
+-- Date: 2026-10-16
+
+-- ============================================
+-- Token Counter Column
+-- ============================================
+-- Daily prompt + completion tokens per user, maintained incrementally
+-- (reserved at admission, settled from actual usage) so token budgets
+-- never need SUM queries over request_logs.
+ALTER TABLE usage_counters
+    ADD COLUMN IF NOT EXISTS token_count BIGINT NOT NULL DEFAULT 0;
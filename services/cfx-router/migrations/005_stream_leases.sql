@@ -0,0 +1,21 @@
+-- CF-X Router Cluster-Wide Stream Leases
+-- Migration: 005_stream_leases
+-- Date: 2026-10-16
+
+-- ============================================
+-- Stream Lease Table
+-- ============================================
+-- One row per active streaming request across all workers. Inserts are
+-- serialized per user with pg_advisory_xact_lock; holders renew
+-- expires_at on a heartbeat, so leases of a crashed worker lapse and
+-- are purged instead of blocking the user.
+CREATE TABLE IF NOT EXISTS stream_leases (
+    lease_id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    worker_id TEXT NOT NULL,                  -- host:pid:nonce of the holder
+    acquired_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_stream_leases_user ON stream_leases(user_id, expires_at);
+CREATE INDEX IF NOT EXISTS idx_stream_leases_expires ON stream_leases(expires_at);
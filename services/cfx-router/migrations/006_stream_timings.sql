@@ -0,0 +1,21 @@
+-- CF-X Router Stream Timing Columns
+-- Migration: 006_stream_timings
+-- Date: 2026-10-16
+
+-- ============================================
+-- Request Log Stream Timings
+-- ============================================
+-- time_to_first_token_ms, is_streaming and completed_at already exist
+-- (001_initial_schema). These add generation time and the distribution
+-- of gaps between streamed chunks, measured per request by the router.
+ALTER TABLE request_logs
+    ADD COLUMN IF NOT EXISTS stream_duration_ms INT,      -- First to last chunk
+    ADD COLUMN IF NOT EXISTS chunk_count INT,
+    ADD COLUMN IF NOT EXISTS chunk_gap_p50_ms INT,
+    ADD COLUMN IF NOT EXISTS chunk_gap_p95_ms INT,
+    ADD COLUMN IF NOT EXISTS chunk_gap_p99_ms INT;
+
+-- Per-model streaming latency queries (/api/stats)
+CREATE INDEX IF NOT EXISTS idx_request_logs_streaming_model
+    ON request_logs(user_id, model, created_at DESC)
+    WHERE is_streaming;
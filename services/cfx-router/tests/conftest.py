@@ -9,6 +9,24 @@ import pytest
 import pytest_asyncio
 
 
+def pytest_addoption(parser: pytest.Parser) -> None:
+    """Add --benchmark to run wall-clock micro-benchmarks."""
+    parser.addoption(
+        "--benchmark", action="store_true", default=False,
+        help="run tests marked benchmark (timing-sensitive, skipped by default)",
+    )
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    """Skip benchmark tests unless --benchmark is given."""
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmark: run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture(scope="session")
 def event_loop() -> Generator[asyncio.AbstractEventLoop, None, None]:
     """Create an event loop for the test session."""
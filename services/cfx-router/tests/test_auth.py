@@ -4,6 +4,11 @@ Tests for CF-X Router Authentication Module.
 Includes property-based tests using Hypothesis.
 """
 
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
 import pytest
 from hypothesis import given, strategies as st, settings
 from unittest.mock import AsyncMock, MagicMock
@@ -15,7 +20,16 @@ from cfx.security import (
     extract_key_prefix,
     is_valid_api_key_format,
 )
-from cfx.auth import AuthModule, AuthResult
+from cfx.auth import (
+    AuthModule,
+    AuthResult,
+    AuthCache,
+    AuthCacheConfig,
+    LastUsedWriter,
+    LastUsedWriterConfig,
+    KeyStatusListener,
+    KEY_STATUS_CHANNEL,
+)
 
 
 # =============================================================================
@@ -311,3 +325,364 @@ class TestAuthModule:
         result = await auth.authenticate("Bearer cfx_validformat12345678")
         
         assert result.authenticated is True
+
+
+# =============================================================================
+# Auth Cache Tests
+# =============================================================================
+
+def make_mock_pool(row):
+    """Create a mock asyncpg pool whose connections return `row` from fetchrow."""
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock(return_value=row)
+    conn.execute = AsyncMock(return_value="UPDATE 1")
+    
+    acquire_ctx = MagicMock()
+    acquire_ctx.__aenter__ = AsyncMock(return_value=conn)
+    acquire_ctx.__aexit__ = AsyncMock(return_value=None)
+    
+    pool = MagicMock()
+    pool.acquire = MagicMock(return_value=acquire_ctx)
+    return pool, conn
+
+
+ACTIVE_ROW = {
+    "id": 42,
+    "user_id": "00000000-0000-0000-0000-000000000001",
+    "key_prefix": "cfx_vali",
+    "status": "active",
+}
+
+
+class TestAuthCache:
+    """Unit tests for AuthCache class."""
+    
+    def test_put_and_get(self):
+        """Cached result should be returned."""
+        cache = AuthCache(AuthCacheConfig())
+        result = AuthResult(authenticated=True, user_id="u1")
+        
+        cache.put("hash-1", result)
+        
+        assert cache.get("hash-1") is result
+        assert cache.get_stats()["hits"] == 1
+    
+    def test_miss(self):
+        """Unknown hash should miss."""
+        cache = AuthCache(AuthCacheConfig())
+        
+        assert cache.get("missing") is None
+        assert cache.get_stats()["misses"] == 1
+    
+    def test_expiry(self):
+        """Entries should expire after TTL."""
+        cache = AuthCache(AuthCacheConfig(ttl=0.01))
+        cache.put("hash-1", AuthResult(authenticated=True))
+        
+        time.sleep(0.02)
+        
+        assert cache.get("hash-1") is None
+        assert cache.get_stats()["expirations"] == 1
+        assert len(cache) == 0
+    
+    def test_negative_ttl_zero_disables_negative_caching(self):
+        """Negative results should not be cached with negative_ttl=0."""
+        cache = AuthCache(AuthCacheConfig(negative_ttl=0))
+        cache.put("hash-1", AuthResult(authenticated=False, error="Invalid API key"))
+        
+        assert len(cache) == 0
+    
+    def test_lru_eviction(self):
+        """Least recently used entry should be evicted at capacity."""
+        cache = AuthCache(AuthCacheConfig(max_size=2))
+        cache.put("a", AuthResult(authenticated=True))
+        cache.put("b", AuthResult(authenticated=True))
+        cache.get("a")  # "b" is now least recently used
+        cache.put("c", AuthResult(authenticated=True))
+        
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+        assert cache.get_stats()["evictions"] == 1
+    
+    def test_invalidate(self):
+        """Invalidated entries should be removed."""
+        cache = AuthCache(AuthCacheConfig())
+        cache.put("hash-1", AuthResult(authenticated=True))
+        
+        assert cache.invalidate("hash-1") is True
+        assert cache.invalidate("hash-1") is False
+        assert cache.get("hash-1") is None
+    
+    def test_invalidation_bumps_generation(self):
+        """Every invalidation should bump the generation, cached or not."""
+        cache = AuthCache(AuthCacheConfig())
+        
+        cache.invalidate("never-cached")
+        cache.clear()
+        
+        assert cache.generation == 2
+
+
+class TestAuthModuleCaching:
+    """Unit tests for AuthModule verification caching."""
+    
+    @pytest.mark.asyncio
+    async def test_repeat_lookup_served_from_cache(self):
+        """Second verification of the same key should not hit the database."""
+        pool, conn = make_mock_pool(ACTIVE_ROW)
+        auth = AuthModule(pool, "salt")
+        
+        first = await auth.verify_api_key("cfx_validformat12345678")
+        second = await auth.verify_api_key("cfx_validformat12345678")
+        
+        assert first.authenticated and second.authenticated
+        assert conn.fetchrow.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_unknown_key_cached_negatively(self):
+        """Unknown keys should be remembered for negative_ttl."""
+        pool, conn = make_mock_pool(None)
+        auth = AuthModule(pool, "salt")
+        
+        for _ in range(3):
+            result = await auth.verify_api_key("cfx_unknownformat1234567")
+            assert result.authenticated is False
+        
+        assert conn.fetchrow.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_database_error_not_cached(self):
+        """Transient database errors should not be cached."""
+        pool, conn = make_mock_pool(None)
+        conn.fetchrow.side_effect = Exception("connection lost")
+        auth = AuthModule(pool, "salt")
+        
+        await auth.verify_api_key("cfx_validformat12345678")
+        await auth.verify_api_key("cfx_validformat12345678")
+        
+        assert conn.fetchrow.await_count == 2
+        assert len(auth.cache) == 0
+    
+    @pytest.mark.asyncio
+    async def test_invalidate_forces_lookup(self):
+        """Invalidation should force the next verification to hit the database."""
+        pool, conn = make_mock_pool(ACTIVE_ROW)
+        auth = AuthModule(pool, "salt")
+        api_key = "cfx_validformat12345678"
+        
+        await auth.verify_api_key(api_key)
+        conn.fetchrow.return_value = {**ACTIVE_ROW, "status": "revoked"}
+        
+        assert auth.invalidate(hash_api_key(api_key, "salt")) is True
+        result = await auth.verify_api_key(api_key)
+        
+        assert result.authenticated is False
+        assert conn.fetchrow.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_cache_disabled(self):
+        """Disabled cache should always hit the database."""
+        pool, conn = make_mock_pool(ACTIVE_ROW)
+        auth = AuthModule(pool, "salt", cache_config=AuthCacheConfig(enabled=False))
+        
+        await auth.verify_api_key("cfx_validformat12345678")
+        await auth.verify_api_key("cfx_validformat12345678")
+        
+        assert auth.cache is None
+        assert conn.fetchrow.await_count == 2
+
+
+class TestLastUsedWriter:
+    """Unit tests for LastUsedWriter class."""
+    
+    def test_record_coalesces_per_key(self):
+        """Multiple records for one key should keep only the latest timestamp."""
+        pool, _ = make_mock_pool(None)
+        writer = LastUsedWriter(LastUsedWriterConfig(), pool)
+        early = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        late = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        
+        writer.record("key-1", late)
+        writer.record("key-1", early)
+        writer.record("key-2", early)
+        
+        assert writer.get_stats()["pending"] == 2
+        assert writer._pending["key-1"] == late
+    
+    @pytest.mark.asyncio
+    async def test_flush_single_statement(self):
+        """Flush should write all pending keys in one UPDATE."""
+        pool, conn = make_mock_pool(None)
+        writer = LastUsedWriter(LastUsedWriterConfig(), pool)
+        for i in range(10):
+            writer.record(f"key-{i}")
+        
+        flushed = await writer.flush()
+        
+        assert flushed == 10
+        assert conn.execute.await_count == 1
+        args = conn.execute.await_args.args
+        assert len(args[1]) == 10 and len(args[2]) == 10
+        assert writer.get_stats()["pending"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_flush_failure_retains_pending(self):
+        """Failed flush should keep timestamps for the next attempt."""
+        pool, conn = make_mock_pool(None)
+        conn.execute.side_effect = Exception("connection lost")
+        writer = LastUsedWriter(LastUsedWriterConfig(), pool)
+        writer.record("key-1")
+        
+        assert await writer.flush() == 0
+        assert writer.get_stats()["pending"] == 1
+        assert writer.get_stats()["failures"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stop_flushes(self):
+        """Stopping the writer should flush pending timestamps."""
+        pool, conn = make_mock_pool(None)
+        writer = LastUsedWriter(LastUsedWriterConfig(flush_interval=60.0), pool)
+        await writer.start()
+        writer.record("key-1")
+        
+        await writer.stop()
+        
+        assert conn.execute.await_count == 1
+        assert writer.get_stats()["pending"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_auth_does_not_write_on_request_path(self):
+        """Successful auth should only record, not execute an UPDATE."""
+        pool, conn = make_mock_pool(ACTIVE_ROW)
+        auth = AuthModule(pool, "salt")
+        
+        await auth.verify_api_key("cfx_validformat12345678")
+        await auth.verify_api_key("cfx_validformat12345678")
+        
+        conn.execute.assert_not_awaited()
+        assert auth.last_used_writer.get_stats()["pending"] == 1
+
+
+class FakeNotifyDatabase:
+    """Minimal Database stand-in that records LISTEN subscriptions."""
+    
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.callbacks = {}
+        self.on_disconnect = None
+    
+    async def listen(self, channel, callback, on_disconnect=None):
+        if self.fail:
+            raise ConnectionError("listen failed")
+        self.callbacks[channel] = callback
+        self.on_disconnect = on_disconnect
+    
+    async def unlisten(self, channel):
+        self.callbacks.pop(channel, None)
+    
+    def notify(self, channel, payload):
+        self.callbacks[channel](payload)
+
+
+class TestKeyStatusListener:
+    """Unit tests for KeyStatusListener class."""
+    
+    @pytest.mark.asyncio
+    async def test_notification_evicts_key(self):
+        """A status notification should evict the key from the cache."""
+        pool, conn = make_mock_pool(ACTIVE_ROW)
+        auth = AuthModule(pool, "salt")
+        db = FakeNotifyDatabase()
+        listener = KeyStatusListener(auth, db)
+        await listener.start()
+        api_key = "cfx_validformat12345678"
+        key_hash = hash_api_key(api_key, "salt")
+        
+        await auth.verify_api_key(api_key)
+        db.notify(KEY_STATUS_CHANNEL, json.dumps({"key_hash": key_hash, "status": "revoked"}))
+        
+        assert auth.cache.get(key_hash) is None
+        await listener.stop()
+    
+    @pytest.mark.asyncio
+    async def test_notification_during_lookup_not_cached(self):
+        """A revocation notified mid-query should keep the stale result out of the cache."""
+        pool, conn = make_mock_pool(None)
+        fetching = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def slow_fetchrow(*args):
+            fetching.set()
+            await release.wait()
+            return ACTIVE_ROW  # Read before the revocation committed
+        
+        conn.fetchrow.side_effect = slow_fetchrow
+        auth = AuthModule(pool, "salt")
+        db = FakeNotifyDatabase()
+        listener = KeyStatusListener(auth, db)
+        await listener.start()
+        api_key = "cfx_validformat12345678"
+        key_hash = hash_api_key(api_key, "salt")
+        
+        lookup = asyncio.create_task(auth.verify_api_key(api_key))
+        await fetching.wait()
+        db.notify(KEY_STATUS_CHANNEL, json.dumps({"key_hash": key_hash, "status": "revoked"}))
+        release.set()
+        await lookup
+        
+        assert auth.cache.get(key_hash) is None
+        await listener.stop()
+    
+    @pytest.mark.asyncio
+    async def test_active_listener_uses_long_ttl(self):
+        """Positive entries should use notified_ttl while the channel is live."""
+        auth = AuthModule(None, "salt", cache_config=AuthCacheConfig(ttl=0.01, notified_ttl=60.0))
+        listener = KeyStatusListener(auth, FakeNotifyDatabase())
+        await listener.start()
+        
+        auth.cache.put("hash-1", AuthResult(authenticated=True))
+        time.sleep(0.02)
+        
+        assert auth.cache.get("hash-1") is not None
+        await listener.stop()
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_clears_cache(self):
+        """Losing the channel should clear the cache and shorten TTLs."""
+        auth = AuthModule(None, "salt")
+        db = FakeNotifyDatabase()
+        listener = KeyStatusListener(auth, db, reconnect_interval=60.0)
+        await listener.start()
+        auth.cache.put("hash-1", AuthResult(authenticated=True))
+        
+        db.on_disconnect()
+        
+        assert len(auth.cache) == 0
+        assert auth.cache.notifications_active is False
+        await listener.stop()
+    
+    @pytest.mark.asyncio
+    async def test_malformed_payload_clears_cache(self):
+        """Unparseable notifications should clear the whole cache."""
+        auth = AuthModule(None, "salt")
+        db = FakeNotifyDatabase()
+        listener = KeyStatusListener(auth, db)
+        await listener.start()
+        auth.cache.put("hash-1", AuthResult(authenticated=True))
+        
+        db.notify(KEY_STATUS_CHANNEL, "not-json")
+        
+        assert len(auth.cache) == 0
+        await listener.stop()
+    
+    @pytest.mark.asyncio
+    async def test_failed_subscribe_keeps_short_ttl(self):
+        """If LISTEN fails, the cache should stay in short-TTL mode."""
+        auth = AuthModule(None, "salt")
+        listener = KeyStatusListener(auth, FakeNotifyDatabase(fail=True), reconnect_interval=60.0)
+        
+        await listener.start()
+        
+        assert auth.cache.notifications_active is False
+        await listener.stop()
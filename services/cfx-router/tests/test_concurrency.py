@@ -5,6 +5,7 @@ Includes property-based tests using Hypothesis.
 """
 
 import asyncio
+import time
 import pytest
 from hypothesis import given, strategies as st, settings, assume
 
@@ -13,6 +14,7 @@ from cfx.concurrency import (
     ConcurrencyConfig,
     ConcurrencyContext,
     ConcurrencyLimitExceeded,
+    DistributedConcurrencyLimiter,
 )
 
 
@@ -450,3 +452,420 @@ class TestConcurrentAccess:
         # Should end up with 0 active
         active = await limiter.get_active_count(user_id)
         assert active == 0
+
+
+class TestLockFreeLimiter:
+    """Unit tests for the lock-free limiter internals."""
+    
+    def test_try_acquire_and_release_nowait(self, limiter: ConcurrencyLimiter):
+        """Synchronous fast path should enforce the limit."""
+        results = [limiter.try_acquire("user-1") for _ in range(5)]
+        
+        assert results == [True, True, True, False, False]
+        
+        limiter.release_nowait("user-1")
+        assert limiter.try_acquire("user-1") is True
+    
+    @pytest.mark.asyncio
+    async def test_aggregate_counters(self, limiter: ConcurrencyLimiter):
+        """Aggregate stats should track totals without per-user copies."""
+        for i in range(10):
+            await limiter.acquire(f"user-{i}", is_streaming=True)
+        await limiter.release("user-0", is_streaming=True)
+        
+        stats = await limiter.get_stats(include_users=False)
+        
+        assert stats["total_active_streams"] == 9
+        assert stats["peak_active_streams"] == 10
+        assert stats["acquired_total"] == 10
+        assert "active_by_user" not in stats
+    
+    @pytest.mark.asyncio
+    async def test_rejections_counted(self, limiter: ConcurrencyLimiter):
+        """Rejected acquires should be counted."""
+        for _ in range(5):
+            await limiter.acquire("user-1", is_streaming=True)
+        
+        stats = await limiter.get_stats()
+        
+        assert stats["rejected_total"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_thousands_of_concurrent_streams(self):
+        """Totals should stay exact across thousands of concurrent streams."""
+        limiter = ConcurrencyLimiter(ConcurrencyConfig(max_concurrent_streams=2))
+        
+        async def stream(user_id: str) -> bool:
+            acquired = await limiter.acquire(user_id, is_streaming=True)
+            await asyncio.sleep(0)
+            if acquired:
+                await limiter.release(user_id, is_streaming=True)
+            return acquired
+        
+        results = await asyncio.gather(*(stream(f"user-{i % 1000}") for i in range(5000)))
+        
+        assert sum(results) == 2000
+        stats = await limiter.get_stats()
+        assert stats["total_active_streams"] == 0
+        assert stats["active_by_user"] == {}
+
+
+class FakeLeasePool:
+    """In-memory stand-in for a pool backed by the stream_leases table."""
+    
+    def __init__(self):
+        self.leases: dict = {}  # lease_id -> (user_id, expires_at)
+        self.fail = False
+    
+    def _live_count(self, user_id) -> int:
+        now = time.monotonic()
+        return sum(1 for u, exp in self.leases.values() if u == user_id and exp > now)
+    
+    async def fetchrow(self, query, user_id, lease_id, worker_id, ttl, limit):
+        if self._live_count(user_id) >= limit:
+            return None
+        self.leases[lease_id] = (user_id, time.monotonic() + ttl)
+        return {"lease_id": lease_id}
+    
+    async def execute(self, query, *args):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        query = " ".join(query.split())
+        if "pg_advisory_xact_lock" in query:
+            return "SELECT 1"
+        if query.startswith("UPDATE"):
+            lease_ids, ttl = args
+            for lease_id in lease_ids:
+                user_id, _ = self.leases[lease_id]
+                self.leases[lease_id] = (user_id, time.monotonic() + ttl)
+        elif "ANY" in query:
+            for lease_id in args[0]:
+                self.leases.pop(lease_id, None)
+        elif "expires_at < NOW()" in query:
+            now = time.monotonic()
+            self.leases = {k: v for k, v in self.leases.items() if v[1] >= now}
+        else:
+            self.leases.pop(args[0], None)
+        return "OK"
+    
+    def transaction(self):
+        return self._ctx(None)
+    
+    def acquire(self):
+        return self._ctx(self)
+    
+    @staticmethod
+    def _ctx(value):
+        class _Ctx:
+            async def __aenter__(self):
+                return value
+            
+            async def __aexit__(self, *exc):
+                return None
+        
+        return _Ctx()
+
+
+def make_worker(pool: FakeLeasePool, max_streams: int = 2, lease_ttl: float = 30.0):
+    """Create a distributed limiter acting as one worker process."""
+    config = ConcurrencyConfig(
+        max_concurrent_streams=max_streams,
+        distributed=True,
+        lease_ttl=lease_ttl,
+    )
+    return DistributedConcurrencyLimiter(config, pool)
+
+
+class TestDistributedConcurrencyLimiter:
+    """Unit tests for cluster-wide stream limiting."""
+    
+    @pytest.mark.asyncio
+    async def test_limit_shared_across_workers(self):
+        """Two workers should share one per-user limit."""
+        pool = FakeLeasePool()
+        worker_a, worker_b = make_worker(pool), make_worker(pool)
+        
+        assert await worker_a.acquire("user-1") is True
+        assert await worker_b.acquire("user-1") is True
+        assert await worker_b.acquire("user-1") is False
+        assert await worker_a.acquire("user-1") is False
+        
+        # The rejected worker holds no local slot
+        assert await worker_b.get_active_count("user-1") == 1
+    
+    @pytest.mark.asyncio
+    async def test_release_frees_cluster_slot(self):
+        """Releasing on one worker should free a slot for another."""
+        pool = FakeLeasePool()
+        worker_a, worker_b = make_worker(pool, max_streams=1), make_worker(pool, max_streams=1)
+        
+        await worker_a.acquire("user-1")
+        assert await worker_b.acquire("user-1") is False
+        
+        await worker_a.release("user-1")
+        
+        assert pool.leases == {}
+        assert await worker_b.acquire("user-1") is True
+    
+    @pytest.mark.asyncio
+    async def test_local_precheck_skips_database(self):
+        """A user at the local limit should be rejected without a round trip."""
+        pool = FakeLeasePool()
+        worker = make_worker(pool, max_streams=1)
+        await worker.acquire("user-1")
+        
+        pool.fail = True  # Any round trip would now raise
+        
+        assert await worker.acquire("user-1") is False
+        stats = await worker.get_stats()
+        assert stats["lease_errors"] == 0
+        assert stats["rejected_total"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_crashed_worker_leases_expire(self):
+        """Leases that stop being renewed should stop counting."""
+        pool = FakeLeasePool()
+        crashed = make_worker(pool, max_streams=1, lease_ttl=0.01)
+        survivor = make_worker(pool, max_streams=1)
+        
+        await crashed.acquire("user-1")
+        assert await survivor.acquire("user-1") is False
+        
+        await asyncio.sleep(0.02)
+        
+        assert await survivor.acquire("user-1") is True
+        await survivor.heartbeat()
+        assert len(pool.leases) == 1
+    
+    @pytest.mark.asyncio
+    async def test_heartbeat_renews_held_leases(self):
+        """Heartbeats should keep held leases alive past their TTL."""
+        pool = FakeLeasePool()
+        worker = make_worker(pool, max_streams=1, lease_ttl=0.05)
+        other = make_worker(pool, max_streams=1)
+        
+        await worker.acquire("user-1")
+        await asyncio.sleep(0.03)
+        assert await worker.heartbeat() == 1
+        await asyncio.sleep(0.03)
+        
+        assert await other.acquire("user-1") is False
+    
+    @pytest.mark.asyncio
+    async def test_database_error_falls_back_to_local_limit(self):
+        """Without the database, the local limit alone should apply."""
+        pool = FakeLeasePool()
+        pool.fetchrow = None  # Calling it raises TypeError
+        worker = make_worker(pool, max_streams=1)
+        
+        assert await worker.acquire("user-1") is True
+        assert await worker.acquire("user-1") is False
+        
+        await worker.release("user-1")
+        assert await worker.get_active_count("user-1") == 0
+    
+    @pytest.mark.asyncio
+    async def test_stop_drops_held_leases(self):
+        """Stopping a worker should delete its leases."""
+        pool = FakeLeasePool()
+        worker = make_worker(pool)
+        await worker.start()
+        await worker.acquire("user-1")
+        await worker.acquire("user-2")
+        
+        await worker.stop()
+        
+        assert pool.leases == {}
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_acquire_releases_slot_and_lease(self):
+        """Cancelling an acquire mid-insert should leak neither slot nor lease."""
+        pool = FakeLeasePool()
+        worker = make_worker(pool, max_streams=1)
+        insert = pool.fetchrow
+        inserted = asyncio.Event()
+        
+        async def slow_commit(*args):
+            # The lease row is written, then the commit stalls
+            row = await insert(*args)
+            inserted.set()
+            await asyncio.Event().wait()
+            return row
+        
+        pool.fetchrow = slow_commit
+        acquiring = asyncio.create_task(worker.acquire("user-1"))
+        await inserted.wait()
+        acquiring.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await acquiring
+        
+        assert pool.leases == {}
+        assert await worker.get_active_count("user-1") == 0
+        
+        pool.fetchrow = insert
+        assert await worker.acquire("user-1") is True
+    
+    @pytest.mark.asyncio
+    async def test_non_streaming_exempt(self):
+        """Non-streaming requests should not take a lease."""
+        pool = FakeLeasePool()
+        worker = make_worker(pool, max_streams=1)
+        
+        for _ in range(3):
+            assert await worker.acquire("user-1", is_streaming=False) is True
+        
+        assert pool.leases == {}
+
+
+def make_queued_limiter(max_streams: int = 1, max_wait: float = 1.0, depth: int = 2):
+    """Create a limiter with an admission queue."""
+    return ConcurrencyLimiter(ConcurrencyConfig(
+        max_concurrent_streams=max_streams,
+        queue_max_wait=max_wait,
+        queue_max_depth=depth,
+    ))
+
+
+class TestAdmissionQueue:
+    """Unit tests for waiting on a freed slot."""
+    
+    @pytest.mark.asyncio
+    async def test_disabled_by_default(self, limiter: ConcurrencyLimiter):
+        """Without a queue, acquires over the limit fail immediately."""
+        for _ in range(3):
+            await limiter.acquire("user-1")
+        
+        assert limiter.queue_enabled is False
+        assert await limiter.acquire("user-1") is False
+    
+    @pytest.mark.asyncio
+    async def test_waiter_gets_released_slot(self):
+        """A queued stream should take over a released slot."""
+        limiter = make_queued_limiter()
+        await limiter.acquire("user-1")
+        
+        waiter = asyncio.create_task(limiter.acquire("user-1"))
+        await asyncio.sleep(0)
+        assert (await limiter.get_stats())["queued_streams"] == 1
+        
+        await limiter.release("user-1")
+        
+        assert await waiter is True
+        assert await limiter.get_active_count("user-1") == 1
+        stats = await limiter.get_stats()
+        assert stats["queued_streams"] == 0
+        assert stats["queued_total"] == 1
+        assert stats["rejected_total"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_fifo_order(self):
+        """Waiters should be served in arrival order."""
+        limiter = make_queued_limiter(depth=3)
+        await limiter.acquire("user-1")
+        order = []
+        
+        async def wait(name: str):
+            await limiter.acquire("user-1")
+            order.append(name)
+        
+        tasks = []
+        for name in ("a", "b", "c"):
+            tasks.append(asyncio.create_task(wait(name)))
+            await asyncio.sleep(0)
+        
+        for _ in range(3):
+            await limiter.release("user-1")
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        
+        assert order == ["a", "b", "c"]
+    
+    @pytest.mark.asyncio
+    async def test_newcomer_cannot_overtake_queue(self):
+        """A released slot goes to the waiter, not a fresh acquire."""
+        limiter = make_queued_limiter(depth=1)
+        await limiter.acquire("user-1")
+        waiter = asyncio.create_task(limiter.acquire("user-1"))
+        await asyncio.sleep(0)
+        
+        await limiter.release("user-1")
+        
+        assert limiter.try_acquire("user-1") is False
+        assert await waiter is True
+    
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        """A waiter should give up after queue_max_wait."""
+        limiter = make_queued_limiter(max_wait=0.01)
+        await limiter.acquire("user-1")
+        
+        assert await limiter.acquire("user-1") is False
+        
+        stats = await limiter.get_stats()
+        assert stats["queue_timeouts"] == 1
+        assert stats["rejected_total"] == 1
+        assert stats["queue_wait_max_ms"] >= 10
+        
+        # The timed-out waiter must not receive the next slot
+        await limiter.release("user-1")
+        assert await limiter.get_active_count("user-1") == 0
+    
+    @pytest.mark.asyncio
+    async def test_queue_depth_bounded(self):
+        """Acquires beyond the queue depth should be rejected at once."""
+        limiter = make_queued_limiter(depth=1)
+        await limiter.acquire("user-1")
+        waiter = asyncio.create_task(limiter.acquire("user-1"))
+        await asyncio.sleep(0)
+        
+        assert await limiter.acquire("user-1") is False
+        assert (await limiter.get_stats())["queue_full_rejections"] == 1
+        
+        await limiter.release("user-1")
+        await waiter
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """A cancelled waiter should not hold a slot or queue position."""
+        limiter = make_queued_limiter()
+        await limiter.acquire("user-1")
+        waiter = asyncio.create_task(limiter.acquire("user-1"))
+        await asyncio.sleep(0)
+        
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await limiter.release("user-1")
+        
+        assert await limiter.get_active_count("user-1") == 0
+        assert (await limiter.get_stats())["queued_streams"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_queues_are_per_user(self):
+        """One user's queue should not affect another user."""
+        limiter = make_queued_limiter()
+        await limiter.acquire("user-1")
+        waiter = asyncio.create_task(limiter.acquire("user-1"))
+        await asyncio.sleep(0)
+        
+        assert await limiter.acquire("user-2") is True
+        
+        await limiter.release("user-1")
+        assert await waiter is True
+    
+    @pytest.mark.asyncio
+    async def test_distributed_waiter_takes_released_lease(self):
+        """A queued stream on a distributed worker should get the freed lease."""
+        pool = FakeLeasePool()
+        worker = DistributedConcurrencyLimiter(
+            ConcurrencyConfig(max_concurrent_streams=1, queue_max_wait=1.0, queue_max_depth=1),
+            pool,
+        )
+        await worker.acquire("user-1")
+        waiter = asyncio.create_task(worker.acquire("user-1"))
+        await asyncio.sleep(0)
+        
+        await worker.release("user-1")
+        
+        assert await waiter is True
+        assert len(pool.leases) == 1
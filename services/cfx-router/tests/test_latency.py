@@ -0,0 +1,258 @@
+"""
+Tests for CF-X Router Latency Tracking Module.
+
+Includes property-based tests using Hypothesis.
+"""
+
+import random
+
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from cfx.latency import AdaptiveTimeoutConfig, LatencyTracker, P2Quantile, StreamTimer
+
+# =============================================================================
+# Test Fixtures
+# =============================================================================
+
+@pytest.fixture
+def config() -> AdaptiveTimeoutConfig:
+    """Create test configuration."""
+    return AdaptiveTimeoutConfig(
+        enabled=True,
+        percentile=0.99,
+        multiplier=2.0,
+        min_timeout=1.0,
+        min_samples=20,
+        window_samples=1000,
+    )
+
+
+@pytest.fixture
+def tracker(config: AdaptiveTimeoutConfig) -> LatencyTracker:
+    """Create test latency tracker."""
+    return LatencyTracker(config)
+
+
+def exact_quantile(samples: list[float], p: float) -> float:
+    """Nearest-rank quantile of a sample list."""
+    ordered = sorted(samples)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+# =============================================================================
+# Property Tests
+# =============================================================================
+
+class TestP2QuantileProperties:
+    """Property-based tests for the P² estimator."""
+    
+    @given(
+        samples=st.lists(
+            st.floats(min_value=0.0, max_value=1000.0, allow_nan=False),
+            min_size=1,
+            max_size=200,
+        )
+    )
+    @settings(max_examples=100)
+    def test_property_estimate_within_range(self, samples: list[float]):
+        """
+        Property: The estimate always lies within the observed range.
+        """
+        estimator = P2Quantile(0.99)
+        for x in samples:
+            estimator.add(x)
+        
+        assert min(samples) <= estimator.value <= max(samples)
+
+
+# =============================================================================
+# Unit Tests
+# =============================================================================
+
+class TestP2Quantile:
+    """Unit tests for P2Quantile."""
+    
+    def test_empty(self):
+        """An empty estimator has no value."""
+        assert P2Quantile(0.99).value is None
+    
+    def test_small_sample_exact(self):
+        """Below five samples the estimate is the exact quantile."""
+        estimator = P2Quantile(0.5)
+        for x in (3.0, 1.0, 2.0):
+            estimator.add(x)
+        
+        assert estimator.value == 2.0
+    
+    @pytest.mark.parametrize("p", [0.5, 0.9, 0.99])
+    def test_accuracy_on_skewed_latencies(self, p: float):
+        """The estimate should track the exact quantile of a long-tailed sample."""
+        rng = random.Random(42)
+        samples = [rng.lognormvariate(0.0, 0.75) for _ in range(20000)]
+        estimator = P2Quantile(p)
+        for x in samples:
+            estimator.add(x)
+        
+        exact = exact_quantile(samples, p)
+        assert abs(estimator.value - exact) / exact < 0.05
+
+
+class TestAdaptiveTimeoutConfig:
+    """Tests for AdaptiveTimeoutConfig."""
+    
+    def test_disabled_by_default(self):
+        """Adaptive timeouts should be opt-in."""
+        assert AdaptiveTimeoutConfig().enabled is False
+    
+    def test_from_dict(self):
+        """Should read the models.yaml timeouts section."""
+        config = AdaptiveTimeoutConfig.from_dict({
+            "adaptive": True,
+            "multiplier": 3,
+            "models": {"gpt-4o-mini": 15},
+        })
+        
+        assert config.enabled is True
+        assert config.multiplier == 3
+        assert config.model_timeouts == {"gpt-4o-mini": 15}
+        assert config.percentile == 0.99
+
+
+class TestLatencyTracker:
+    """Unit tests for LatencyTracker."""
+    
+    def test_ceiling_until_enough_samples(self, tracker: LatencyTracker):
+        """Without enough samples the configured timeout applies."""
+        for _ in range(10):
+            tracker.observe("gpt-4o-mini", 0.5)
+        
+        assert tracker.estimate("gpt-4o-mini") is None
+        assert tracker.timeout_for("gpt-4o-mini", 20.0) == 20.0
+    
+    def test_adaptive_deadline(self, tracker: LatencyTracker):
+        """The deadline should be multiplier × the estimated p99."""
+        for _ in range(100):
+            tracker.observe("gpt-4o-mini", 2.0)
+        
+        assert tracker.timeout_for("gpt-4o-mini", 20.0) == pytest.approx(4.0)
+    
+    def test_deadline_clamped(self, tracker: LatencyTracker):
+        """The deadline should stay between min_timeout and the ceiling."""
+        for _ in range(100):
+            tracker.observe("fast", 0.01)
+            tracker.observe("slow", 50.0)
+        
+        assert tracker.timeout_for("fast", 20.0) == 1.0
+        assert tracker.timeout_for("slow", 20.0) == 20.0
+    
+    def test_streaming_tracked_separately(self, tracker: LatencyTracker):
+        """Time to first chunk should not mix with end-to-end latency."""
+        for _ in range(100):
+            tracker.observe("deepseek-v3", 10.0)
+            tracker.observe("deepseek-v3", 1.0, streaming=True)
+        
+        assert tracker.timeout_for("deepseek-v3", 60.0) == pytest.approx(20.0)
+        assert tracker.timeout_for("deepseek-v3", 60.0, streaming=True) == pytest.approx(2.0)
+    
+    def test_model_timeout_caps_ceiling(self):
+        """A fixed per-model timeout should cap the stage timeout."""
+        tracker = LatencyTracker(AdaptiveTimeoutConfig(model_timeouts={"gpt-4o-mini": 15.0}))
+        
+        assert tracker.timeout_for("gpt-4o-mini", 20.0) == 15.0
+        assert tracker.timeout_for("gpt-4o", 20.0) == 20.0
+    
+    def test_disabled_uses_ceiling(self):
+        """With adaptive mode off the configured timeout always applies."""
+        tracker = LatencyTracker(AdaptiveTimeoutConfig(enabled=False, min_samples=1))
+        for _ in range(100):
+            tracker.observe("gpt-4o", 1.0)
+        
+        assert tracker.timeout_for("gpt-4o", 30.0) == 30.0
+    
+    def test_window_rotation_follows_shift(self):
+        """After a latency shift the estimate should follow within two windows."""
+        tracker = LatencyTracker(AdaptiveTimeoutConfig(
+            enabled=True, min_samples=20, window_samples=100,
+        ))
+        for _ in range(100):
+            tracker.observe("model", 1.0)
+        for _ in range(100):
+            tracker.observe("model", 5.0)
+        
+        # The fresh window has no samples yet, the previous one saw only 5s calls
+        assert tracker.estimate("model") == pytest.approx(5.0)
+    
+    def test_extra_percentiles(self, config: AdaptiveTimeoutConfig):
+        """Extra quantiles should be estimated alongside the configured one."""
+        tracker = LatencyTracker(config, extra_percentiles=(0.5,))
+        for i in range(100):
+            tracker.observe("gpt-4o", 1.0 if i < 90 else 10.0)
+        
+        assert tracker.percentiles == (0.5, 0.99)
+        assert tracker.estimate("gpt-4o", percentile=0.5) == pytest.approx(1.0, abs=0.2)
+        assert tracker.estimate("gpt-4o") > 5.0
+        # Untracked quantiles have no estimate
+        assert tracker.estimate("gpt-4o", percentile=0.9) is None
+    
+    def test_get_stats(self, tracker: LatencyTracker):
+        """Stats should report per-mode estimates in milliseconds."""
+        for _ in range(30):
+            tracker.observe("gpt-4o", 0.25)
+        
+        stats = tracker.get_stats()
+        
+        assert stats["gpt-4o"]["non_stream"]["estimate_ms"] == 250.0
+        assert stats["gpt-4o"]["non_stream"]["samples"] == 30
+
+
+class TestStreamTimer:
+    """Unit tests for StreamTimer."""
+    
+    def test_no_chunks(self):
+        """A stream without chunks should report no timings."""
+        timings = StreamTimer(started=10.0).finish()
+        
+        assert timings["chunk_count"] == 0
+        assert timings["time_to_first_token_ms"] is None
+        assert timings["stream_duration_ms"] is None
+        assert timings["chunk_gap_p95_ms"] is None
+    
+    def test_first_chunk_and_duration(self):
+        """TTFT runs from request start, duration from first to last chunk."""
+        timer = StreamTimer(started=10.0)
+        timer.chunk(now=10.4)
+        timer.chunk(now=10.5)
+        timer.chunk(now=11.4)
+        
+        timings = timer.finish()
+        
+        assert timings["time_to_first_token_ms"] == 400
+        assert timings["stream_duration_ms"] == 1000
+        assert timings["chunk_count"] == 3
+    
+    def test_gap_percentiles(self):
+        """Gap percentiles should expose a stall hidden by a fast median."""
+        timer = StreamTimer(started=0.0)
+        now = 0.0
+        for i in range(100):
+            now += 2.0 if i == 99 else 0.01
+            timer.chunk(now=now)
+        
+        timings = timer.finish()
+        
+        assert timings["chunk_gap_p50_ms"] == 10
+        assert timings["chunk_gap_p95_ms"] == 10
+        assert timings["chunk_gap_p99_ms"] == 2000
+    
+    def test_single_chunk_has_no_gaps(self):
+        """One chunk gives TTFT but no gap percentiles."""
+        timer = StreamTimer(started=0.0)
+        timer.chunk(now=0.25)
+        
+        timings = timer.finish()
+        
+        assert timings["time_to_first_token_ms"] == 250
+        assert timings["stream_duration_ms"] == 0
+        assert timings["chunk_gap_p50_ms"] is None
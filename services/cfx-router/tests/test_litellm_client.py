@@ -4,23 +4,39 @@ Tests for CF-X Router LiteLLM Client Module.
 Includes property-based tests using Hypothesis.
 """
 
+import asyncio
 import json
-import pytest
-from hypothesis import given, strategies as st, settings
+import time
+from typing import Optional
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import httpx
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
 from cfx.litellm_client import (
-    LiteLLMConfig,
-    LiteLLMClient,
+    CoalesceConfig,
     CompletionRequest,
     CompletionResponse,
+    HedgeConfig,
+    LiteLLMClient,
+    LiteLLMConfig,
     LiteLLMError,
+    LiteLLMTimeoutError,
     LiteLLMUnavailableError,
+    PoolConfig,
+    RetryConfig,
+    StreamUsage,
+    TokenBudget,
+    coalesce_sse_events,
     format_sse_chunk,
+    frame_sse_events,
+    is_retryable_error,
+    parse_retry_after,
     parse_sse_chunk,
 )
 
-
 # =============================================================================
 # Test Fixtures
 # =============================================================================
@@ -299,7 +315,7 @@ class TestLiteLLMClient:
         mock_http_client.post.return_value = mock_response
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         response = await client.complete(sample_request)
         
@@ -326,7 +342,7 @@ class TestLiteLLMClient:
         mock_http_client.post.side_effect = [mock_response_503, mock_response_200]
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         response = await client.complete(sample_request)
         
@@ -344,7 +360,7 @@ class TestLiteLLMClient:
         mock_http_client.post.return_value = mock_response
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         with pytest.raises(LiteLLMError) as exc_info:
             await client.complete(sample_request)
@@ -361,7 +377,7 @@ class TestLiteLLMClient:
         mock_http_client.post.side_effect = httpx.ConnectError("Connection refused")
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         with pytest.raises(LiteLLMUnavailableError):
             await client.complete(sample_request)
@@ -369,6 +385,52 @@ class TestLiteLLMClient:
         # Should have tried max_retries + 1 times
         assert mock_http_client.post.call_count == client.config.max_retries + 1
     
+    @pytest.mark.asyncio
+    async def test_complete_timeout_raises_timeout_error(
+        self, client: LiteLLMClient, sample_request: CompletionRequest
+    ):
+        """Timeouts should surface as LiteLLMTimeoutError (still unavailable)."""
+        import httpx
+        
+        mock_http_client = AsyncMock()
+        mock_http_client.post.side_effect = httpx.ReadTimeout("timed out")
+        mock_http_client.is_closed = False
+        
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        with pytest.raises(LiteLLMTimeoutError):
+            await client.complete(sample_request)
+        
+        assert issubclass(LiteLLMTimeoutError, LiteLLMUnavailableError)
+    
+    @pytest.mark.asyncio
+    async def test_request_timeout_override(self, client: LiteLLMClient):
+        """A per-request timeout should set the read timeout of that call only."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"id": "chatcmpl-123", "choices": []}
+        
+        mock_http_client = AsyncMock()
+        mock_http_client.post.return_value = mock_response
+        mock_http_client.is_closed = False
+        
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        request = CompletionRequest(
+            model="gpt-4",
+            messages=[{"role": "user", "content": "Hello"}],
+            timeout=20.0,
+        )
+        await client.complete(request)
+        
+        timeout = mock_http_client.post.call_args.kwargs["timeout"]
+        assert timeout.read == 20.0
+        assert "timeout" not in request.to_dict()
+        
+        # Without an override the client default applies
+        await client.complete(CompletionRequest(model="gpt-4", messages=[]))
+        assert "timeout" not in mock_http_client.post.call_args.kwargs
+    
     @pytest.mark.asyncio
     async def test_health_check_success(self, client: LiteLLMClient):
         """Should return True when healthy."""
@@ -379,7 +441,7 @@ class TestLiteLLMClient:
         mock_http_client.get.return_value = mock_response
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         result = await client.health_check()
         
@@ -394,7 +456,7 @@ class TestLiteLLMClient:
         mock_http_client.get.side_effect = httpx.ConnectError("Connection refused")
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         result = await client.health_check()
         
@@ -406,9 +468,786 @@ class TestLiteLLMClient:
         mock_http_client = AsyncMock()
         mock_http_client.is_closed = False
         
-        client._client = mock_http_client
+        client._balancer.upstreams[0].client = mock_http_client
         
         await client.close()
         
         mock_http_client.aclose.assert_called_once()
-        assert client._client is None
+        assert client._balancer.upstreams[0].client is None
+
+
+def http_response(status_code: int, headers: dict = None, body: dict = None) -> MagicMock:
+    """Mock httpx response with a status, headers and JSON body."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.text = f"status {status_code}"
+    response.json.return_value = body or {"id": "chatcmpl-123", "choices": []}
+    return response
+
+
+class FakeStream:
+    """Async context manager standing in for httpx streaming responses."""
+    
+    def __init__(self, status_code: int, lines: list = (), headers: dict = None):
+        self.status_code = status_code
+        self.lines = lines
+        self.headers = headers or {}
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    async def aread(self) -> bytes:
+        return b"upstream error"
+    
+    async def aiter_lines(self):
+        for line in self.lines:
+            yield line
+
+
+class TestRetries:
+    """Tests for retry backoff, Retry-After and the retry budget."""
+    
+    @pytest.fixture
+    def sleeps(self):
+        """Record retry delays instead of sleeping."""
+        with patch("cfx.litellm_client.asyncio.sleep", new_callable=AsyncMock) as sleep:
+            yield sleep
+    
+    def test_parse_retry_after(self):
+        """Retry-After should accept seconds and HTTP dates."""
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after("-1") == 0.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+    
+    def test_token_budget(self):
+        """Budget should allow one withdrawal per 1/ratio deposits once drained."""
+        budget = TokenBudget(ratio=0.5, burst=1)
+        
+        assert budget.try_withdraw() is True
+        assert budget.try_withdraw() is False
+        budget.deposit()
+        assert budget.try_withdraw() is False
+        budget.deposit()
+        assert budget.try_withdraw() is True
+        
+        for _ in range(10):
+            budget.deposit()
+        assert budget.tokens == 1
+    
+    def test_backoff_is_jittered_and_capped(self, client: LiteLLMClient):
+        """Decorrelated jitter should stay within [base, min(cap, 3x previous)]."""
+        retry = client.config.retry
+        delays = set()
+        previous = retry.backoff_base
+        for _ in range(50):
+            delay = client._next_backoff(previous)
+            assert retry.backoff_base <= delay <= min(retry.backoff_cap, previous * 3)
+            delays.add(delay)
+            previous = delay
+        
+        assert len(delays) > 1
+        assert previous <= retry.backoff_cap
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_honored(
+        self, client: LiteLLMClient, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """A retryable status with Retry-After should wait that long."""
+        mock_http_client = AsyncMock()
+        mock_http_client.post.side_effect = [
+            http_response(429, headers={"Retry-After": "2"}),
+            http_response(200),
+        ]
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        await client.complete(sample_request)
+        
+        sleeps.assert_awaited_once_with(2.0)
+        assert client.get_stats()["retries"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_long_retry_after_not_waited(
+        self, client: LiteLLMClient, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """A Retry-After beyond max_retry_after should fail at once."""
+        mock_http_client = AsyncMock()
+        mock_http_client.post.return_value = http_response(503, headers={"Retry-After": "120"})
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        with pytest.raises(LiteLLMError) as exc_info:
+            await client.complete(sample_request)
+        
+        assert exc_info.value.status_code == 503
+        assert mock_http_client.post.call_count == 1
+        sleeps.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_budget_exhaustion_stops_retries(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """With the retry budget spent, failures should not be retried."""
+        config.retry = RetryConfig(budget_ratio=0.1, budget_burst=2)
+        client = LiteLLMClient(config)
+        
+        mock_http_client = AsyncMock()
+        mock_http_client.post.side_effect = httpx.ConnectError("Connection refused")
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        for _ in range(4):
+            with pytest.raises(LiteLLMUnavailableError):
+                await client.complete(sample_request)
+        
+        # Two retries from the burst, then one attempt per request
+        assert mock_http_client.post.call_count == 6
+        stats = client.get_stats()
+        assert stats["retries"] == 2
+        assert stats["retries_denied"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_stream_retried_before_first_byte(
+        self, client: LiteLLMClient, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """Connect failures on streams should be absorbed by a retry."""
+        mock_http_client = MagicMock()
+        mock_http_client.stream.side_effect = [
+            httpx.ConnectError("Connection refused"),
+            FakeStream(200, lines=['data: {"id": "1"}']),
+        ]
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        chunks = [chunk async for chunk in client.stream(sample_request)]
+        
+        assert chunks == ['data: {"id": "1"}\n', "data: [DONE]\n\n"]
+        assert mock_http_client.stream.call_count == 2
+        sleeps.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_stream_retryable_status_retried(
+        self, client: LiteLLMClient, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """A 503 before the stream starts should be retried."""
+        mock_http_client = MagicMock()
+        mock_http_client.stream.side_effect = [
+            FakeStream(503, headers={"Retry-After": "1"}),
+            FakeStream(200, lines=["data: {}"]),
+        ]
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        chunks = [chunk async for chunk in client.stream(sample_request)]
+        
+        assert chunks[-1] == "data: [DONE]\n\n"
+        sleeps.assert_awaited_once_with(1.0)
+    
+    @pytest.mark.asyncio
+    async def test_stream_client_error_not_retried(
+        self, client: LiteLLMClient, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """Non-retryable stream statuses should fail on the first attempt."""
+        mock_http_client = MagicMock()
+        mock_http_client.stream.return_value = FakeStream(400)
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        with pytest.raises(LiteLLMError) as exc_info:
+            async for _ in client.stream(sample_request):
+                pass
+        
+        assert exc_info.value.status_code == 400
+        assert mock_http_client.stream.call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_read_timeout_not_retried(
+        self, client: LiteLLMClient, sample_request: CompletionRequest, sleeps: AsyncMock
+    ):
+        """Read timeouts on streams should surface rather than be retried."""
+        mock_http_client = MagicMock()
+        mock_http_client.stream.side_effect = httpx.ReadTimeout("timed out")
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        with pytest.raises(LiteLLMTimeoutError):
+            async for _ in client.stream(sample_request):
+                pass
+        
+        assert mock_http_client.stream.call_count == 1
+
+
+async def chunks_of(*chunks: bytes):
+    """Async iterator over byte chunks."""
+    for chunk in chunks:
+        yield chunk
+
+
+def sse_event(n: int) -> bytes:
+    """One upstream token chunk event."""
+    data = {
+        "id": "chatcmpl-123",
+        "object": "chat.completion.chunk",
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": {"content": f" token{n}"}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+def mock_transport_client(chunks: list[bytes]) -> httpx.AsyncClient:
+    """HTTP client whose every response streams the given chunks."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=chunks_of(*chunks))
+    
+    return httpx.AsyncClient(base_url="http://litellm", transport=httpx.MockTransport(handler))
+
+
+class TestRawStreaming:
+    """Tests for byte passthrough streaming."""
+    
+    @pytest.mark.asyncio
+    async def test_whole_events_pass_through(self):
+        """Chunks ending on an event boundary should be forwarded unchanged."""
+        first, second = sse_event(1), sse_event(2) + sse_event(3)
+        
+        framed = [chunk async for chunk in frame_sse_events(chunks_of(first, second))]
+        
+        assert framed == [first, second]
+        assert framed[0] is first
+    
+    @pytest.mark.asyncio
+    async def test_split_events_reframed(self):
+        """Events split across chunks should be re-joined on boundaries."""
+        event = sse_event(1)
+        
+        framed = [
+            chunk async for chunk in frame_sse_events(
+                chunks_of(event[:10], event[10:] + event[:5], event[5:])
+            )
+        ]
+        
+        assert framed == [event, event]
+    
+    @pytest.mark.asyncio
+    async def test_crlf_events_framed_as_they_arrive(self):
+        """CRLF-delimited events should be forwarded per chunk, not at EOF."""
+        crlf = [sse_event(n).replace(b"\n", b"\r\n") for n in range(3)]
+        
+        framed = []
+        async for chunk in frame_sse_events(chunks_of(*crlf)):
+            framed.append(chunk)
+        
+        assert framed == [sse_event(0), sse_event(1), sse_event(2)]
+    
+    @pytest.mark.asyncio
+    async def test_crlf_split_between_cr_and_lf(self):
+        """A CRLF split across chunks should not become two line breaks."""
+        event = sse_event(1).replace(b"\n", b"\r\n")
+        cut = len(event) - 1  # Between the final CR and LF
+        
+        framed = [
+            chunk async for chunk in frame_sse_events(
+                chunks_of(event[:cut], event[cut:] + event[:cut], event[cut:])
+            )
+        ]
+        
+        assert b"".join(framed) == sse_event(1) * 2
+        assert all(chunk.endswith(b"\n\n") for chunk in framed)
+    
+    @pytest.mark.asyncio
+    async def test_cr_line_endings(self):
+        """Bare CR line endings should be recognised too."""
+        framed = [
+            chunk async for chunk in frame_sse_events(chunks_of(b"data: 1\r\rdata: 2\r\r"))
+        ]
+        
+        # The trailing CR could start a CRLF, so the last event waits for EOF
+        assert framed == [b"data: 1\n\n", b"data: 2\n\n"]
+    
+    @pytest.mark.asyncio
+    async def test_unterminated_tail_flushed(self):
+        """A final event without a blank line should be terminated."""
+        framed = [chunk async for chunk in frame_sse_events(chunks_of(b"data: {}\n"))]
+        
+        assert framed == [b"data: {}\n\n"]
+    
+    @pytest.mark.asyncio
+    async def test_stream_raw_yields_upstream_bytes(
+        self, client: LiteLLMClient, sample_request: CompletionRequest
+    ):
+        """stream_raw() should forward upstream events and add [DONE] if missing."""
+        client._balancer.upstreams[0].client = mock_transport_client([sse_event(1), sse_event(2)])
+        
+        chunks = [chunk async for chunk in client.stream_raw(sample_request)]
+        
+        assert b"".join(chunks) == sse_event(1) + sse_event(2) + b"data: [DONE]\n\n"
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+    
+    @pytest.mark.asyncio
+    async def test_stream_raw_keeps_upstream_done(
+        self, client: LiteLLMClient, sample_request: CompletionRequest
+    ):
+        """An upstream [DONE] should not be duplicated."""
+        client._balancer.upstreams[0].client = mock_transport_client(
+            [sse_event(1), b"data: [DONE]\n\n"]
+        )
+        
+        chunks = [chunk async for chunk in client.stream_raw(sample_request)]
+        
+        assert b"".join(chunks).count(b"[DONE]") == 1
+    
+    @pytest.mark.benchmark
+    @pytest.mark.asyncio
+    async def test_cpu_per_chunk_below_text_mode(
+        self, client: LiteLLMClient, sample_request: CompletionRequest
+    ):
+        """Benchmark: passthrough should cost less CPU per token chunk than stream()."""
+        events = [sse_event(n) for n in range(2000)] + [b"data: [DONE]\n\n"]
+        client._balancer.upstreams[0].client = mock_transport_client(events)
+        
+        async def cpu_us_per_chunk(stream) -> float:
+            best = float("inf")
+            for _ in range(5):
+                start = time.process_time()
+                async for chunk in stream(sample_request):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode("utf-8")  # As StreamingResponse does
+                best = min(best, time.process_time() - start)
+            return best / len(events) * 1e6
+        
+        text = await cpu_us_per_chunk(client.stream)
+        raw = await cpu_us_per_chunk(client.stream_raw)
+        
+        assert raw < text * 0.75, f"raw {raw:.2f}us vs text {text:.2f}us CPU per chunk"
+
+
+def usage_event(prompt: int, completion: int) -> bytes:
+    """Final usage-only chunk sent for stream_options.include_usage."""
+    data = {
+        "id": "chatcmpl-123",
+        "choices": [],
+        "usage": {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+        },
+    }
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+async def paced_chunks(*pairs: tuple[float, bytes], log: Optional[list] = None):
+    """Async iterator yielding each chunk after its delay (seconds)."""
+    try:
+        for delay, chunk in pairs:
+            await asyncio.sleep(delay)
+            yield chunk
+    finally:
+        if log is not None:
+            log.append("closed")
+
+
+class TestSSECoalescing:
+    """Tests for coalescing streamed events into fewer writes."""
+    
+    def test_config_from_dict(self):
+        """Coalescing should be off unless the streaming section enables it."""
+        assert CoalesceConfig.from_dict({}).enabled is False
+        
+        config = CoalesceConfig.from_dict({"coalesce": True, "max_delay": 0.01})
+        
+        assert config.enabled is True
+        assert config.max_delay == 0.01
+        assert config.max_bytes == CoalesceConfig().max_bytes
+    
+    @pytest.mark.asyncio
+    async def test_burst_batched_with_boundaries(self):
+        """Events arriving together should share writes, byte for byte."""
+        events = [sse_event(n) for n in range(200)]
+        
+        writes = [
+            chunk async for chunk in coalesce_sse_events(
+                chunks_of(*events), max_delay=0.01, max_bytes=1 << 20
+            )
+        ]
+        
+        assert b"".join(writes) == b"".join(events)
+        assert len(writes) <= 3
+        assert all(chunk.endswith(b"\n\n") for chunk in writes)
+    
+    @pytest.mark.asyncio
+    async def test_first_chunk_not_delayed(self):
+        """The first event should be written at once, not after max_delay."""
+        stream = coalesce_sse_events(
+            paced_chunks((0, sse_event(1)), (1.0, sse_event(2))),
+            max_delay=0.5,
+            max_bytes=1 << 20,
+        )
+        
+        started = time.monotonic()
+        first = await stream.__anext__()
+        
+        assert first == sse_event(1)
+        assert time.monotonic() - started < 0.1
+        await stream.aclose()
+    
+    @pytest.mark.asyncio
+    async def test_slow_events_written_separately(self):
+        """Events further apart than max_delay should not wait for each other."""
+        events = [sse_event(n) for n in range(3)]
+        
+        writes = [
+            chunk async for chunk in coalesce_sse_events(
+                paced_chunks(*((0.03, event) for event in events)),
+                max_delay=0.005,
+                max_bytes=1 << 20,
+            )
+        ]
+        
+        assert writes == events
+    
+    @pytest.mark.asyncio
+    async def test_max_bytes_bounds_writes(self):
+        """Writes should go out once max_bytes are waiting."""
+        events = [sse_event(n) for n in range(100)]
+        max_bytes = len(events[0]) * 10
+        
+        writes = [
+            chunk async for chunk in coalesce_sse_events(
+                chunks_of(*events), max_delay=10.0, max_bytes=max_bytes
+            )
+        ]
+        
+        assert b"".join(writes) == b"".join(events)
+        # A 10s hold would time the test out; max_bytes flushes instead
+        assert len(writes) >= 9
+        assert max(len(chunk) for chunk in writes) < max_bytes + len(events[0]) * 2
+    
+    @pytest.mark.asyncio
+    async def test_error_raised_after_buffered_events(self):
+        """An upstream error should surface only after earlier events."""
+        async def failing():
+            yield sse_event(1)
+            raise LiteLLMError(502, "stream broke")
+        
+        writes = []
+        with pytest.raises(LiteLLMError):
+            async for chunk in coalesce_sse_events(failing(), 0.005, 1 << 20):
+                writes.append(chunk)
+        
+        assert writes == [sse_event(1)]
+    
+    @pytest.mark.asyncio
+    async def test_close_closes_source(self):
+        """Closing the coalescer should close the upstream stream."""
+        log = []
+        stream = coalesce_sse_events(
+            paced_chunks((0, sse_event(1)), (60, sse_event(2)), log=log),
+            max_delay=0.005,
+            max_bytes=1 << 20,
+        )
+        
+        await stream.__anext__()
+        await stream.aclose()
+        
+        assert log == ["closed"]
+
+
+class TestStreamUsage:
+    """Tests for streamed token usage sniffing."""
+    
+    def test_include_usage_requested_for_streams(self):
+        """stream_options should be sent only for streams asking for usage."""
+        request = CompletionRequest(model="gpt-4", messages=[], stream=True, include_usage=True)
+        assert request.to_dict()["stream_options"] == {"include_usage": True}
+        
+        request.stream = False
+        assert "stream_options" not in request.to_dict()
+    
+    def test_usage_chunk_extracted_and_removed(self):
+        """The usage-only event should be read and dropped from the stream."""
+        usage = StreamUsage()
+        delta = sse_event(1)
+        
+        assert usage.feed(delta) is delta
+        assert usage.feed(usage_event(12, 34) + b"data: [DONE]\n\n") == b"data: [DONE]\n\n"
+        assert usage.tokens(prompt_estimate=999) == (12, 34, False)
+    
+    def test_usage_chunk_forwarded_when_requested(self):
+        """Clients asking for usage should receive the usage event."""
+        usage = StreamUsage(forward_usage=True)
+        event = usage_event(5, 6)
+        
+        assert usage.feed(event) == event
+        assert usage.tokens(0) == (5, 6, False)
+    
+    def test_null_usage_ignored(self):
+        """Deltas carrying "usage": null should not count as usage."""
+        usage = StreamUsage()
+        chunk = b'data: {"choices": [{"delta": {"content": "abcd"}}], "usage": null}\n\n'
+        
+        assert usage.feed(chunk) is chunk
+        assert usage.usage is None
+    
+    def test_usage_event_joined_after_null_usage_delta(self):
+        """A usage event sharing a chunk with a "usage": null delta should be found."""
+        usage = StreamUsage()
+        delta = b'data: {"choices": [{"delta": {"content": "abcd"}}], "usage": null}\n\n'
+        
+        forwarded = usage.feed(delta + usage_event(7, 8) + b"data: [DONE]\n\n")
+        
+        assert usage.tokens(prompt_estimate=999) == (7, 8, False)
+        assert forwarded == delta + b"data: [DONE]\n\n"
+    
+    def test_fallback_estimate_from_content(self):
+        """Without usage, completion tokens should be estimated from content bytes."""
+        usage = StreamUsage()
+        usage.feed(b'data: {"choices": [{"delta": {"content": "12345678"}}]}\n\n')
+        usage.feed(b'data: {"choices": [{"delta": {"content": "a\\"b\\\\"}}]}\n\n')
+        usage.feed(b'data: {"choices": [{"delta": {"content": null}}]}\n\n')
+        
+        # 8 bytes + 6 bytes (escapes included) -> 4 tokens
+        assert usage.content_bytes == 14
+        assert usage.tokens(prompt_estimate=20) == (20, 4, True)
+    
+    @pytest.mark.benchmark
+    def test_feed_cheaper_than_parsing(self):
+        """Benchmark: sniffing a delta should cost well under JSON-parsing it."""
+        chunk = sse_event(1)
+        usage = StreamUsage()
+        n = 20000
+        
+        def best_of(func) -> float:
+            best = float("inf")
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(n):
+                    func(chunk)
+                best = min(best, time.perf_counter() - start)
+            return best / n * 1e9
+        
+        sniff = best_of(usage.feed)
+        parse = best_of(lambda c: json.loads(c[6:]))
+        
+        assert sniff < parse * 0.5, f"sniff {sniff:.0f}ns vs parse {parse:.0f}ns per chunk"
+
+
+class TestConnectionPool:
+    """Tests for pool configuration and utilization tracking."""
+    
+    def test_config_from_dict(self):
+        """Pool settings should be read from the upstream section."""
+        pool = PoolConfig.from_dict({"max_connections": 200, "http2": True})
+        
+        assert pool.max_connections == 200
+        assert pool.http2 is True
+        assert pool.max_keepalive_connections == PoolConfig().max_keepalive_connections
+    
+    @pytest.mark.asyncio
+    async def test_pool_limits_applied(self, config: LiteLLMConfig):
+        """The HTTP client should be built from the pool config."""
+        config.pool = PoolConfig(max_connections=7, max_keepalive_connections=3)
+        client = LiteLLMClient(config)
+        
+        http_client = await client._get_client(client._balancer.upstreams[0])
+        try:
+            pool = http_client._transport._pool
+            assert pool._max_connections == 7
+            assert pool._max_keepalive_connections == 3
+            
+            stats = client.get_stats()
+            assert stats["pool"]["max_connections"] == 7
+            assert stats["upstreams"][0]["connections_active"] == 0
+        finally:
+            await client.close()
+    
+    def test_http2_falls_back_without_h2(self, config: LiteLLMConfig):
+        """HTTP/2 should degrade to HTTP/1.1 when h2 is not installed."""
+        config.pool = PoolConfig(http2=True)
+        
+        with patch("cfx.litellm_client.http2_available", return_value=False):
+            client = LiteLLMClient(config)
+        
+        assert client._http2 is False
+        assert client.get_stats()["pool"]["http2"] is False
+    
+    @pytest.mark.asyncio
+    async def test_requests_traced(self, client: LiteLLMClient, sample_request: CompletionRequest):
+        """Upstream calls should carry the pool trace hook."""
+        mock_http_client = AsyncMock()
+        mock_http_client.post.return_value = http_response(200)
+        mock_http_client.is_closed = False
+        client._balancer.upstreams[0].client = mock_http_client
+        
+        await client.complete(sample_request)
+        
+        assert "trace" in mock_http_client.post.call_args.kwargs["extensions"]
+        assert client.get_stats()["upstreams"][0]["requests_in_flight"] == 0
+
+
+class TestIsRetryableError:
+    """Tests for upstream error classification."""
+    
+    def test_unavailable_is_retryable(self):
+        """Connection failures and timeouts should be retryable."""
+        assert is_retryable_error(LiteLLMUnavailableError("timeout")) is True
+    
+    @pytest.mark.parametrize("status_code", [429, 500, 502, 503, 504])
+    def test_transient_status_retryable(self, status_code: int):
+        """Rate limits and server errors should be retryable."""
+        assert is_retryable_error(LiteLLMError(status_code, "error")) is True
+    
+    @pytest.mark.parametrize("status_code", [400, 401, 404, 422])
+    def test_client_errors_not_retryable(self, status_code: int):
+        """Client errors would fail on any model."""
+        assert is_retryable_error(LiteLLMError(status_code, "error")) is False
+    
+    def test_other_exceptions_not_retryable(self):
+        """Unrelated exceptions should not trigger failover."""
+        assert is_retryable_error(ValueError("bug")) is False
+
+
+class TestHedgedRequests:
+    """Tests for hedged non-streaming requests."""
+    
+    @staticmethod
+    def hedging_client(config: LiteLLMConfig, delays: list, **hedge) -> LiteLLMClient:
+        """Client whose n-th upstream call takes delays[n] seconds.
+        
+        A (delay, error) pair makes that call fail with error after delay.
+        """
+        client = LiteLLMClient(config, HedgeConfig(enabled=True, **hedge))
+        client.calls = []
+        client.cancelled = []
+        
+        async def fake_complete(request):
+            n = len(client.calls)
+            client.calls.append(n)
+            delay, error = delays[n] if isinstance(delays[n], tuple) else (delays[n], None)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                client.cancelled.append(n)
+                raise
+            if error is not None:
+                raise error
+            return CompletionResponse(id=f"call-{n}", choices=[], usage=None, model="gpt-4")
+        
+        client._complete = fake_complete
+        return client
+    
+    def test_config_from_dict(self):
+        """Hedging should be opt-in and read from the hedging section."""
+        assert HedgeConfig().enabled is False
+        
+        config = HedgeConfig.from_dict({"enabled": True, "stages": ["code"], "budget_ratio": 0.05})
+        assert config.enabled is True
+        assert config.stages == ["code"]
+        assert config.budget_ratio == 0.05
+        assert config.percentile == 0.95
+    
+    @pytest.mark.asyncio
+    async def test_fast_response_not_hedged(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """A call answering before the hedge delay should be sent once."""
+        client = self.hedging_client(config, [0.0])
+        
+        response = await client.complete(sample_request, hedge_after=0.5)
+        
+        assert response.id == "call-0"
+        assert client.calls == [0]
+        stats = client.get_stats()
+        assert stats["hedge_eligible"] == 1
+        assert stats["hedges_sent"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_slow_response_hedged_and_loser_cancelled(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """A slow call should be hedged and the losing request cancelled."""
+        client = self.hedging_client(config, [5.0, 0.0])
+        
+        response = await client.complete(sample_request, hedge_after=0.01)
+        await asyncio.sleep(0)
+        
+        assert response.id == "call-1"
+        assert client.cancelled == [0]
+        stats = client.get_stats()
+        assert stats["hedges_sent"] == 1
+        assert stats["hedge_wins"] == 1
+        assert stats["hedge_rate"] == 1.0
+    
+    @pytest.mark.asyncio
+    async def test_primary_can_still_win(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """The original call should win if it answers before the hedge."""
+        client = self.hedging_client(config, [0.05, 5.0])
+        
+        response = await client.complete(sample_request, hedge_after=0.01)
+        await asyncio.sleep(0)
+        
+        assert response.id == "call-0"
+        assert client.cancelled == [1]
+        assert client.get_stats()["hedge_wins"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_failed_request_falls_back_to_other(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """A failure of one request should not fail the call while the other runs."""
+        client = self.hedging_client(config, [(0.05, LiteLLMError(503, "busy")), 0.1])
+        
+        response = await client.complete(sample_request, hedge_after=0.01)
+        
+        assert response.id == "call-1"
+    
+    @pytest.mark.asyncio
+    async def test_both_failures_raise(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """The call should fail only when both requests fail."""
+        error = LiteLLMError(503, "busy")
+        client = self.hedging_client(config, [(0.02, error), (0.02, error)])
+        
+        with pytest.raises(LiteLLMError):
+            await client.complete(sample_request, hedge_after=0.01)
+        assert client.get_stats()["hedges_sent"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_budget_limits_hedges(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """Without budget tokens a slow call should not be hedged."""
+        client = self.hedging_client(config, [0.02, 0.02], budget_ratio=0.5, budget_burst=1)
+        client._hedge_budget.tokens = 0
+        
+        # First call earns half a token: not enough to hedge
+        await client.complete(sample_request, hedge_after=0.01)
+        assert client.get_stats()["hedges_denied"] == 1
+        
+        # Second call completes the token and spends it
+        client.calls.clear()
+        await client.complete(sample_request, hedge_after=0.01)
+        stats = client.get_stats()
+        assert stats["hedges_sent"] == 1
+        assert stats["hedge_budget_tokens"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_disabled_ignores_hedge_delay(
+        self, config: LiteLLMConfig, sample_request: CompletionRequest
+    ):
+        """With hedging disabled, hedge_after should have no effect."""
+        client = self.hedging_client(config, [0.02, 0.0])
+        client.hedge_config.enabled = False
+        
+        response = await client.complete(sample_request, hedge_after=0.0)
+        
+        assert response.id == "call-0"
+        assert client.get_stats()["hedge_eligible"] == 0
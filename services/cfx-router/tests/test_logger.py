@@ -5,6 +5,8 @@ Includes property-based tests using Hypothesis.
 """
 
 import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import replace
 from datetime import datetime, timezone
 from decimal import Decimal
 import pytest
@@ -16,6 +18,8 @@ from cfx.logger import (
     RequestLogEntry,
     generate_request_id,
     calculate_cost,
+    estimate_tokens,
+    estimate_request_tokens,
 )
 
 
@@ -281,6 +285,39 @@ class TestRequestLogEntry:
         after = datetime.now(timezone.utc)
         
         assert before <= entry.created_at <= after
+    
+    def test_stream_timings_default_empty(self, sample_entry: RequestLogEntry):
+        """Non-streaming entries should carry no stream timings."""
+        result = sample_entry.to_dict()
+        
+        assert result["is_streaming"] is False
+        assert result["time_to_first_token_ms"] is None
+        assert result["chunk_gap_p95_ms"] is None
+        assert result["completed_at"] is None
+    
+    def test_to_dict_stream_timings(self, sample_entry: RequestLogEntry):
+        """Streaming entries should serialize their timings."""
+        completed = datetime(2026, 10, 16, 12, 0, tzinfo=timezone.utc)
+        entry = replace(
+            sample_entry,
+            completed_at=completed,
+            is_streaming=True,
+            time_to_first_token_ms=350,
+            stream_duration_ms=2400,
+            chunk_count=120,
+            chunk_gap_p50_ms=15,
+            chunk_gap_p95_ms=40,
+            chunk_gap_p99_ms=900,
+        )
+        
+        result = entry.to_dict()
+        
+        assert result["is_streaming"] is True
+        assert result["time_to_first_token_ms"] == 350
+        assert result["stream_duration_ms"] == 2400
+        assert result["chunk_count"] == 120
+        assert result["chunk_gap_p99_ms"] == 900
+        assert result["completed_at"] == completed.isoformat()
 
 
 class TestGenerateRequestId:
@@ -344,6 +381,28 @@ class TestCalculateCost:
         assert cost == expected
 
 
+class TestEstimateTokens:
+    """Unit tests for token estimation helpers."""
+    
+    def test_estimate_tokens(self):
+        """Should estimate roughly 4 characters per token."""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+    
+    def test_estimate_request_tokens_includes_max_tokens(self):
+        """Estimate should cover the prompt plus max_tokens."""
+        messages = [{"role": "user", "content": "x" * 400}]
+        
+        assert estimate_request_tokens(messages, max_tokens=1000) == 100 + 4 + 1000
+    
+    def test_estimate_request_tokens_content_parts(self):
+        """Text content parts should be counted."""
+        messages = [{"role": "user", "content": [{"type": "text", "text": "x" * 40}]}]
+        
+        assert estimate_request_tokens(messages) == 10 + 4
+
+
 class TestAsyncLogger:
     """Unit tests for AsyncLogger."""
     
@@ -452,6 +511,42 @@ class TestAsyncLogger:
         assert stats["queue_size"] == 1
         assert stats["queue_max_size"] == 100
         assert stats["running"] is False
+    
+    @pytest.mark.asyncio
+    async def test_write_batch_includes_stream_timings(
+        self, config: LoggerConfig, sample_entry: RequestLogEntry
+    ):
+        """Batch insert should write the stream timing columns."""
+        inserted = []
+        
+        class FakeConnection:
+            async def executemany(self, query, rows):
+                inserted.append((query, rows))
+        
+        class FakePool:
+            @asynccontextmanager
+            async def acquire(self):
+                yield FakeConnection()
+        
+        logger = AsyncLogger(config, db_pool=FakePool())
+        entry = replace(
+            sample_entry,
+            is_streaming=True,
+            time_to_first_token_ms=350,
+            chunk_count=12,
+            chunk_gap_p95_ms=40,
+        )
+        
+        await logger._write_batch([entry])
+        
+        query, rows = inserted[0]
+        assert "time_to_first_token_ms" in query
+        assert "chunk_gap_p99_ms" in query
+        assert "$21" in query
+        row = rows[0]
+        assert len(row) == 21
+        assert row[14:19] == (True, 350, None, 12, None)
+        assert row[20] is None
 
 
 class TestAsyncLoggerConcurrency:
@@ -0,0 +1,426 @@
+"""
+Tests for CF-X Router streaming request handling (main.py).
+
+Covers client disconnects at each point of a stream's life.
+"""
+
+import asyncio
+import json
+import time
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+import main
+from cfx.auth import AuthModule, AuthResult
+from cfx.concurrency import ConcurrencyConfig, ConcurrencyLimiter
+from cfx.litellm_client import (
+    CompletionRequest,
+    CompletionResponse,
+    HedgeConfig,
+    LiteLLMClient,
+    LiteLLMConfig,
+    LiteLLMError,
+)
+from cfx.rate_limit import RateLimitConfig, RateLimiter, TokenReservation
+from cfx.routing import RoutingResult, Stage
+from cfx.scheduler import RequestScheduler, SchedulerConfig
+from main import log_request as real_log_request
+
+# =============================================================================
+# Test Fixtures
+# =============================================================================
+
+
+def sse_event(text: str) -> bytes:
+    """One upstream token chunk event."""
+    data = {"choices": [{"index": 0, "delta": {"content": text}}], "usage": None}
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+class FakeRawRequest:
+    """Starlette Request stand-in whose receive() reports a disconnect on demand."""
+    
+    def __init__(self):
+        self.disconnected = asyncio.Event()
+    
+    def disconnect(self) -> None:
+        self.disconnected.set()
+    
+    async def receive(self) -> dict:
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+
+class FakeUpstream:
+    """Upstream stream yielding scripted chunks; None stalls forever."""
+    
+    def __init__(self, *chunks):
+        self.chunks = chunks
+        self.waiting = asyncio.Event()
+        self.closed = False
+    
+    async def stream_raw(self, request: CompletionRequest):
+        try:
+            for chunk in self.chunks:
+                if chunk is None:
+                    self.waiting.set()
+                    await asyncio.Event().wait()
+                yield chunk
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def upstream() -> FakeUpstream:
+    """Upstream sending one token, then stalling."""
+    return FakeUpstream(sse_event("Hello there"), None)
+
+
+@pytest.fixture
+def logged(monkeypatch) -> list[dict]:
+    """Wire app_state for streaming and capture log_request calls."""
+    entries: list[dict] = []
+    
+    async def log_request(**kwargs):
+        entries.append(kwargs)
+    
+    monkeypatch.setattr(main, "log_request", log_request)
+    monkeypatch.setattr(main.app_state, "concurrency_limiter", ConcurrencyLimiter(
+        ConcurrencyConfig(max_concurrent_streams=1)
+    ))
+    monkeypatch.setattr(main.app_state, "scheduler", RequestScheduler(
+        SchedulerConfig(enabled=True, max_concurrent=1)
+    ))
+    monkeypatch.setattr(main.app_state, "stage_router", MagicMock(
+        get_stage_config=MagicMock(return_value=None)
+    ))
+    for name in ("rate_limiter", "latency_tracker", "circuit_breakers", "coalesce_config"):
+        monkeypatch.setattr(main.app_state, name, None)
+    return entries
+
+
+def handler_args(stream: bool) -> dict:
+    """Arguments shared by the streaming and non-streaming handlers."""
+    return dict(
+        completion_request=CompletionRequest(
+            model="deepseek-v3",
+            messages=[{"role": "user", "content": "write a function"}],
+            stream=stream,
+        ),
+        auth=AuthResult(authenticated=True, user_id="user-1", api_key_id=1),
+        request_id="cfx-test",
+        routing_result=RoutingResult(
+            stage=Stage.CODE, model="deepseek-v3", max_tokens=1024,
+            temperature=0.2, inferred=False,
+        ),
+        response_headers={},
+        start_time=time.monotonic(),
+    )
+
+
+async def start_stream(upstream: FakeUpstream, raw_request: FakeRawRequest):
+    """Run handle_streaming_request (which takes the stream's slots)."""
+    client = MagicMock(stream_raw=upstream.stream_raw)
+    client.config.read_timeout = 120.0
+    main.app_state.litellm_client = client
+    
+    return await main.handle_streaming_request(
+        **handler_args(stream=True), raw_request=raw_request
+    )
+
+
+async def respond(response, on_chunk=None) -> list[bytes]:
+    """Write the body as Starlette does, all chunks from one task."""
+    sent = []
+    async for chunk in response.body_iterator:
+        sent.append(chunk)
+        if on_chunk is not None:
+            await on_chunk()
+    return sent
+
+
+async def assert_released(upstream: FakeUpstream, logged: list[dict]) -> dict:
+    """Check the stream was torn down and logged as abandoned."""
+    assert upstream.closed
+    concurrency = await main.app_state.concurrency_limiter.get_stats()
+    assert concurrency["total_active_streams"] == 0
+    assert main.app_state.scheduler.get_stats()["in_flight"] == 0
+    
+    assert len(logged) == 1
+    entry = logged[0]
+    assert entry["status_code"] == main.CLIENT_CLOSED_STATUS
+    assert entry["error_message"] == "Client disconnected"
+    return entry
+
+
+# =============================================================================
+# Unit Tests
+# =============================================================================
+
+class TestClientDisconnect:
+    """Client disconnects should cancel upstream work and free the slots."""
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_before_first_chunk(self, logged: list[dict]):
+        """A client leaving before the first token should get no stream."""
+        upstream = FakeUpstream(None)
+        raw_request = FakeRawRequest()
+        
+        handler = asyncio.create_task(start_stream(upstream, raw_request))
+        await asyncio.wait_for(upstream.waiting.wait(), 1.0)
+        raw_request.disconnect()
+        response = await asyncio.wait_for(handler, 1.0)
+        
+        assert response.status_code == main.CLIENT_CLOSED_STATUS
+        entry = await assert_released(upstream, logged)
+        # The prompt was sent upstream, no completion came back
+        assert entry["prompt_tokens"] > 0
+        assert entry["completion_tokens"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_during_upstream_read(
+        self, upstream: FakeUpstream, logged: list[dict]
+    ):
+        """A client leaving while upstream stalls should interrupt the read."""
+        raw_request = FakeRawRequest()
+        response = await start_stream(upstream, raw_request)
+        
+        writer = asyncio.create_task(respond(response))
+        await asyncio.wait_for(upstream.waiting.wait(), 1.0)
+        raw_request.disconnect()
+        sent = await asyncio.wait_for(writer, 1.0)
+        
+        assert sent == [sse_event("Hello there")]
+        # The cancellation interrupting the read must not leak to the server
+        assert not writer.cancelled()
+        entry = await assert_released(upstream, logged)
+        # "Hello there" was streamed: 11 content bytes ~ 3 tokens
+        assert entry["completion_tokens"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_during_write(self, logged: list[dict]):
+        """A client leaving while a chunk is written should end the stream after it."""
+        upstream = FakeUpstream(sse_event("Hello there"), sse_event(" again"))
+        raw_request = FakeRawRequest()
+        response = await start_stream(upstream, raw_request)
+        
+        async def slow_write():
+            # The client goes away while the first chunk is being sent
+            raw_request.disconnect()
+            for _ in range(3):
+                await asyncio.sleep(0)
+        
+        sent = await asyncio.wait_for(respond(response, slow_write), 1.0)
+        
+        assert sent == [sse_event("Hello there")]
+        entry = await assert_released(upstream, logged)
+        assert entry["completion_tokens"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_completed_stream_logged_ok(self, logged: list[dict]):
+        """A stream the client reads to the end should log 200."""
+        upstream = FakeUpstream(sse_event("Hello there"), b"data: [DONE]\n\n")
+        response = await start_stream(upstream, FakeRawRequest())
+        
+        sent = await asyncio.wait_for(respond(response), 1.0)
+        
+        assert sent[-1] == b"data: [DONE]\n\n"
+        assert upstream.closed
+        assert logged[0]["status_code"] == 200
+        assert main.app_state.scheduler.get_stats()["in_flight"] == 0
+
+
+class TestStreamErrors:
+    """Streams failing before their first byte should still log as streams."""
+    
+    @pytest.mark.asyncio
+    async def test_error_before_first_chunk_logged_as_stream(
+        self, logged: list[dict], monkeypatch
+    ):
+        """An upstream error while opening a stream should log stream fields."""
+        async_logger = MagicMock(log=AsyncMock())
+        monkeypatch.setattr(main, "log_request", real_log_request)
+        monkeypatch.setattr(main.app_state, "async_logger", async_logger)
+        
+        async def failing_stream(request):
+            raise LiteLLMError(502, "bad gateway")
+            yield
+        
+        response = await start_stream(MagicMock(stream_raw=failing_stream), FakeRawRequest())
+        
+        assert response.status_code == 502
+        async_logger.log.assert_awaited_once()
+        entry = async_logger.log.call_args.args[0]
+        assert entry.status_code == 502
+        assert entry.is_streaming is True
+        assert entry.chunk_count == 0
+        assert entry.time_to_first_token_ms is None
+        assert main.app_state.scheduler.get_stats()["in_flight"] == 0
+
+
+class TestNonStreamingRequest:
+    """Tests for handle_non_streaming_request."""
+    
+    @staticmethod
+    async def complete(usage) -> MagicMock:
+        """Run a request answered with usage; return the rate limiter mock."""
+        client = MagicMock()
+        client.config.read_timeout = 120.0
+        client.complete = AsyncMock(return_value=CompletionResponse(
+            id="chatcmpl-1",
+            choices=[{"index": 0, "message": {"role": "assistant", "content": "x" * 40}}],
+            usage=usage,
+            model="deepseek-v3",
+        ))
+        main.app_state.litellm_client = client
+        main.app_state.rate_limiter = MagicMock()
+        reservation = TokenReservation(
+            user_id="user-1", day=date.today(), reserved=1030,
+            allowed=True, limit=100000, remaining=98970,
+        )
+        
+        response = await main.handle_non_streaming_request(
+            **handler_args(stream=False), token_reservation=reservation
+        )
+        
+        assert response.status_code == 200
+        main.app_state.rate_limiter.settle_tokens.assert_called_once()
+        return main.app_state.rate_limiter
+    
+    @pytest.mark.asyncio
+    async def test_settles_reported_usage(self, logged: list[dict]):
+        """Upstream usage should settle the token reservation."""
+        usage = {"prompt_tokens": 12, "completion_tokens": 30, "total_tokens": 42}
+        rate_limiter = await self.complete(usage)
+        
+        assert rate_limiter.settle_tokens.call_args.args[1] == 42
+        assert logged[0]["completion_tokens"] == 30
+    
+    @pytest.mark.asyncio
+    async def test_settles_estimate_without_usage(self, logged: list[dict]):
+        """A response without usage should still settle, with an estimate."""
+        rate_limiter = await self.complete(None)
+        
+        # "write a function": 4 tokens + 4 framing; 40 answer chars: 10 tokens
+        assert rate_limiter.settle_tokens.call_args.args[1] == 18
+        assert logged[0]["prompt_tokens"] == 8
+        assert logged[0]["completion_tokens"] == 10
+
+
+class TestComponentStats:
+    """Tests for the /health/stats endpoint."""
+    
+    @pytest.mark.asyncio
+    async def test_upstream_pool_stats(self, monkeypatch):
+        """Per-replica pool utilization should be reported."""
+        client = LiteLLMClient(LiteLLMConfig(
+            base_url="http://a:4000", upstreams=["http://a:4000", "http://b:4000"],
+        ))
+        monkeypatch.setattr(main.app_state, "litellm_client", client)
+        
+        stats = await main.component_stats()
+        
+        replicas = stats["litellm"]["upstreams"]
+        assert [replica["url"] for replica in replicas] == ["http://a:4000", "http://b:4000"]
+        assert replicas[0]["requests_in_flight"] == 0
+        assert replicas[0]["wait_max_ms"] == 0.0
+        assert stats["litellm"]["pool"]["max_connections"] == 100
+    
+    @pytest.mark.asyncio
+    async def test_hedge_stats(self, monkeypatch):
+        """Hedge rate and win counters should be reported."""
+        client = LiteLLMClient(
+            LiteLLMConfig(base_url="http://a:4000"), HedgeConfig(enabled=True)
+        )
+        delays = [0.2, 0.0]
+        
+        async def fake_complete(request):
+            await asyncio.sleep(delays.pop(0))
+            return CompletionResponse(id="call", choices=[], usage=None, model="gpt-4")
+        
+        client._complete = fake_complete
+        monkeypatch.setattr(main.app_state, "litellm_client", client)
+        request = CompletionRequest(model="gpt-4", messages=[{"role": "user", "content": "hi"}])
+        await client.complete(request, hedge_after=0.01)
+        
+        stats = (await main.component_stats())["litellm"]
+        
+        assert stats["hedging_enabled"] is True
+        assert stats["hedges_sent"] == 1
+        assert stats["hedge_wins"] == 1
+        assert stats["hedge_rate"] == 1.0
+    
+    @pytest.mark.asyncio
+    async def test_scheduler_stats(self, monkeypatch):
+        """Scheduler queue depth and wait metrics should be reported."""
+        scheduler = RequestScheduler(SchedulerConfig(enabled=True, max_concurrent=1))
+        monkeypatch.setattr(main.app_state, "litellm_client", None)
+        monkeypatch.setattr(main.app_state, "scheduler", scheduler)
+        holder = await scheduler.acquire("code", streaming=True)
+        waiter = asyncio.create_task(scheduler.acquire("code", streaming=True))
+        await asyncio.sleep(0)
+        
+        stats = (await main.component_stats())["scheduler"]
+        
+        assert stats["in_flight"] == 1
+        assert stats["queued"] == 1
+        assert stats["classes"]["code/default/stream"]["queued"] == 1
+        assert "queue_wait_max_ms" in stats["classes"]["code/default/stream"]
+        
+        scheduler.release(holder)
+        scheduler.release(await waiter)
+    
+    @pytest.mark.asyncio
+    async def test_stream_queue_stats(self, monkeypatch):
+        """Stream queue depth and drops should be reported without user IDs."""
+        limiter = ConcurrencyLimiter(ConcurrencyConfig(
+            max_concurrent_streams=1, queue_max_wait=1.0, queue_max_depth=1,
+        ))
+        monkeypatch.setattr(main.app_state, "concurrency_limiter", limiter)
+        await limiter.acquire("user-1")
+        waiter = asyncio.create_task(limiter.acquire("user-1"))
+        await asyncio.sleep(0)
+        assert await limiter.acquire("user-1") is False
+        
+        stats = (await main.component_stats())["concurrency"]
+        
+        assert stats["total_active_streams"] == 1
+        assert stats["queued_streams"] == 1
+        assert stats["queue_full_rejections"] == 1
+        assert "active_by_user" not in stats
+        
+        await limiter.release("user-1")
+        assert await waiter is True
+        await limiter.release("user-1")
+    
+    @pytest.mark.asyncio
+    async def test_auth_cache_stats(self, monkeypatch):
+        """API key cache counters should be reported."""
+        auth = AuthModule(None, "salt")
+        auth.cache.put("hash-1", AuthResult(authenticated=True, user_id="user-1"))
+        auth.cache.get("hash-1")
+        auth.cache.get("hash-2")
+        auth.invalidate("hash-1")
+        monkeypatch.setattr(main.app_state, "auth", auth)
+        monkeypatch.setattr(main.app_state, "key_status_listener", None)
+        
+        stats = (await main.component_stats())["auth"]["cache"]
+        
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["invalidations"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_rate_limiter_stats(self, monkeypatch):
+        """The rate limiter's memory footprint should be reported."""
+        rate_limiter = RateLimiter(RateLimitConfig(daily_limit=100))
+        await rate_limiter.check_and_increment("user-1")
+        monkeypatch.setattr(main.app_state, "rate_limiter", rate_limiter)
+        
+        stats = (await main.component_stats())["rate_limiter"]
+        
+        assert stats["backend"] == "memory"
+        assert stats["memory_store"]["entries"] == 1
+        assert stats["memory_store"]["approx_bytes"] > 0
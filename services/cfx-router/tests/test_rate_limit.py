@@ -4,11 +4,20 @@ Tests for CF-X Router Rate Limiting Module.
 Includes property-based tests using Hypothesis.
 """
 
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
 import pytest
 from hypothesis import given, strategies as st, settings
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
-from cfx.rate_limit import RateLimiter, RateLimitConfig
+from cfx.rate_limit import (
+    MemoryCounterStore,
+    RateLimiter,
+    RateLimitConfig,
+    RateLimitStatus,
+)
 
 
 # =============================================================================
@@ -232,3 +241,517 @@ class TestRateLimiter:
         current, remaining, reset_time = await limiter.get_status("user-1")
         assert current == 0
         assert remaining == 1000
+
+
+# =============================================================================
+# Leased Mode Tests
+# =============================================================================
+
+class FakeUsagePool:
+    """In-memory stand-in for a pool backed by the usage_counters table."""
+    
+    def __init__(self):
+        self.counts: dict = {}
+        self.fetchrow_calls = 0
+        self.execute_calls = 0
+    
+    async def fetchrow(self, query, user_id, day, n=1):
+        self.fetchrow_calls += 1
+        key = (user_id, day)
+        if query.lstrip().startswith("SELECT"):
+            return {"request_count": self.counts[key]} if key in self.counts else None
+        self.counts[key] = self.counts.get(key, 0) + n
+        return {"request_count": self.counts[key]}
+    
+    async def execute(self, query, user_ids, days, ns):
+        self.execute_calls += 1
+        for user_id, day, n in zip(user_ids, days, ns):
+            key = (user_id, day)
+            self.counts[key] = max(0, self.counts.get(key, 0) - n)
+        return "UPDATE"
+    
+    def acquire(self):
+        conn = self
+        
+        class _Ctx:
+            async def __aenter__(self):
+                return conn
+            
+            async def __aexit__(self, *exc):
+                return None
+        
+        return _Ctx()
+
+
+class TestLeasedRateLimiter:
+    """Unit tests for leased quota mode."""
+    
+    @pytest.mark.asyncio
+    async def test_one_reservation_per_lease(self):
+        """Requests within a lease should not touch the database."""
+        pool = FakeUsagePool()
+        limiter = RateLimiter(RateLimitConfig(daily_limit=1000, lease_size=50), db_pool=pool)
+        
+        for _ in range(50):
+            allowed, _, _ = await limiter.check_and_increment("user-1")
+            assert allowed
+        
+        assert pool.fetchrow_calls == 1
+        
+        await limiter.check_and_increment("user-1")
+        assert pool.fetchrow_calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_limit_never_exceeded_across_workers(self):
+        """Total admissions across workers should never exceed the daily limit."""
+        pool = FakeUsagePool()
+        workers = [
+            RateLimiter(RateLimitConfig(daily_limit=120, lease_size=50), db_pool=pool)
+            for _ in range(3)
+        ]
+        
+        admitted = 0
+        for _ in range(100):
+            for worker in workers:
+                allowed, _, _ = await worker.check_and_increment("user-1")
+                admitted += allowed
+        
+        assert admitted == 120
+    
+    @pytest.mark.asyncio
+    async def test_remaining_reflects_local_usage(self):
+        """Remaining should count down within a lease."""
+        pool = FakeUsagePool()
+        limiter = RateLimiter(RateLimitConfig(daily_limit=100, lease_size=10), db_pool=pool)
+        
+        _, remaining, _ = await limiter.check_and_increment("user-1")
+        assert remaining == 99
+        _, remaining, _ = await limiter.check_and_increment("user-1")
+        assert remaining == 98
+    
+    @pytest.mark.asyncio
+    async def test_exhausted_lease_denies_without_db(self):
+        """Once the limit is reached, denials are served locally during back-off."""
+        pool = FakeUsagePool()
+        limiter = RateLimiter(RateLimitConfig(daily_limit=5, lease_size=10), db_pool=pool)
+        
+        results = [(await limiter.check_and_increment("user-1")).allowed for _ in range(20)]
+        
+        assert results.count(True) == 5
+        assert pool.fetchrow_calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_stop_returns_unused_capacity(self):
+        """Stopping should return unused lease capacity in one UPDATE."""
+        pool = FakeUsagePool()
+        limiter = RateLimiter(RateLimitConfig(daily_limit=1000, lease_size=50), db_pool=pool)
+        await limiter.start()
+        
+        for _ in range(10):
+            await limiter.check_and_increment("user-1")
+            await limiter.check_and_increment("user-2")
+        
+        await limiter.stop()
+        
+        assert pool.execute_calls == 1
+        assert sorted(pool.counts.values()) == [10, 10]
+        assert limiter.get_stats()["active_leases"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_get_status_excludes_unused_lease(self):
+        """Status should report actual usage, not reserved capacity."""
+        pool = FakeUsagePool()
+        limiter = RateLimiter(RateLimitConfig(daily_limit=1000, lease_size=50), db_pool=pool)
+        
+        for _ in range(3):
+            await limiter.check_and_increment("user-1")
+        
+        current, remaining, _ = await limiter.get_status("user-1")
+        assert current == 3
+        assert remaining == 997
+
+
+class TestRateLimitStatus:
+    """Unit tests for RateLimitStatus."""
+    
+    @pytest.mark.asyncio
+    async def test_check_returns_status(self):
+        """check_and_increment should return a full status object."""
+        limiter = RateLimiter(RateLimitConfig(daily_limit=10), db_pool=None)
+        
+        status = await limiter.check_and_increment("user-1")
+        
+        assert isinstance(status, RateLimitStatus)
+        assert status.allowed is True
+        assert status.limit == 10
+        assert status.remaining == 9
+    
+    @pytest.mark.asyncio
+    async def test_tuple_unpacking(self):
+        """Status should still unpack as (allowed, remaining, reset_time)."""
+        limiter = RateLimiter(RateLimitConfig(daily_limit=10), db_pool=None)
+        
+        status = await limiter.check_and_increment("user-1")
+        allowed, remaining, reset_time = status
+        
+        assert (allowed, remaining, reset_time) == (status.allowed, status.remaining, status.reset_time)
+    
+    def test_to_headers(self):
+        """Headers should reflect the status fields."""
+        reset_time = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        status = RateLimitStatus(allowed=True, limit=1000, remaining=42, reset_time=reset_time)
+        
+        headers = status.to_headers()
+        
+        assert headers == {
+            "X-RateLimit-Limit": "1000",
+            "X-RateLimit-Remaining": "42",
+            "X-RateLimit-Reset": reset_time.isoformat(),
+        }
+
+
+# =============================================================================
+# Burst Tier Tests
+# =============================================================================
+
+class FakeGcraPool:
+    """In-memory stand-in for the rate_limit_gcra upsert."""
+    
+    def __init__(self):
+        self.tats: dict = {}
+    
+    async def fetch(self, query, user_id, names, intervals, periods):
+        now = time.time()
+        rows = []
+        for name, interval, period in zip(names, intervals, periods):
+            tat = self.tats.get((user_id, name))
+            new_tat = max(tat if tat is not None else now, now) + interval
+            admitted = new_tat - now <= period
+            if admitted:
+                self.tats[(user_id, name)] = new_tat
+            rows.append({
+                "tier": name,
+                "admitted": admitted,
+                "tat_ahead": tat - now if tat is not None else None,
+            })
+        return rows
+    
+    def acquire(self):
+        conn = self
+        
+        class _Ctx:
+            async def __aenter__(self):
+                return conn
+            
+            async def __aexit__(self, *exc):
+                return None
+        
+        return _Ctx()
+
+class TestBurstTiers:
+    """Unit tests for GCRA burst tiers and per-plan limits."""
+    
+    @pytest.mark.asyncio
+    async def test_per_second_tier_enforced(self):
+        """Requests beyond the per-second limit should be denied."""
+        config = RateLimitConfig(daily_limit=1000, per_second=3)
+        limiter = RateLimiter(config, db_pool=None)
+        
+        results = [await limiter.check_and_increment("user-1") for _ in range(5)]
+        
+        assert [r.allowed for r in results] == [True, True, True, False, False]
+        assert results[3].tier == "second"
+        assert 0 < results[3].retry_after <= 1.0
+    
+    @pytest.mark.asyncio
+    async def test_burst_denial_does_not_consume_daily_quota(self):
+        """Requests denied by a burst tier should not count toward the day."""
+        config = RateLimitConfig(daily_limit=1000, per_second=2)
+        limiter = RateLimiter(config, db_pool=None)
+        
+        for _ in range(5):
+            await limiter.check_and_increment("user-1")
+        
+        current, _, _ = await limiter.get_status("user-1")
+        assert current == 2
+    
+    @pytest.mark.asyncio
+    async def test_tier_recovers_after_emission_interval(self):
+        """A denied tier should admit again once the interval has passed."""
+        config = RateLimitConfig(daily_limit=1000, per_second=20)
+        limiter = RateLimiter(config, db_pool=None)
+        
+        for _ in range(20):
+            await limiter.check_and_increment("user-1")
+        assert (await limiter.check_and_increment("user-1")).allowed is False
+        
+        await asyncio.sleep(0.06)
+        
+        assert (await limiter.check_and_increment("user-1")).allowed is True
+    
+    @pytest.mark.asyncio
+    async def test_plan_limits(self):
+        """Plan-specific limits should override the defaults."""
+        config = RateLimitConfig.from_dict({
+            "daily_requests": 1000,
+            "plans": {"free": {"daily_requests": 2}},
+        })
+        limiter = RateLimiter(config, db_pool=None)
+        
+        for _ in range(2):
+            assert (await limiter.check_and_increment("user-1", plan="free")).allowed
+        status = await limiter.check_and_increment("user-1", plan="free")
+        
+        assert status.allowed is False
+        assert status.limit == 2
+        assert (await limiter.check_and_increment("user-2", plan="pro")).limit == 1000
+    
+    def test_from_dict_plan_inherits_defaults(self):
+        """Plans should inherit unset values from the top level."""
+        config = RateLimitConfig.from_dict({
+            "daily_requests": 500,
+            "requests_per_second": 5,
+            "requests_per_minute": 60,
+            "plans": {"pro": {"requests_per_minute": 120}},
+        })
+        
+        limits = config.limits_for("pro")
+        
+        assert limits.daily_limit == 500
+        assert limits.per_second == 5
+        assert limits.per_minute == 120
+        assert config.limits_for(None).per_minute == 60
+    
+    def test_retry_after_header(self):
+        """Denied burst status should include Retry-After."""
+        status = RateLimitStatus(
+            allowed=False,
+            limit=5,
+            remaining=0,
+            reset_time=datetime.now(timezone.utc),
+            tier="second",
+            retry_after=0.2,
+        )
+        
+        headers = status.to_headers()
+        
+        assert headers["Retry-After"] == "1"
+        assert headers["X-RateLimit-Tier"] == "second"
+    
+    @pytest.mark.asyncio
+    async def test_db_tier_missing_from_result_is_denied(self):
+        """A tier not returned by the GCRA upsert should deny the request."""
+        conn = MagicMock()
+        conn.fetch = AsyncMock(return_value=[
+            {"tier": "second", "admitted": True, "tat_ahead": 0.2},
+            {"tier": "minute", "admitted": False, "tat_ahead": 60.5},
+        ])
+        acquire_ctx = MagicMock()
+        acquire_ctx.__aenter__ = AsyncMock(return_value=conn)
+        acquire_ctx.__aexit__ = AsyncMock(return_value=None)
+        pool = MagicMock()
+        pool.acquire = MagicMock(return_value=acquire_ctx)
+        
+        config = RateLimitConfig(daily_limit=1000, per_second=5, per_minute=60)
+        limiter = RateLimiter(config, db_pool=pool)
+        
+        status = await limiter.check_and_increment("user-1")
+        
+        assert status.allowed is False
+        assert status.tier == "minute"
+        # TAT 60.5s ahead + 1s interval - 60s period
+        assert status.retry_after == pytest.approx(1.5)
+        assert conn.fetch.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_db_retry_after_matches_memory(self):
+        """Both backends should report the GCRA time to the next conforming request."""
+        config = RateLimitConfig(daily_limit=1000, per_second=2)
+        memory = RateLimiter(config, db_pool=None)
+        db = RateLimiter(config, db_pool=FakeGcraPool())
+        db._check_db = AsyncMock(return_value=RateLimitStatus(
+            allowed=True, limit=1000, remaining=999, reset_time=datetime.now(timezone.utc),
+        ))
+        
+        for limiter in (memory, db):
+            for _ in range(2):
+                assert (await limiter.check_and_increment("user-1")).allowed
+        await asyncio.sleep(0.2)
+        memory_status = await memory.check_and_increment("user-1")
+        db_status = await db.check_and_increment("user-1")
+        
+        assert memory_status.allowed is db_status.allowed is False
+        # TAT is 1s out; 0.2s later the next 0.5s interval conforms in 0.3s,
+        # not a full interval
+        assert memory_status.retry_after == pytest.approx(0.3, abs=0.08)
+        assert db_status.retry_after == pytest.approx(memory_status.retry_after, abs=0.05)
+
+
+# =============================================================================
+# Token Budget Tests
+# =============================================================================
+
+class TestTokenBudget:
+    """Unit tests for token reservation and settlement."""
+    
+    @pytest.mark.asyncio
+    async def test_no_budget_always_allowed(self):
+        """Without a token budget, reservations are no-ops."""
+        limiter = RateLimiter(RateLimitConfig(), db_pool=None)
+        
+        reservation = await limiter.reserve_tokens("user-1", 10**9)
+        
+        assert reservation.allowed is True
+        assert reservation.to_headers() == {}
+    
+    @pytest.mark.asyncio
+    async def test_reservation_denied_when_budget_exhausted(self):
+        """Reservations beyond the budget should be denied."""
+        limiter = RateLimiter(RateLimitConfig(daily_token_limit=1000), db_pool=None)
+        
+        first = await limiter.reserve_tokens("user-1", 600)
+        second = await limiter.reserve_tokens("user-1", 600)
+        
+        assert first.allowed is True
+        assert first.remaining == 400
+        assert second.allowed is False
+    
+    @pytest.mark.asyncio
+    async def test_settle_refunds_unused_estimate(self):
+        """Settling with actual usage should free the unused estimate."""
+        limiter = RateLimiter(RateLimitConfig(daily_token_limit=1000), db_pool=None)
+        
+        first = await limiter.reserve_tokens("user-1", 600)
+        limiter.settle_tokens(first, 100)
+        second = await limiter.reserve_tokens("user-1", 600)
+        
+        assert second.allowed is True
+        assert second.remaining == 300
+    
+    @pytest.mark.asyncio
+    async def test_settle_is_idempotent(self):
+        """Settling twice should only apply once."""
+        limiter = RateLimiter(RateLimitConfig(daily_token_limit=1000), db_pool=None)
+        
+        reservation = await limiter.reserve_tokens("user-1", 500)
+        limiter.settle_tokens(reservation, 0)
+        limiter.settle_tokens(reservation, 0)
+        
+        assert limiter._store.get("user-1").tokens == 0
+    
+    @pytest.mark.asyncio
+    async def test_db_settlements_flushed_in_bulk(self):
+        """Database settlements should be batched into one UPDATE."""
+        conn = MagicMock()
+        conn.fetchrow = AsyncMock(return_value={"token_count": 500})
+        conn.execute = AsyncMock(return_value="UPDATE 2")
+        acquire_ctx = MagicMock()
+        acquire_ctx.__aenter__ = AsyncMock(return_value=conn)
+        acquire_ctx.__aexit__ = AsyncMock(return_value=None)
+        pool = MagicMock()
+        pool.acquire = MagicMock(return_value=acquire_ctx)
+        limiter = RateLimiter(RateLimitConfig(daily_token_limit=10000), db_pool=pool)
+        
+        for user_id in ("user-1", "user-2", "user-1"):
+            reservation = await limiter.reserve_tokens(user_id, 500)
+            limiter.settle_tokens(reservation, 200)
+        
+        conn.execute.assert_not_awaited()
+        assert await limiter.flush_token_usage() == 2
+        assert conn.execute.await_count == 1
+        assert sorted(conn.execute.await_args.args[3]) == [-600, -300]
+    
+    @pytest.mark.asyncio
+    async def test_db_conditional_upsert_denies(self):
+        """No row from the conditional upsert means the budget is exhausted."""
+        conn = MagicMock()
+        conn.fetchrow = AsyncMock(return_value=None)
+        acquire_ctx = MagicMock()
+        acquire_ctx.__aenter__ = AsyncMock(return_value=conn)
+        acquire_ctx.__aexit__ = AsyncMock(return_value=None)
+        pool = MagicMock()
+        pool.acquire = MagicMock(return_value=acquire_ctx)
+        limiter = RateLimiter(RateLimitConfig(daily_token_limit=1000), db_pool=pool)
+        
+        reservation = await limiter.reserve_tokens("user-1", 500)
+        
+        assert reservation.allowed is False
+        assert reservation.settled is True
+
+
+# =============================================================================
+# Memory Store Tests
+# =============================================================================
+
+class TestMemoryCounterStore:
+    """Unit tests for the bounded in-memory counter store."""
+    
+    def test_hard_cap_evicts_lru(self):
+        """Store should never exceed max_entries."""
+        store = MemoryCounterStore(max_entries=100)
+        today = date(2026, 1, 1)
+        
+        for i in range(1000):
+            store.get_or_create(f"user-{i}", today)
+        
+        assert len(store) == 100
+        assert store.get_stats()["evictions"] == 900
+        assert store.get("user-0") is None
+        assert store.get("user-999") is not None
+    
+    def test_recently_used_survives_eviction(self):
+        """Touching an entry should protect it from eviction."""
+        store = MemoryCounterStore(max_entries=2)
+        today = date(2026, 1, 1)
+        store.get_or_create("a", today)
+        store.get_or_create("b", today)
+        store.get_or_create("a", today)
+        
+        store.get_or_create("c", today)
+        
+        assert store.get("a") is not None
+        assert store.get("b") is None
+    
+    def test_day_rollover_resets_counters(self):
+        """Entries should zero their daily counters on a new day."""
+        store = MemoryCounterStore(max_entries=10)
+        entry = store.get_or_create("a", date(2026, 1, 1))
+        entry.requests = 5
+        entry.tokens = 100
+        
+        entry = store.get_or_create("a", date(2026, 1, 2))
+        
+        assert entry.requests == 0
+        assert entry.tokens == 0
+    
+    def test_sweep_drops_stale_entries(self):
+        """Entries from previous days should be swept as new users arrive."""
+        store = MemoryCounterStore(max_entries=10**6)
+        for i in range(500):
+            store.get_or_create(f"old-{i}", date(2026, 1, 1))
+        
+        for i in range(MemoryCounterStore.SWEEP_EVERY * 8):
+            store.get_or_create(f"new-{i}", date(2026, 1, 2))
+        
+        assert store.get_stats()["expired"] > 0
+        assert store.get("old-0") is None
+    
+    def test_stats_report_memory(self):
+        """Stats should include an approximate byte count."""
+        store = MemoryCounterStore(max_entries=10)
+        store.get_or_create("a", date(2026, 1, 1))
+        
+        stats = store.get_stats()
+        
+        assert stats["entries"] == 1
+        assert stats["approx_bytes"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_limiter_memory_bounded(self):
+        """Limiter should stay within the cap under high-cardinality load."""
+        limiter = RateLimiter(RateLimitConfig(memory_max_entries=50), db_pool=None)
+        
+        for i in range(500):
+            await limiter.check_and_increment(f"user-{i}")
+        
+        assert limiter.get_stats()["memory_store"]["entries"] == 50
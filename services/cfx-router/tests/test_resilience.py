@@ -5,6 +5,7 @@ Includes property-based tests using Hypothesis.
 """
 
 import asyncio
+import time
 import pytest
 from hypothesis import given, strategies as st, settings, assume
 from hypothesis.stateful import RuleBasedStateMachine, rule, invariant, initialize
@@ -15,6 +16,9 @@ from cfx.resilience import (
     CircuitBreakerRegistry,
     CircuitState,
     CircuitOpenError,
+    AllCircuitsOpenError,
+    CircuitMode,
+    SlidingWindow,
 )
 
 
@@ -488,3 +492,396 @@ class TestCircuitBreakerRegistry:
         
         assert cb_a.state == CircuitState.CLOSED
         assert cb_b.state == CircuitState.CLOSED
+
+
+class TestExecuteWithFallback:
+    """Unit tests for CircuitBreakerRegistry.execute_with_fallback."""
+    
+    @pytest.mark.asyncio
+    async def test_primary_used_when_healthy(self):
+        """The first candidate should serve when it succeeds."""
+        registry = CircuitBreakerRegistry()
+        
+        async def call(name: str) -> str:
+            return f"from {name}"
+        
+        result, used = await registry.execute_with_fallback(["model-a", "model-b"], call)
+        
+        assert result == "from model-a"
+        assert used == "model-a"
+    
+    @pytest.mark.asyncio
+    async def test_skips_open_circuit(self, config: CircuitBreakerConfig):
+        """A candidate with an open circuit should not be called."""
+        registry = CircuitBreakerRegistry(config)
+        cb_a = await registry.get("model-a")
+        for _ in range(config.failure_threshold):
+            await cb_a.record_failure()
+        called = []
+        
+        async def call(name: str) -> str:
+            called.append(name)
+            return name
+        
+        _, used = await registry.execute_with_fallback(["model-a", "model-b"], call)
+        
+        assert used == "model-b"
+        assert called == ["model-b"]
+    
+    @pytest.mark.asyncio
+    async def test_retryable_error_fails_over(self, config: CircuitBreakerConfig):
+        """A retryable error should be counted and move to the next candidate."""
+        registry = CircuitBreakerRegistry(config)
+        
+        async def call(name: str) -> str:
+            if name == "model-a":
+                raise ConnectionError("down")
+            return name
+        
+        _, used = await registry.execute_with_fallback(["model-a", "model-b"], call)
+        
+        assert used == "model-b"
+        assert (await registry.get("model-a"))._failure_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_non_retryable_error_raised(self):
+        """A non-retryable error should be raised without failing over."""
+        registry = CircuitBreakerRegistry()
+        called = []
+        
+        async def call(name: str) -> str:
+            called.append(name)
+            raise ValueError("bad request")
+        
+        with pytest.raises(ValueError):
+            await registry.execute_with_fallback(
+                ["model-a", "model-b"],
+                call,
+                is_retryable=lambda e: not isinstance(e, ValueError),
+            )
+        
+        assert called == ["model-a"]
+        assert (await registry.get("model-a"))._failure_count == 0
+    
+    @pytest.mark.asyncio
+    async def test_last_error_raised_when_all_fail(self):
+        """The last retryable error should propagate once candidates run out."""
+        registry = CircuitBreakerRegistry()
+        
+        async def call(name: str) -> str:
+            raise ConnectionError(name)
+        
+        with pytest.raises(ConnectionError, match="model-b"):
+            await registry.execute_with_fallback(["model-a", "model-b"], call)
+    
+    @pytest.mark.asyncio
+    async def test_all_circuits_open(self, config: CircuitBreakerConfig):
+        """Should raise AllCircuitsOpenError when no candidate may be called."""
+        registry = CircuitBreakerRegistry(config)
+        for name in ("model-a", "model-b"):
+            cb = await registry.get(name)
+            for _ in range(config.failure_threshold):
+                await cb.record_failure()
+        
+        async def call(name: str) -> str:
+            return name
+        
+        with pytest.raises(AllCircuitsOpenError):
+            await registry.execute_with_fallback(["model-a", "model-b"], call)
+        
+        # Still a CircuitOpenError for existing handlers
+        assert issubclass(AllCircuitsOpenError, CircuitOpenError)
+
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_half_open_slot(self):
+        """A cancelled HALF_OPEN probe should not leave the circuit stuck."""
+        registry = CircuitBreakerRegistry(
+            CircuitBreakerConfig(failure_threshold=1, recovery_timeout=0.0, half_open_max_calls=1)
+        )
+        await (await registry.get("model-a")).record_failure()
+        probing = asyncio.Event()
+        
+        async def hang(name: str) -> str:
+            probing.set()
+            await asyncio.Event().wait()
+        
+        probe = asyncio.create_task(registry.execute_with_fallback(["model-a"], hang))
+        await probing.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        
+        async def call(name: str) -> str:
+            return name
+        
+        _, used = await registry.execute_with_fallback(["model-a"], call)
+        
+        assert used == "model-a"
+        assert (await registry.get("model-a")).state == CircuitState.CLOSED
+
+class LockedCircuitBreaker(CircuitBreaker):
+    """Reference breaker taking an asyncio.Lock per call, as before."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = asyncio.Lock()
+    
+    async def can_execute(self) -> bool:
+        async with self._lock:
+            return await super().can_execute()
+    
+    async def record_success(self) -> None:
+        async with self._lock:
+            await super().record_success()
+
+
+async def per_request_ns(cb: CircuitBreaker, n: int = 20000, repeats: int = 5) -> float:
+    """Best-of-N nanoseconds for one can_execute + record_success pair."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(n):
+            await cb.can_execute()
+            await cb.record_success()
+        best = min(best, time.perf_counter() - start)
+    return best / n * 1e9
+
+
+class TestLockFreeCircuitBreaker:
+    """Tests for the lock-free CLOSED fast path."""
+    
+    @pytest.mark.benchmark
+    @pytest.mark.asyncio
+    async def test_closed_overhead_below_locked(self, config: CircuitBreakerConfig):
+        """Micro-benchmark: the fast path should beat a per-call lock."""
+        lock_free = await per_request_ns(CircuitBreaker(config))
+        locked = await per_request_ns(LockedCircuitBreaker(config))
+        
+        assert lock_free < locked * 0.75, (
+            f"lock-free {lock_free:.0f}ns vs locked {locked:.0f}ns per request"
+        )
+    
+    @pytest.mark.asyncio
+    async def test_success_clears_failures_when_closed(self, circuit_breaker: CircuitBreaker):
+        """Success in CLOSED should still reset the consecutive failure count."""
+        await circuit_breaker.record_failure()
+        await circuit_breaker.record_failure()
+        await circuit_breaker.record_success()
+        await circuit_breaker.record_failure()
+        await circuit_breaker.record_failure()
+        
+        assert circuit_breaker.state == CircuitState.CLOSED
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_failures_open_once(self, circuit_breaker: CircuitBreaker):
+        """Concurrent failures should open the circuit exactly at the threshold."""
+        await asyncio.gather(*(circuit_breaker.record_failure() for _ in range(10)))
+        
+        assert circuit_breaker.state == CircuitState.OPEN
+        assert await circuit_breaker.can_execute() is False
+    
+    @pytest.mark.asyncio
+    async def test_half_open_admits_limited_calls_concurrently(
+        self, config: CircuitBreakerConfig
+    ):
+        """Concurrent checks in HALF_OPEN should admit only half_open_max_calls."""
+        cb = CircuitBreaker(
+            CircuitBreakerConfig(failure_threshold=1, recovery_timeout=0.0, half_open_max_calls=2)
+        )
+        await cb.record_failure()
+        
+        results = await asyncio.gather(*(cb.can_execute() for _ in range(10)))
+        
+        assert cb.state == CircuitState.HALF_OPEN
+        assert sum(results) == 2
+
+
+def rate_config(**overrides) -> CircuitBreakerConfig:
+    """Create a rate-mode configuration."""
+    values = dict(
+        mode=CircuitMode.RATE,
+        window_seconds=10.0,
+        window_buckets=10,
+        minimum_calls=10,
+        failure_rate_threshold=0.5,
+        recovery_timeout=1.0,
+    )
+    values.update(overrides)
+    return CircuitBreakerConfig(**values)
+
+
+class TestSlidingWindow:
+    """Unit tests for SlidingWindow."""
+    
+    def test_counts_and_rates(self):
+        """Rates should reflect the recorded outcomes."""
+        window = SlidingWindow(10.0, 10)
+        for i in range(10):
+            window.record(failed=i < 4, slow=i < 2, now=100.0)
+        
+        assert window.calls == 10
+        assert window.failure_rate == 0.4
+        assert window.slow_call_rate == 0.2
+    
+    def test_old_buckets_expire(self):
+        """Calls older than the window should drop out bucket by bucket."""
+        window = SlidingWindow(10.0, 10)
+        window.record(failed=True, slow=False, now=100.0)
+        window.record(failed=False, slow=False, now=105.0)
+        
+        window.record(failed=False, slow=False, now=110.5)
+        
+        # The t=100 bucket expired, the t=105 one is still in the window
+        assert window.calls == 2
+        assert window.failures == 0
+    
+    def test_idle_longer_than_window_resets(self):
+        """A gap longer than the window should clear everything."""
+        window = SlidingWindow(10.0, 10)
+        for _ in range(5):
+            window.record(failed=True, slow=True, now=100.0)
+        
+        window.record(failed=False, slow=False, now=500.0)
+        
+        assert window.calls == 1
+        assert window.failure_rate == 0.0
+
+
+class TestRateModeCircuitBreaker:
+    """Unit tests for the failure-rate / slow-call-rate mode."""
+    
+    @pytest.mark.asyncio
+    async def test_opens_on_failure_rate(self):
+        """A 40% failure rate should open the circuit without failure streaks."""
+        rate_cb = CircuitBreaker(rate_config(failure_rate_threshold=0.4), name="rate")
+        consecutive_cb = CircuitBreaker(CircuitBreakerConfig(failure_threshold=3), name="streak")
+        
+        for i in range(10):
+            for cb in (rate_cb, consecutive_cb):
+                if i % 5 in (0, 2):
+                    await cb.record_failure()
+                else:
+                    await cb.record_success()
+        
+        assert rate_cb.state == CircuitState.OPEN
+        assert consecutive_cb.state == CircuitState.CLOSED
+    
+    @pytest.mark.asyncio
+    async def test_minimum_calls_guard(self):
+        """A few failures below minimum_calls should not open the circuit."""
+        cb = CircuitBreaker(rate_config(minimum_calls=10), name="model")
+        
+        for _ in range(9):
+            await cb.record_failure()
+        
+        assert cb.state == CircuitState.CLOSED
+        
+        await cb.record_failure()
+        assert cb.state == CircuitState.OPEN
+    
+    @pytest.mark.asyncio
+    async def test_opens_on_slow_call_rate(self):
+        """Successful but slow calls should open the circuit."""
+        cb = CircuitBreaker(
+            rate_config(slow_call_duration=2.0, slow_call_rate_threshold=0.5),
+            name="model",
+        )
+        
+        for _ in range(10):
+            await cb.record_success(duration=3.0)
+        
+        assert cb.state == CircuitState.OPEN
+        assert await cb.can_execute() is False
+    
+    @pytest.mark.asyncio
+    async def test_slow_calls_ignored_when_disabled(self):
+        """slow_call_duration=0 should disable slow-call tracking."""
+        cb = CircuitBreaker(rate_config(slow_call_duration=0.0), name="model")
+        
+        for _ in range(20):
+            await cb.record_success(duration=100.0)
+        
+        assert cb.state == CircuitState.CLOSED
+    
+    @pytest.mark.asyncio
+    async def test_recovers_through_half_open(self):
+        """A rate-opened circuit should recover like a consecutive one."""
+        cb = CircuitBreaker(rate_config(recovery_timeout=0.0), name="model")
+        for _ in range(10):
+            await cb.record_failure()
+        
+        assert await cb.can_execute() is True
+        assert cb.state == CircuitState.HALF_OPEN
+        await cb.record_success()
+        
+        assert cb.state == CircuitState.CLOSED
+        assert cb.get_stats()["window"]["calls"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_calls_keep_accounting_balanced(self):
+        """Cancelled calls should neither count in the window nor hold a probe slot."""
+        registry = CircuitBreakerRegistry(rate_config(recovery_timeout=0.0))
+        cb = await registry.get("model")
+        
+        async def hang(name: str) -> str:
+            await asyncio.Event().wait()
+        
+        async def cancel_call() -> None:
+            call = asyncio.create_task(registry.execute_with_fallback(["model"], hang))
+            await asyncio.sleep(0)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+        
+        await cancel_call()
+        assert cb.get_stats()["window"]["calls"] == 0
+        
+        for _ in range(10):
+            await cb.record_failure()
+        await cancel_call()
+        
+        assert await cb.execute(asyncio.sleep, 0) is None
+        assert cb.state == CircuitState.CLOSED
+    
+    def test_stats_include_window(self):
+        """Rate-mode stats should expose window rates."""
+        stats = CircuitBreaker(rate_config(), name="model").get_stats()
+        
+        assert stats["mode"] == "rate"
+        assert stats["window"]["failure_rate"] == 0.0
+
+
+class TestCircuitBreakerConfigFromDict:
+    """Tests for building breaker configs from models.yaml."""
+    
+    def test_from_dict(self):
+        """Known keys should be read and the mode parsed."""
+        config = CircuitBreakerConfig.from_dict({
+            "failure_threshold": 3,
+            "mode": "rate",
+            "failure_rate_threshold": 0.3,
+            "models": {"ignored": {}},
+        })
+        
+        assert config.failure_threshold == 3
+        assert config.mode == CircuitMode.RATE
+        assert config.failure_rate_threshold == 0.3
+        assert config.minimum_calls == CircuitBreakerConfig().minimum_calls
+    
+    @pytest.mark.asyncio
+    async def test_registry_per_model_overrides(self):
+        """Per-model entries should override the section defaults."""
+        registry = CircuitBreakerRegistry.from_dict({
+            "mode": "rate",
+            "minimum_calls": 50,
+            "models": {"deepseek-v3": {"failure_rate_threshold": 0.3}},
+        })
+        
+        tuned = await registry.get("deepseek-v3")
+        default = await registry.get("gpt-4o")
+        
+        assert tuned.config.failure_rate_threshold == 0.3
+        assert tuned.config.minimum_calls == 50
+        assert tuned.config.mode == CircuitMode.RATE
+        assert default.config.failure_rate_threshold == 0.5
@@ -0,0 +1,212 @@
+"""
+Tests for CF-X Router Request Scheduler Module.
+"""
+
+import asyncio
+
+import pytest
+
+from cfx.scheduler import RequestClass, RequestScheduler, SchedulerConfig
+
+# =============================================================================
+# Test Fixtures
+# =============================================================================
+
+@pytest.fixture
+def config() -> SchedulerConfig:
+    """Create test configuration with a single dispatch slot."""
+    return SchedulerConfig(
+        enabled=True,
+        max_concurrent=1,
+        max_queue_depth=100,
+        max_wait=5.0,
+        stage_weights={"plan": 4.0, "code": 4.0, "review": 1.0},
+        mode_weights={},
+    )
+
+
+@pytest.fixture
+def scheduler(config: SchedulerConfig) -> RequestScheduler:
+    """Create test scheduler."""
+    return RequestScheduler(config)
+
+
+async def drain(scheduler: RequestScheduler, holder: RequestClass, tasks: list):
+    """Release the held slot and let every queued request run to completion."""
+    scheduler.release(holder)
+    await asyncio.gather(*tasks)
+
+
+# =============================================================================
+# Unit Tests
+# =============================================================================
+
+class TestSchedulerConfig:
+    """Tests for SchedulerConfig."""
+    
+    def test_defaults(self):
+        """Scheduler should be disabled by default."""
+        config = SchedulerConfig()
+        
+        assert config.enabled is False
+        assert config.stage_weights["plan"] > config.stage_weights["review"]
+    
+    def test_from_dict(self):
+        """Nested weights and budgets should be read per dimension."""
+        config = SchedulerConfig.from_dict({
+            "enabled": True,
+            "max_concurrent": 8,
+            "weights": {"plan": {"pro": 3}},
+            "budgets": {"stage": {"review": 2}},
+        })
+        
+        assert config.enabled is True
+        assert config.max_concurrent == 8
+        assert config.plan_weights == {"pro": 3}
+        assert config.stage_budgets == {"review": 2}
+        # Unspecified weights keep their defaults
+        assert config.stage_weights == SchedulerConfig().stage_weights
+
+
+class TestRequestScheduler:
+    """Unit tests for RequestScheduler."""
+    
+    @pytest.mark.asyncio
+    async def test_immediate_admission(self, scheduler: RequestScheduler):
+        """Requests should pass straight through while capacity is free."""
+        slot = await scheduler.acquire("code", plan="pro", streaming=True)
+        
+        assert slot == RequestClass("code", "pro", "stream")
+        assert scheduler.get_stats()["in_flight"] == 1
+        
+        scheduler.release(slot)
+        assert scheduler.get_stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_weighted_share(self, scheduler: RequestScheduler):
+        """A backlogged heavy class should get proportionally more dispatches."""
+        holder = await scheduler.acquire("code")
+        order = []
+        
+        async def request(stage: str):
+            slot = await scheduler.acquire(stage)
+            order.append(stage)
+            await asyncio.sleep(0)
+            scheduler.release(slot)
+        
+        tasks = [asyncio.create_task(request("review")) for _ in range(8)]
+        tasks += [asyncio.create_task(request("plan")) for _ in range(8)]
+        await asyncio.sleep(0)
+        
+        await drain(scheduler, holder, tasks)
+        
+        # Plan (weight 4) gets ~4 dispatches per review (weight 1) dispatch
+        assert order[:5].count("plan") == 4
+        assert order[:10].count("review") == 2
+    
+    @pytest.mark.asyncio
+    async def test_fifo_within_class(self, scheduler: RequestScheduler):
+        """Requests of one class should dispatch in arrival order."""
+        holder = await scheduler.acquire("code")
+        order = []
+        
+        async def request(n: int):
+            slot = await scheduler.acquire("code")
+            order.append(n)
+            scheduler.release(slot)
+        
+        tasks = []
+        for n in range(5):
+            tasks.append(asyncio.create_task(request(n)))
+            await asyncio.sleep(0)
+        
+        await drain(scheduler, holder, tasks)
+        
+        assert order == [0, 1, 2, 3, 4]
+    
+    @pytest.mark.asyncio
+    async def test_class_budget(self):
+        """A class at its budget should queue while others proceed."""
+        scheduler = RequestScheduler(SchedulerConfig(
+            max_concurrent=10,
+            stage_budgets={"review": 1},
+        ))
+        review = await scheduler.acquire("review")
+        
+        waiter = asyncio.create_task(scheduler.acquire("review"))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        
+        # Other stages are unaffected by the review budget
+        assert await scheduler.acquire("code") is not None
+        
+        scheduler.release(review)
+        assert await waiter == RequestClass("review", "default", "non_stream")
+    
+    @pytest.mark.asyncio
+    async def test_queue_full_rejects(self):
+        """Requests beyond max_queue_depth should be rejected at once."""
+        scheduler = RequestScheduler(SchedulerConfig(max_concurrent=1, max_queue_depth=1))
+        holder = await scheduler.acquire("code")
+        waiter = asyncio.create_task(scheduler.acquire("code"))
+        await asyncio.sleep(0)
+        
+        assert await scheduler.acquire("code") is None
+        
+        stats = scheduler.get_stats()
+        assert stats["queued"] == 1
+        assert stats["classes"]["code/default/non_stream"]["rejected"] == 1
+        
+        scheduler.release(holder)
+        await waiter
+    
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        """A request should give up after max_wait without leaking its place."""
+        scheduler = RequestScheduler(SchedulerConfig(max_concurrent=1, max_wait=0.01))
+        holder = await scheduler.acquire("code")
+        
+        assert await scheduler.acquire("code") is None
+        
+        stats = scheduler.get_stats()
+        assert stats["queued"] == 0
+        assert stats["classes"]["code/default/non_stream"]["timeouts"] == 1
+        assert stats["classes"]["code/default/non_stream"]["queue_wait_max_ms"] >= 10
+        
+        scheduler.release(holder)
+        assert scheduler.get_stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_releases_nothing(self, scheduler: RequestScheduler):
+        """Cancelling a queued request should not consume a slot."""
+        holder = await scheduler.acquire("code")
+        waiter = asyncio.create_task(scheduler.acquire("code"))
+        await asyncio.sleep(0)
+        
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release(holder)
+        
+        stats = scheduler.get_stats()
+        assert stats["in_flight"] == 0
+        assert stats["queued"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_weight_combines_dimensions(self):
+        """Class weight should be the product of its dimension weights."""
+        scheduler = RequestScheduler(SchedulerConfig(
+            stage_weights={"code": 4.0},
+            plan_weights={"pro": 3.0},
+            mode_weights={"stream": 2.0},
+        ))
+        
+        assert scheduler.weight(scheduler.classify("code", "pro", True)) == 24.0
+        assert scheduler.weight(scheduler.classify("review", None, False)) == 1.0
+    
+    @pytest.mark.asyncio
+    async def test_release_unknown_class_ignored(self, scheduler: RequestScheduler):
+        """Releasing a class with nothing in flight should be a no-op."""
+        scheduler.release(RequestClass("code", "default", "stream"))
+        
+        assert scheduler.get_stats()["in_flight"] == 0
@@ -0,0 +1,257 @@
+"""
+Tests for CF-X Router Upstream Balancing Module.
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+
+from cfx.litellm_client import (
+    CompletionRequest,
+    LiteLLMClient,
+    LiteLLMConfig,
+    LiteLLMUnavailableError,
+)
+from cfx.upstreams import BalancerConfig, PoolMonitor, Upstream, UpstreamBalancer
+
+# =============================================================================
+# Test Fixtures
+# =============================================================================
+
+@pytest.fixture
+def config() -> BalancerConfig:
+    """Create test configuration ejecting after two failures."""
+    return BalancerConfig(eject_after_failures=2, eject_duration=30.0, latency_ewma=0.5)
+
+
+@pytest.fixture
+def balancer(config: BalancerConfig) -> UpstreamBalancer:
+    """Create balancer over two replicas."""
+    return UpstreamBalancer(["http://proxy-a:4000", "http://proxy-b:4000"], config)
+
+
+def http_client(status_code: int = 200, error: Exception = None) -> AsyncMock:
+    """Mock httpx client answering every POST the same way."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = {}
+    response.json.return_value = {"id": "chatcmpl-123", "choices": []}
+    
+    client = AsyncMock()
+    client.is_closed = False
+    if error is not None:
+        client.post.side_effect = error
+    else:
+        client.post.return_value = response
+    return client
+
+
+# =============================================================================
+# Unit Tests
+# =============================================================================
+
+class TestPoolMonitor:
+    """Tests for connection pool wait tracking."""
+    
+    @pytest.mark.asyncio
+    async def test_wait_measured_until_first_connection_event(self):
+        """A request should count as waiting until httpcore reports a connection."""
+        monitor = PoolMonitor()
+        
+        with monitor.track() as tracked:
+            assert monitor.get_stats()["waiting"] == 1
+            await tracked.trace("connection.connect_tcp.started", {})
+            await tracked.trace("http11.send_request_headers.started", {})
+            assert monitor.get_stats()["waiting"] == 0
+            assert monitor.get_stats()["requests_in_flight"] == 1
+        
+        stats = monitor.get_stats()
+        assert stats["requests_in_flight"] == 0
+        assert monitor.acquired == 1
+        assert stats["peak_waiting"] == 1
+    
+    def test_pool_timeout_counted(self):
+        """Requests giving up on the pool should be counted."""
+        monitor = PoolMonitor()
+        
+        with pytest.raises(httpx.PoolTimeout):
+            with monitor.track():
+                raise httpx.PoolTimeout("no connection")
+        
+        stats = monitor.get_stats()
+        assert stats["pool_timeouts"] == 1
+        assert stats["waiting"] == 0
+        assert stats["requests_in_flight"] == 0
+
+
+class TestUpstream:
+    """Tests for per-replica health and latency tracking."""
+    
+    def test_latency_ewma(self, config: BalancerConfig):
+        """Latency should be an exponentially weighted average."""
+        upstream = Upstream("http://proxy-a:4000", config)
+        
+        upstream.record_success(1.0)
+        upstream.record_success(3.0)
+        
+        assert upstream.latency == pytest.approx(2.0)
+        assert upstream.get_stats()["latency_ms"] == 2000.0
+    
+    def test_ejected_after_consecutive_failures(self, config: BalancerConfig):
+        """Consecutive failures should eject the replica for eject_duration."""
+        upstream = Upstream("http://proxy-a:4000", config)
+        
+        upstream.record_failure()
+        assert not upstream.is_ejected()
+        upstream.record_failure()
+        
+        assert upstream.is_ejected()
+        assert not upstream.is_ejected(upstream.ejected_until)
+        assert upstream.get_stats()["ejections"] == 1
+    
+    def test_success_resets_failures(self, config: BalancerConfig):
+        """A success between failures should prevent ejection."""
+        upstream = Upstream("http://proxy-a:4000", config)
+        
+        upstream.record_failure()
+        upstream.record_success(0.1)
+        upstream.record_failure()
+        
+        assert not upstream.is_ejected()
+
+
+class TestUpstreamBalancer:
+    """Tests for power-of-two-choices selection."""
+    
+    def test_requires_upstream(self, config: BalancerConfig):
+        """An empty replica list should be rejected."""
+        with pytest.raises(ValueError):
+            UpstreamBalancer([], config)
+    
+    def test_prefers_less_loaded(self, balancer: UpstreamBalancer):
+        """The replica with fewer in-flight requests should be picked."""
+        busy, idle = balancer.upstreams
+        for upstream in balancer.upstreams:
+            upstream.record_success(1.0)
+        busy.pool.in_flight = 5
+        
+        assert all(balancer.pick() is idle for _ in range(20))
+    
+    def test_prefers_faster(self, balancer: UpstreamBalancer):
+        """At equal load the replica with lower latency should be picked."""
+        slow, fast = balancer.upstreams
+        slow.record_success(5.0)
+        fast.record_success(0.5)
+        
+        assert all(balancer.pick() is fast for _ in range(20))
+    
+    def test_excludes_tried(self, balancer: UpstreamBalancer):
+        """Retries should go to a replica not yet tried."""
+        first, second = balancer.upstreams
+        
+        assert balancer.pick(exclude=[first]) is second
+        # With every replica tried, any healthy one may be reused
+        assert balancer.pick(exclude=[first, second]) in balancer.upstreams
+    
+    def test_skips_ejected(self, balancer: UpstreamBalancer):
+        """Ejected replicas should get no traffic while others are healthy."""
+        sick, healthy = balancer.upstreams
+        sick.record_failure()
+        sick.record_failure()
+        
+        assert all(balancer.pick() is healthy for _ in range(20))
+        # A healthy replica is reused rather than retrying on an ejected one
+        assert balancer.pick(exclude=[healthy]) is healthy
+    
+    def test_all_ejected_uses_all(self, balancer: UpstreamBalancer):
+        """With every replica ejected, traffic should still flow."""
+        for upstream in balancer.upstreams:
+            upstream.record_failure()
+            upstream.record_failure()
+        
+        assert balancer.pick() in balancer.upstreams
+
+
+class TestClientBalancing:
+    """Tests for LiteLLMClient across several replicas."""
+    
+    @pytest.fixture
+    def client(self) -> LiteLLMClient:
+        """Client over two replicas, ejecting after two failures."""
+        return LiteLLMClient(LiteLLMConfig(
+            base_url="http://proxy-a:4000",
+            upstreams=["http://proxy-a:4000", "http://proxy-b:4000"],
+            max_retries=1,
+            balancer=BalancerConfig(eject_after_failures=2),
+        ))
+    
+    @pytest.fixture
+    def request_(self) -> CompletionRequest:
+        """Create sample completion request."""
+        return CompletionRequest(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+    
+    def test_single_url_default(self):
+        """Without upstreams the base URL should be the only replica."""
+        client = LiteLLMClient(LiteLLMConfig(base_url="http://litellm:4000"))
+        
+        assert [u["url"] for u in client.get_stats()["upstreams"]] == ["http://litellm:4000"]
+    
+    @pytest.mark.asyncio
+    async def test_retry_goes_to_other_replica(
+        self, client: LiteLLMClient, request_: CompletionRequest
+    ):
+        """A connection failure should be retried on the other replica."""
+        down, up = client._balancer.upstreams
+        down.client = http_client(error=httpx.ConnectError("refused"))
+        up.client = http_client()
+        up.pool.in_flight = 100  # Steer first attempts to the dead replica
+        
+        with patch("cfx.litellm_client.asyncio.sleep", new_callable=AsyncMock):
+            for _ in range(3):
+                await client.complete(request_)
+        
+        assert up.client.post.call_count == 3
+        # The dead replica was ejected after two failures and then skipped
+        assert down.client.post.call_count == 2
+        assert down.is_ejected()
+    
+    @pytest.mark.asyncio
+    async def test_gateway_errors_eject(
+        self, client: LiteLLMClient, request_: CompletionRequest
+    ):
+        """Repeated 502s from a replica should eject it."""
+        sick, healthy = client._balancer.upstreams
+        sick.client = http_client(status_code=502)
+        healthy.client = http_client()
+        healthy.pool.in_flight = 100  # Steer the first picks to the sick replica
+        
+        with patch("cfx.litellm_client.asyncio.sleep", new_callable=AsyncMock):
+            await client.complete(request_)
+            await client.complete(request_)
+        
+        assert sick.is_ejected()
+        assert sick.client.post.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_all_replicas_down(self, client: LiteLLMClient, request_: CompletionRequest):
+        """With every replica refusing connections the call should fail."""
+        for upstream in client._balancer.upstreams:
+            upstream.client = http_client(error=httpx.ConnectError("refused"))
+        
+        with patch("cfx.litellm_client.asyncio.sleep", new_callable=AsyncMock):
+            with pytest.raises(LiteLLMUnavailableError):
+                await client.complete(request_)
+        
+        assert all(u.client.post.call_count == 1 for u in client._balancer.upstreams)
+    
+    @pytest.mark.asyncio
+    async def test_close_all(self, client: LiteLLMClient):
+        """close() should close every replica's client."""
+        clients = [http_client(), http_client()]
+        for upstream, mock in zip(client._balancer.upstreams, clients):
+            upstream.client = mock
+        
+        await client.close()
+        
+        assert all(mock.aclose.await_count == 1 for mock in clients)